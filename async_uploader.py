@@ -0,0 +1,633 @@
+import os
+import asyncio
+import hashlib
+from itertools import islice
+
+import httpx
+from notion_client import AsyncClient
+
+from main import NotionUploader, UploadStatus, console
+from block_diff import index_blocks, diff_blocks, block_update_payload
+from link_resolver import required_child_ids
+from media_upload import NotionFileBackend
+from page_checkpoint import PageCheckpoint
+from payload_limits import MAX_CHILDREN, batch_blocks, count_blocks
+from transformer import iter_notion_blocks
+from utils import hash_lines, hash_markdown_file
+
+
+class AsyncNotionUploader(NotionUploader):
+    """基于 AsyncClient 的上传器，选项和日志格式与 NotionUploader 相同
+
+    目录遍历、文件读取、Markdown 转换（包括转换进程池）、增量同步的变化判断和日志写入在线程中执行，不阻塞事件循环；
+    所有请求共用 AsyncClient 的 HTTP 连接池，同时进行的请求数由 max_workers 限制。
+    本地图片由 MediaUploader 的线程通过单独的同步客户端上传，请求同样经过 RequestScheduler 限速。
+    """
+
+    def __init__(self, auth_token, options=None, logs_file="upload_logs.json", error_file="upload_errors.json",
+                 media_cache_file="media_cache.jsonl", conversion_cache_file="conversion_cache.db"):
+        # 图片上传使用的同步客户端，在 create_media_backend 中创建
+        self._auth_token = auth_token
+        self.media_notion = None
+        super().__init__(auth_token, options, logs_file, error_file, media_cache_file, conversion_cache_file)
+        self._semaphore = None
+
+    def create_client(self, auth_token):
+        """创建异步 Notion 客户端，所有请求共用同一个连接池"""
+        client = httpx.AsyncClient(
+            transport=self.http_config.create_transport(asynchronous=True),
+            event_hooks=self.http_event_hooks(asynchronous=True)
+        )
+        return AsyncClient(client=client, **self.client_options(auth_token))
+
+    def create_media_backend(self):
+        """图片在 MediaUploader 的线程中上传，Notion 方式需要同步客户端"""
+        if self.options["media_backend"] == "notion":
+            self.media_notion = NotionUploader.create_client(self, self._auth_token)
+            return NotionFileBackend(self.media_notion, self.scheduler)
+        return super().create_media_backend()
+
+    def close_client(self):
+        # 异步连接池已在 aclose 中关闭
+        if self.media_notion is not None:
+            self.media_notion.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.aclose()
+
+    async def aclose(self):
+        """关闭共用的 HTTP 连接池，并写出尚未落盘的日志"""
+        await self.notion.aclose()
+        await asyncio.to_thread(self.close)
+
+    def get_semaphore(self):
+        # Semaphore 需要在事件循环中创建
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(max(1, self.options["max_workers"]))
+        return self._semaphore
+
+    async def upload_folder_to_notion(self, folder_path, parent_page_id):
+        """上传文件夹到Notion，之后处理跨文件链接的第二遍"""
+        await asyncio.to_thread(self.scan_source_tree, folder_path)
+        with self.report_progress(folder_path):
+            await self.upload_folder_items(folder_path, parent_page_id)
+            await self.resolve_pending_links()
+
+    async def upload_folder_items(self, folder_path, parent_page_id):
+        """并发上传文件夹的直接子项"""
+
+        # 如果 if_add_empty_folder = False 且 当前文件夹为空，跳过
+        if not self.options["if_add_empty_folder"] and await asyncio.to_thread(self.is_empty_folder, folder_path):
+            console.print(f"【跳过】【空文件夹】{folder_path}", style="blue")
+            self.metrics.increment("items", type="folder", result="skipped")
+            return
+
+        folder_entry = await asyncio.to_thread(self.get_manifest_entry, folder_path)
+        if self.pipeline is not None:
+            await asyncio.to_thread(self.prefetch_conversions, folder_entry.children, parent_page_id)
+        await asyncio.gather(*(
+            self.upload_item(item_path, parent_page_id) for item_path in folder_entry.children
+        ))
+
+    async def upload_item(self, item_path, parent_page_id):
+        """上传单个文件或文件夹，见 NotionUploader.upload_item"""
+        item = os.path.basename(item_path)
+        item_hash = self.generate_item_hash(item_path, parent_page_id)
+        is_dir = (await asyncio.to_thread(self.get_manifest_entry, item_path)).is_dir
+
+        # 如果 已经上传过 则跳过
+        page_id = await asyncio.to_thread(self.get_uploaded_page_id, item_hash)
+        if page_id is not None:
+            if is_dir:
+                console.print(f"【跳过】【文件夹】{item_path}", style="yellow")
+                self.metrics.increment("items", type="folder", result="skipped")
+                # 递归处理子文件夹
+                await self.upload_folder_items(item_path, page_id)
+            elif (self.options["incremental_sync"] and item.endswith(".md")
+                  and await asyncio.to_thread(self.is_file_changed, item_path, item_hash)):
+                # 内容有变化，原地更新页面
+                await self.upload_markdown_item(item_path, item, item_hash, parent_page_id, page_id)
+            else:
+                if item.endswith(".md"):
+                    # 上次没能解析的链接在这次的第二遍中重试
+                    latest_log = await asyncio.to_thread(self.get_latest_log, item_hash)
+                    self.register_page(item_path, page_id, item_hash, latest_log.get("links"))
+                console.print(f"【跳过】【文件】{item_path}", style="yellow")
+                self.metrics.increment("items", type="file", result="skipped")
+            return
+
+        if is_dir:
+            await self.upload_directory_item(item_path, item, item_hash, parent_page_id)
+        elif item.endswith(".md"):
+            try:
+                page_id = None
+                latest_log = await asyncio.to_thread(self.get_latest_log, item_hash)
+                if latest_log and PageCheckpoint.from_log(latest_log, item_hash) is not None:
+                    # 上次分块上传到一半中断：继续写入已创建的页面，不重新创建
+                    page_id = latest_log["page_id"]
+                elif self.options["incremental_sync"]:
+                    # 上次更新页面失败时，继续更新原页面，避免重复创建
+                    page_id = await asyncio.to_thread(self.get_existing_page_id, item_hash)
+                    if page_id is None:
+                        renamed = await asyncio.to_thread(self.find_renamed_page, item_path, parent_page_id)
+                        if renamed:
+                            await self.rename_markdown_item(item_path, item, item_hash, parent_page_id, *renamed)
+                            return
+                await self.upload_markdown_item(item_path, item, item_hash, parent_page_id, page_id)
+            finally:
+                if self.pipeline is not None:
+                    # 重命名、出错等没有取走预取结果的情况，释放占用的名额
+                    self.pipeline.discard(item_path)
+
+    async def upload_directory_item(self, item_path, item, item_hash, parent_page_id):
+        """在Notion中创建页面表示文件夹，然后上传其子项"""
+        # 如果 if_add_empty_folder = False 且 当前文件夹为空，跳过
+        if not self.options["if_add_empty_folder"] and await asyncio.to_thread(self.is_empty_folder, item_path):
+            console.print(f"【跳过】【空文件夹】{item_path}", style="blue")
+            self.metrics.increment("items", type="folder", result="skipped")
+            return
+
+        try:
+            async with self.get_semaphore():
+                log_entry = self.create_log_entry(
+                    item_path, parent_page_id, None, item, UploadStatus.IN_PROGRESS
+                )
+                await asyncio.to_thread(self.add_log_entry, item_hash, log_entry)
+
+                new_page = await self.scheduler.acall(
+                    self.notion.pages.create,
+                    parent={"page_id": parent_page_id},
+                    properties={"title": [{"text": {"content": item}}]}
+                )
+
+                log_entry = self.create_log_entry(
+                    item_path, parent_page_id, new_page["id"], item, UploadStatus.SUCCESS
+                )
+                await asyncio.to_thread(self.add_log_entry, item_hash, log_entry)
+                console.print(f"【成功】【文件夹】{item_path}", style="green")
+                self.metrics.increment("items", type="folder", result="success")
+
+        except Exception as e:
+            await asyncio.to_thread(
+                self.handle_upload_error, item_path, item, item_hash, parent_page_id, e, "文件夹"
+            )
+            return
+
+        # 释放信号量后再处理子项，避免父任务占用名额导致死锁
+        await self.upload_folder_items(item_path, new_page["id"])
+
+    async def rename_markdown_item(self, item_path, item, item_hash, parent_page_id, old_hash, old_entry):
+        """文件被重命名时只修改页面标题，见 NotionUploader.rename_markdown_item"""
+        try:
+            page_id = old_entry["page_id"]
+            async with self.get_semaphore():
+                await self.scheduler.acall(
+                    self.notion.pages.update,
+                    page_id=page_id,
+                    properties={"title": [{"text": {"content": item}}]}
+                )
+            _, file_info = await asyncio.to_thread(self.read_markdown_file, item_path)
+            await asyncio.to_thread(self.add_log_entry, item_hash, self.create_log_entry(
+                item_path, parent_page_id, page_id, item, UploadStatus.SUCCESS,
+                {**file_info, **self.page_content_fields(old_entry)}
+            ))
+            self.register_page(item_path, page_id, item_hash, old_entry.get("links"))
+            await asyncio.to_thread(self.add_log_entry, old_hash, self.create_log_entry(
+                old_entry["path"], parent_page_id, page_id, old_entry["title"], UploadStatus.MOVED
+            ))
+            console.print(f"【重命名】【文件】{old_entry['path']} -> {item_path}", style="green")
+            self.metrics.increment("items", type="file", result="renamed")
+        except Exception as e:
+            await asyncio.to_thread(
+                self.handle_upload_error, item_path, item, item_hash, parent_page_id, e, "文件"
+            )
+
+    async def upload_markdown_item(self, item_path, item, item_hash, parent_page_id, page_id=None):
+        """把单个 Markdown 文件上传为 Notion 页面，page_id 不为空时原地更新该页面（或从检查点继续上传）"""
+        notion_objects = None
+        file_info = None
+        # 上次成功上传时记录的块索引，用于按块更新页面
+        old_blocks = None
+        # 上次分块上传中断时的进度
+        checkpoint = None
+        previous_log = await asyncio.to_thread(self.get_latest_log, item_hash) if page_id else None
+        if previous_log and previous_log["status"] == UploadStatus.SUCCESS.value:
+            old_blocks = previous_log.get("blocks")
+        elif previous_log:
+            checkpoint = PageCheckpoint.from_log(previous_log, item_hash)
+        try:
+            # 同时处理的文件数受信号量限制，避免一次性读入和转换过多文件
+            async with self.get_semaphore():
+                log_entry = self.create_log_entry(
+                    item_path, parent_page_id, page_id, item, UploadStatus.IN_PROGRESS,
+                    {"checkpoint": checkpoint.to_dict()} if checkpoint else None
+                )
+                await asyncio.to_thread(self.add_log_entry, item_hash, log_entry)
+
+                if (page_id is None or checkpoint is not None) and await asyncio.to_thread(
+                        self.is_large_markdown_file, item_path):
+                    # 大文件按段转换，边转换边上传
+                    if checkpoint is None:
+                        checkpoint = PageCheckpoint(item_path, item, item_hash, parent_page_id)
+                    resumed = checkpoint.page_id is not None
+                    await self.restart_checkpoint(checkpoint, await asyncio.to_thread(hash_markdown_file, item_path))
+                    page_id, file_info, blocks, media_ids, links = await self.stream_markdown_page(item_path, checkpoint)
+                    if page_id is None:
+                        console.print(f"【跳过】【空文件】{item_path}", style="blue")
+                        self.metrics.increment("items", type="file", result="skipped")
+                        return
+                    if self.media is not None:
+                        await asyncio.to_thread(self.media.mark_attached, media_ids)
+                    log_entry = self.create_log_entry(
+                        item_path, parent_page_id, page_id, item, UploadStatus.SUCCESS,
+                        {**file_info, "blocks": blocks, **({"links": links} if links else {})}
+                    )
+                    await asyncio.to_thread(self.add_log_entry, item_hash, log_entry)
+                    self.register_page(item_path, page_id, item_hash, links)
+                    console.print(f"【{'续传' if resumed else '成功'}】【文件】{item_path}", style="green")
+                    self.metrics.increment("items", type="file", result="success")
+                    return
+
+                # 读取并转换Markdown文件内容（开启 conversion_workers 时在进程池中转换）
+                is_empty, file_info, notion_objects = await asyncio.to_thread(self.convert_markdown_item, item_path)
+
+                # 如果 if_add_empty_page = False 且 当前文件为空，跳过
+                if not self.options["if_add_empty_page"] and is_empty:
+                    console.print(f"【跳过】【空文件】{item_path}", style="blue")
+                    self.metrics.increment("items", type="file", result="skipped")
+                    return
+
+                media_ids = await asyncio.to_thread(self.resolve_media, notion_objects, item_path)
+                links = self.collect_links(notion_objects)
+                sent_objects = notion_objects
+                if page_id is None:
+                    checkpoint = PageCheckpoint(item_path, item, item_hash, parent_page_id, file_info["content_hash"])
+                    page_id = (await self.create_markdown_page(parent_page_id, item, notion_objects, checkpoint))["id"]
+                    blocks = index_blocks(notion_objects)
+                    action, result = "成功", "success"
+                elif checkpoint is not None:
+                    await self.restart_checkpoint(checkpoint, file_info["content_hash"])
+                    sent_objects = notion_objects[checkpoint.blocks:]
+                    await self.resume_page_content(checkpoint, notion_objects)
+                    blocks = index_blocks(notion_objects)
+                    action, result = "续传", "success"
+                else:
+                    blocks = await self.update_page_content(page_id, notion_objects, old_blocks)
+                    action, result = "更新", "updated"
+                if self.media is not None:
+                    await asyncio.to_thread(self.media.mark_attached, media_ids)
+
+                log_entry = self.create_log_entry(
+                    item_path, parent_page_id, page_id, item, UploadStatus.SUCCESS,
+                    {**file_info, "blocks": blocks, **({"links": links} if links else {})}
+                )
+                await asyncio.to_thread(self.add_log_entry, item_hash, log_entry)
+                self.register_page(item_path, page_id, item_hash, links)
+                console.print(f"【{action}】【文件】{item_path}", style="green")
+                self.metrics.increment("items", type="file", result=result)
+                self.metrics.increment("blocks", count_blocks(sent_objects))
+
+        except Exception as e:
+            if checkpoint is not None and checkpoint.page_id is not None:
+                # 页面已创建：保留页面ID和已发送的进度，下次从这里继续
+                page_id, checkpoint = checkpoint.page_id, checkpoint.to_dict()
+            else:
+                checkpoint = None
+            await asyncio.to_thread(
+                self.handle_upload_error, item_path, item, item_hash, parent_page_id, e, "文件", notion_objects,
+                page_id, checkpoint, file_info["content_hash"] if file_info and notion_objects is not None else None
+            )
+
+    async def restart_checkpoint(self, checkpoint, content_hash):
+        """见 NotionUploader.restart_checkpoint"""
+        if checkpoint.content_hash == content_hash:
+            return
+        if checkpoint.page_id is not None:
+            await self.clear_page(checkpoint.page_id)
+        checkpoint.restart(content_hash)
+        if checkpoint.page_id is not None:
+            await asyncio.to_thread(self.save_checkpoint, checkpoint)
+
+    async def finish_deferred_batch(self, checkpoint, batch_objects):
+        """见 NotionUploader.finish_deferred_batch"""
+        _, deferred = batch_blocks(batch_objects)[0]
+        await self.append_deferred_children(checkpoint.deferred_ids, deferred, checkpoint)
+        checkpoint.batch_sent(len(batch_objects))
+        await asyncio.to_thread(self.save_checkpoint, checkpoint)
+
+    async def resume_page_content(self, checkpoint, notion_objects):
+        """见 NotionUploader.resume_page_content"""
+        if checkpoint.deferred_ids:
+            await self.finish_deferred_batch(
+                checkpoint, notion_objects[checkpoint.blocks:checkpoint.blocks + len(checkpoint.deferred_ids)]
+            )
+        await self.append_batches(
+            checkpoint.page_id, batch_blocks(notion_objects[checkpoint.blocks:]), checkpoint=checkpoint
+        )
+        self.metrics.increment("checkpoint_resumes")
+
+    async def create_markdown_page(self, parent_page_id, title, notion_objects, checkpoint=None):
+        """创建页面并写入转换后的 Notion 块"""
+        return await self.create_page_with_batches(parent_page_id, title, batch_blocks(notion_objects), checkpoint)
+
+    async def create_page_with_batches(self, parent_page_id, title, batches, checkpoint=None):
+        """用 batch_blocks 打包好的第一批块创建页面，其余批次按顺序追加
+
+        checkpoint 不为空时，页面创建后以及每发送完一批块都记录进度。
+        """
+        payload, deferred = batches[0] if batches else ([], [])
+        new_page = await self.scheduler.acall(
+            self.notion.pages.create,
+            parent={"page_id": parent_page_id},
+            properties={"title": [{"text": {"content": title}}]},
+            children=payload
+        )
+        if checkpoint is not None:
+            checkpoint.page_id = new_page["id"]
+        if deferred:
+            block_ids = await self.list_child_block_ids(new_page["id"])
+            if checkpoint is not None:
+                checkpoint.start_deferred(block_ids)
+                await asyncio.to_thread(self.save_checkpoint, checkpoint)
+            await self.append_deferred_children(block_ids, deferred, checkpoint)
+        if checkpoint is not None:
+            checkpoint.batch_sent(len(payload))
+            await asyncio.to_thread(self.save_checkpoint, checkpoint)
+        await self.append_batches(new_page["id"], batches[1:], checkpoint=checkpoint)
+        return new_page
+
+    async def stream_markdown_page(self, item_path, checkpoint):
+        """边读取边转换大文件，见 NotionUploader.stream_markdown_page
+
+        读取、转换和本地图片上传在线程中进行，每次转换出一批块后交回事件循环发送。
+        返回 (页面ID, 文件信息, 块索引, 用到的 file_upload ID, 待解析的链接)；文件为空且不添加空页面时页面ID为 None。
+        """
+        stat = await asyncio.to_thread(os.stat, item_path)
+        content_hash = hashlib.sha256()
+        blocks = []
+        pending = []
+        media_ids = []
+        links = []
+        block_count = 0
+        emitted = 0
+        # 检查点之前已经发送的块，以及已追加但子块没补写完的块
+        skipped = []
+        unfinished = []
+        sent_blocks = checkpoint.blocks
+        deferred_count = len(checkpoint.deferred_ids or [])
+        md_file = await asyncio.to_thread(open, item_path, "r", encoding="utf-8")
+        try:
+            notion_blocks = iter_notion_blocks(
+                hash_lines(md_file, content_hash),
+                local_images=self.options["upload_local_images"],
+                local_links=self.options["resolve_links"]
+            )
+            while True:
+                with self.metrics.phase("stream_convert"):
+                    chunk = await asyncio.to_thread(lambda: list(islice(notion_blocks, 2 * MAX_CHILDREN)))
+                if not chunk:
+                    break
+                for block in chunk:
+                    links.extend(self.collect_links([block], block_count))
+                    block_count += 1
+                    if block_count <= sent_blocks:
+                        skipped.append(block)
+                        if block_count == sent_blocks:
+                            media_ids.extend(await asyncio.to_thread(self.resolve_media, skipped, item_path))
+                            blocks.extend(index_blocks(skipped))
+                            skipped = []
+                        continue
+                    if len(unfinished) < deferred_count:
+                        unfinished.append(block)
+                        if len(unfinished) == deferred_count:
+                            media_ids.extend(await asyncio.to_thread(self.resolve_media, unfinished, item_path))
+                            blocks.extend(index_blocks(unfinished, checkpoint.deferred_ids))
+                            await self.finish_deferred_batch(checkpoint, unfinished)
+                        continue
+                    emitted += count_blocks([block])
+                    pending.append(block)
+                    if len(pending) < 2 * MAX_CHILDREN:
+                        continue
+                    media_ids.extend(await asyncio.to_thread(self.resolve_media, pending, item_path))
+                    # 最后一批可能还没装满，留到和后面的块一起打包
+                    sent = await self.send_stream_batches(checkpoint, pending, batch_blocks(pending)[:-1], blocks)
+                    pending = pending[sent:]
+        finally:
+            md_file.close()
+
+        media_ids.extend(await asyncio.to_thread(self.resolve_media, pending, item_path))
+        batches = batch_blocks(pending)
+        if checkpoint.page_id is None and not batches:
+            if not self.options["if_add_empty_page"]:
+                return None, None, None, [], []
+            batches = [([], [])]
+        await self.send_stream_batches(checkpoint, pending, batches, blocks)
+        if sent_blocks:
+            self.metrics.increment("checkpoint_resumes")
+        self.metrics.increment("blocks", emitted)
+
+        file_info = {
+            "content_hash": content_hash.hexdigest(),
+            "size": stat.st_size,
+            "mtime": stat.st_mtime
+        }
+        return checkpoint.page_id, file_info, blocks, media_ids, links
+
+    async def send_stream_batches(self, checkpoint, notion_objects, batches, blocks):
+        """见 NotionUploader.send_stream_batches"""
+        sent = 0
+        for batch in batches:
+            batch_objects = notion_objects[sent:sent + len(batch[0])]
+            sent += len(batch_objects)
+            if checkpoint.page_id is None:
+                await self.create_page_with_batches(checkpoint.parent_page_id, checkpoint.title, [batch], checkpoint)
+                blocks.extend(index_blocks(batch_objects))
+            else:
+                block_ids = await self.append_batches(checkpoint.page_id, [batch], checkpoint=checkpoint)
+                blocks.extend(index_blocks(batch_objects, block_ids))
+        return sent
+
+    async def clear_page(self, page_id):
+        """删除页面的所有块"""
+        for block_id in await self.list_child_block_ids(page_id):
+            await self.scheduler.acall(self.notion.blocks.delete, block_id=block_id)
+
+    async def replace_page_content(self, page_id, notion_objects):
+        """删除页面原有的块，再写入新的块，返回新的块索引"""
+        await self.clear_page(page_id)
+        return index_blocks(notion_objects, await self.append_blocks(page_id, notion_objects))
+
+    async def update_page_content(self, page_id, notion_objects, old_blocks):
+        """见 NotionUploader.update_page_content"""
+        if not old_blocks or not self.options["block_diff"]:
+            return await self.replace_page_content(page_id, notion_objects)
+
+        if any(block[1] is None for block in old_blocks):
+            # 创建页面时不知道块ID，按顺序读取一次
+            block_ids = await self.list_child_block_ids(page_id)
+            if len(block_ids) != len(old_blocks):
+                # 页面在 Notion 中被修改过，无法对应，整页替换
+                return await self.replace_page_content(page_id, notion_objects)
+            old_blocks = [[block[0], block_id, *block[2:]] for block, block_id in zip(old_blocks, block_ids)]
+
+        operations = await asyncio.to_thread(diff_blocks, old_blocks, notion_objects)
+        return await self.patch_page_content(page_id, operations)
+
+    async def patch_page_content(self, page_id, operations):
+        """见 NotionUploader.patch_page_content"""
+        blocks = []
+        # 上一个保留下来的块，新块插入在它后面
+        previous_id = None
+        for operation in operations:
+            action, *args = operation
+            if action == "keep":
+                blocks.append(args[0])
+                previous_id = args[0][1]
+            elif action == "update":
+                old_block, new_block = args
+                await self.scheduler.acall(
+                    self.notion.blocks.update, block_id=old_block[1], **block_update_payload(new_block)
+                )
+                blocks.extend(index_blocks([new_block], [old_block[1]]))
+                previous_id = old_block[1]
+            elif action == "delete":
+                await self.scheduler.acall(self.notion.blocks.delete, block_id=args[0][1])
+            elif action == "insert":
+                new_blocks = args[0]
+                if previous_id is None:
+                    block_ids = await self.insert_blocks_at_start(page_id, new_blocks)
+                else:
+                    block_ids = await self.append_blocks(page_id, new_blocks, after=previous_id)
+                blocks.extend(index_blocks(new_blocks, block_ids))
+                previous_id = block_ids[-1]
+        return blocks
+
+    async def insert_blocks_at_start(self, page_id, notion_objects):
+        """在页面开头插入块（第一批用 position=start，后续批次接在其后）"""
+        batches = batch_blocks(notion_objects)
+        payload, deferred = batches[0]
+        response = await self.scheduler.acall(
+            self.notion.blocks.children.append,
+            block_id=page_id,
+            children=payload,
+            position={"type": "start"}
+        )
+        block_ids = [block["id"] for block in response["results"]]
+        await self.append_deferred_children(block_ids, deferred)
+        block_ids.extend(await self.append_batches(page_id, batches[1:], after=block_ids[-1]))
+        return block_ids
+
+    async def list_child_block_ids(self, block_id, limit=None):
+        """分页读取块的直接子块ID，limit 不为空时读到至少 limit 个就停止"""
+        block_ids = []
+        start_cursor = None
+        while True:
+            kwargs = {"block_id": block_id, "page_size": 100}
+            if start_cursor:
+                kwargs["start_cursor"] = start_cursor
+            response = await self.scheduler.acall(self.notion.blocks.children.list, **kwargs)
+            block_ids.extend(block["id"] for block in response["results"])
+            if not response.get("has_more") or (limit is not None and len(block_ids) >= limit):
+                return block_ids
+            start_cursor = response["next_cursor"]
+
+    async def append_blocks(self, page_id, notion_objects, after=None):
+        """分批追加块，after 为空时追加到页面末尾，返回新块的ID"""
+        return await self.append_batches(page_id, batch_blocks(notion_objects), after)
+
+    async def append_batches(self, page_id, batches, after=None, checkpoint=None):
+        """依次发送 batch_blocks 打包好的追加请求，返回新块的ID；checkpoint 不为空时每批发送完记录进度"""
+        block_ids = []
+        for payload, deferred in batches:
+            kwargs = {"block_id": page_id, "children": payload}
+            if after is not None:
+                kwargs["after"] = after
+            response = await self.scheduler.acall(self.notion.blocks.children.append, **kwargs)
+            batch_ids = [block["id"] for block in response["results"]]
+            if checkpoint is not None and deferred:
+                checkpoint.start_deferred(batch_ids)
+                await asyncio.to_thread(self.save_checkpoint, checkpoint)
+            await self.append_deferred_children(batch_ids, deferred, checkpoint)
+            if checkpoint is not None:
+                checkpoint.batch_sent(len(payload))
+                await asyncio.to_thread(self.save_checkpoint, checkpoint)
+            block_ids.extend(batch_ids)
+            after = block_ids[-1] if block_ids else after
+        return block_ids
+
+    async def append_deferred_children(self, block_ids, deferred, checkpoint=None):
+        """补写一次请求中放不下的子块，见 NotionUploader.append_deferred_children"""
+        child_ids = {}
+        for path, children in deferred[checkpoint.deferred_sent if checkpoint else 0:]:
+            block_id = block_ids[path[0]]
+            for index in path[1:]:
+                if block_id not in child_ids:
+                    child_ids[block_id] = await self.list_child_block_ids(block_id)
+                block_id = child_ids[block_id][index]
+            await self.append_blocks(block_id, children)
+            if checkpoint is not None:
+                checkpoint.deferred_item_sent()
+                await asyncio.to_thread(self.save_checkpoint, checkpoint)
+
+    async def resolve_pending_links(self):
+        """第二遍：改写跨文件链接，各页面并发处理，见 NotionUploader.resolve_pending_links"""
+        if self.link_resolver is None:
+            return
+        await asyncio.gather(*(
+            self.resolve_page_links(page_id, item_path, item_hash, links)
+            for page_id, (item_path, item_hash, links) in self.link_resolver.pop_pending()
+        ))
+
+    async def resolve_page_links(self, page_id, item_path, item_hash, links):
+        """见 NotionUploader.resolve_page_links"""
+        updates, remaining = self.link_resolver.plan_page(item_path, links)
+        if not updates:
+            return
+        try:
+            async with self.get_semaphore():
+                child_ids = {}
+                for parent, count in required_child_ids(block_path for block_path, _, _ in updates):
+                    block_id = page_id if not parent else child_ids[parent[:-1]][parent[-1]]
+                    child_ids[parent] = await self.list_child_block_ids(block_id, count)
+                for block_path, block_type, rich_text in updates:
+                    await self.scheduler.acall(
+                        self.notion.blocks.update,
+                        block_id=child_ids[tuple(block_path[:-1])][block_path[-1]],
+                        **{block_type: {"rich_text": rich_text}}
+                    )
+        except Exception as e:
+            # 页面内容已经上传成功，链接保留原文，下次运行时重试
+            console.print(f"【错误】【链接】{item_path}：{e}", style="red")
+            return
+
+        # 已解析的链接不再记录，只保留仍未解析的部分
+        log_entry = await asyncio.to_thread(self.get_latest_log, item_hash)
+        if log_entry and log_entry["page_id"] == page_id and log_entry["status"] == UploadStatus.SUCCESS.value:
+            log_entry = {key: value for key, value in log_entry.items() if key != "links"}
+            if remaining:
+                log_entry["links"] = remaining
+            await asyncio.to_thread(self.add_log_entry, item_hash, log_entry)
+        console.print(f"【链接】【文件】{item_path}", style="green")
+        self.metrics.increment("link_blocks_updated", len(updates))
+
+    async def retry_failed_uploads(self):
+        """重试失败的上传：只重新上传失败的项，全部并发进行，见 NotionUploader.retry_failed_uploads"""
+        groups = await asyncio.to_thread(self.collect_failed_items)
+        self.prepare_retry_payloads(groups)
+        try:
+            await asyncio.to_thread(
+                lambda: [self.scan_source_tree(path) for items in groups.values() for _, path in items]
+            )
+            for items in groups.values():
+                for _, path in items:
+                    console.print(f"【重试】{path}", style="yellow")
+            await asyncio.gather(*(
+                self.upload_item(path, parent_page_id)
+                for parent_page_id, items in groups.items() for _, path in items
+            ))
+            await self.resolve_pending_links()
+        finally:
+            self._retry_payloads = {}
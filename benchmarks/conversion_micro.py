@@ -0,0 +1,315 @@
+"""转换热点的微基准：整体转换 markdown_element_to_notion_object 以及各个组成部分
+
+在按参数生成的语料上运行（固定随机种子），语料分别改变文档大小、列表深度、表格大小和链接密度。
+每个测试先预热，再重复多轮，取每轮耗时的中位数，同时给出最小值和离散度（MAD / 中位数），
+吞吐量按输入的 UTF-8 字节（MB/s）和输出的块数（含子块，blocks/s）计算。
+
+组成部分单独计时：process_inline_content、transform_invalid_link_and_image、handleListItem、
+handleTable、handleFence 和 match_code_language。它们的输入 token 在计时之外解析，
+每轮重新解析一次（transform_invalid_link_and_image 会原地修改 token）。
+
+用 --json 保存结果，之后用 --compare 与之前（例如上一个提交）的结果比较：
+中位数变慢超过 --threshold 的项标记为 REGRESSION，此时退出码为 1。
+
+用法：
+    python benchmarks/conversion_micro.py [--corpora doc-small,links-dense] [--scale 1] [--repeat 7]
+    python benchmarks/conversion_micro.py --json before.json
+    python benchmarks/conversion_micro.py --compare before.json [--threshold 0.1]
+"""
+import gc
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from transformer import (  # noqa: E402
+    markdown_element_to_notion_object, get_markdown_parser, split_block_tokens, process_inline_content,
+    transform_invalid_link_and_image, handleListItem, handleTable, handleFence
+)
+from utils import match_code_language  # noqa: E402
+
+# 语料名 -> 生成参数；docs 为文档数，其余参数见 generate_document
+CORPORA = {
+    "doc-small": {"docs": 400, "paragraphs": 4, "lists": 1, "list_depth": 1, "list_items": 3, "tables": 0, "fences": 1},
+    "doc-large": {"docs": 4, "paragraphs": 1500, "lists": 150, "list_depth": 2, "list_items": 4, "tables": 20, "fences": 60},
+    "lists-shallow": {"docs": 40, "paragraphs": 2, "lists": 20, "list_depth": 1, "list_items": 8},
+    "lists-deep": {"docs": 40, "paragraphs": 2, "lists": 2, "list_depth": 6, "list_items": 2},
+    "tables-small": {"docs": 40, "paragraphs": 2, "tables": 10, "table_rows": 5, "table_cols": 3},
+    "tables-large": {"docs": 4, "paragraphs": 2, "tables": 5, "table_rows": 300, "table_cols": 10},
+    "links-sparse": {"docs": 100, "paragraphs": 20, "link_density": 0.02},
+    "links-dense": {"docs": 100, "paragraphs": 20, "link_density": 0.4},
+}
+
+WORDS = ["note", "idea", "todo", "meeting", "plan", "**bold**", "*italic*", "~~old~~", "`code`", "中文", "数据"]
+LINKS = [
+    "[site](https://example.com/page)",
+    "[docs](www.example.org/docs)",
+    # 不是合法 URL 的链接和相对路径的图片，由 transform_invalid_link_and_image 转为文本
+    "[local note](notes/other%20note.md)",
+    "[anchor](#heading)",
+    "![diagram](images/diagram.png)",
+    "![remote](https://example.com/a.png)",
+]
+LANGUAGES = ["python", "py", "js", "TypeScript", "c++", "sh", "yaml", "mermaid", "unknown-lang", ""]
+
+
+def generate_sentence(rng, link_density, length):
+    return " ".join(rng.choice(LINKS) if rng.random() < link_density else rng.choice(WORDS) for _ in range(length))
+
+
+def generate_list(rng, depth, items, link_density, level=0):
+    lines = []
+    for i in range(items):
+        marker = rng.choice(["- ", "- [ ] ", "- [x] ", f"{i + 1}. "]) if level else "- "
+        lines.append("    " * level + marker + generate_sentence(rng, link_density, rng.randint(3, 10)))
+        if level + 1 < depth:
+            lines.extend(generate_list(rng, depth, items, link_density, level + 1))
+    return lines
+
+
+def generate_table(rng, rows, cols, link_density):
+    lines = ["| " + " | ".join(f"col {c}" for c in range(cols)) + " |", "|" + "---|" * cols]
+    for _ in range(rows):
+        lines.append("| " + " | ".join(generate_sentence(rng, link_density, rng.randint(1, 4)) for _ in range(cols)) + " |")
+    return "\n".join(lines)
+
+
+def generate_fence(rng):
+    body = "\n".join(f"value_{i} = compute({i}, {rng.randint(0, 99)})" for i in range(rng.randint(3, 40)))
+    return f"```{rng.choice(LANGUAGES)}\n{body}\n```"
+
+
+def generate_document(rng, paragraphs=10, lists=0, list_depth=1, list_items=3, tables=0, table_rows=5,
+                      table_cols=3, fences=0, link_density=0.05):
+    """生成一篇文档：标题和段落之间按比例穿插列表、表格和代码块"""
+    parts = [f"# Document {rng.randint(0, 10 ** 6)}"]
+    extras = ["list"] * lists + ["table"] * tables + ["fence"] * fences
+    rng.shuffle(extras)
+    total = paragraphs + len(extras)
+    for i in range(total):
+        if extras and rng.random() < len(extras) / (total - i):
+            kind = extras.pop()
+            if kind == "list":
+                parts.append("\n".join(generate_list(rng, list_depth, list_items, link_density)))
+            elif kind == "table":
+                parts.append(generate_table(rng, table_rows, table_cols, link_density))
+            else:
+                parts.append(generate_fence(rng))
+        elif rng.random() < 0.1:
+            parts.append(f"## Section {i}")
+        else:
+            parts.append(generate_sentence(rng, link_density, rng.randint(10, 60)))
+    for _ in extras:
+        parts.append(generate_fence(rng))
+    return "\n\n".join(parts) + "\n"
+
+
+def generate_corpus(name, scale=1.0, seed=0):
+    params = dict(CORPORA[name])
+    docs = max(1, int(params.pop("docs") * scale))
+    rng = random.Random(f"{seed}-{name}")
+    return [generate_document(rng, **params) for _ in range(docs)]
+
+
+def count_blocks(blocks):
+    count = 0
+    for block in blocks:
+        count += 1
+        content = block.get(block["type"])
+        if isinstance(content, dict) and content.get("children"):
+            count += count_blocks(content["children"])
+    return count
+
+
+def inline_bytes(tokens):
+    return sum(len(token.content.encode("utf-8")) for token in tokens if token.type in ("inline", "fence"))
+
+
+def parse_groups(docs):
+    """解析全部文档，返回按块类型归类的 token 组"""
+    md = get_markdown_parser()
+    groups = {"inline": [], "bullet_list_open": [], "ordered_list_open": [], "table_open": [], "fence": []}
+    for doc in docs:
+        for block_data in split_block_tokens(md.parse(doc.replace(']::', ']:: '))):
+            block_type = block_data[0].type
+            if block_type in groups:
+                groups[block_type].append(block_data)
+            if block_type not in ("bullet_list_open", "ordered_list_open", "table_open"):
+                groups["inline"].extend(token for token in block_data if token.type == "inline")
+    return groups
+
+
+def build_cases(docs):
+    """返回 {名称: (准备输入的函数, 计时的函数)}；准备函数在计时之外执行，返回 (输入, 输入字节数)"""
+    def pipeline_inputs():
+        return docs, sum(len(doc.encode("utf-8")) for doc in docs)
+
+    def pipeline(inputs):
+        return sum(count_blocks(markdown_element_to_notion_object(doc)) for doc in inputs)
+
+    def group_inputs(key, flatten=False):
+        def prepare():
+            groups = parse_groups(docs)
+            if key == "lists":
+                items = groups["bullet_list_open"] + groups["ordered_list_open"]
+            else:
+                items = groups[key]
+            if flatten:
+                return items, inline_bytes(items)
+            return items, sum(inline_bytes(item) for item in items)
+        return prepare
+
+    def inline(tokens):
+        blocks = 0
+        for token in tokens:
+            _, children = process_inline_content(token)
+            blocks += len(children)
+        return blocks
+
+    def invalid_links(tokens):
+        for token in tokens:
+            transform_invalid_link_and_image(token)
+        return 0
+
+    def lists(block_data_list):
+        blocks = 0
+        for block_data in block_data_list:
+            list_type = "bulleted_list_item" if block_data[0].type == "bullet_list_open" else "numbered_list_item"
+            blocks += count_blocks(handleListItem(block_data, list_type, convert_todo=list_type == "bulleted_list_item"))
+        return blocks
+
+    def tables(block_data_list):
+        return sum(count_blocks(handleTable(block_data)) for block_data in block_data_list)
+
+    def fences(block_data_list):
+        return sum(count_blocks(handleFence(block_data)) for block_data in block_data_list)
+
+    def language_inputs():
+        names = [block_data[0].info.strip() for block_data in parse_groups(docs)["fence"]]
+        # 单次调用太快，重复到足够多的次数
+        names = names * (20000 // len(names) + 1) if names else []
+        return names, sum(len(name.encode("utf-8")) for name in names)
+
+    def languages(names):
+        for name in names:
+            match_code_language(name)
+        return 0
+
+    return {
+        "markdown_element_to_notion_object": (pipeline_inputs, pipeline),
+        "process_inline_content": (group_inputs("inline", flatten=True), inline),
+        "transform_invalid_link_and_image": (group_inputs("inline", flatten=True), invalid_links),
+        "handleListItem": (group_inputs("lists"), lists),
+        "handleTable": (group_inputs("table_open"), tables),
+        "handleFence": (group_inputs("fence"), fences),
+        "match_code_language": (language_inputs, languages),
+    }
+
+
+def measure(prepare, run, repeat, warmup):
+    """每轮重新准备输入，只对 run 计时；返回各轮耗时（秒）、输入字节数、输出块数和调用次数"""
+    samples = []
+    size = blocks = calls = 0
+    for round_index in range(warmup + repeat):
+        inputs, size = prepare()
+        calls = len(inputs)
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            blocks = run(inputs)
+            elapsed = time.perf_counter() - start
+        finally:
+            gc.enable()
+        if round_index >= warmup:
+            samples.append(elapsed)
+    return samples, size, blocks, calls
+
+
+def summarize(samples, size, blocks, calls):
+    median = statistics.median(samples)
+    mad = statistics.median(abs(sample - median) for sample in samples)
+    return {
+        "median_s": median,
+        "min_s": min(samples),
+        "spread": mad / median if median else 0.0,
+        "bytes": size,
+        "blocks": blocks,
+        "calls": calls,
+        "mb_per_s": size / median / 1e6 if median else 0.0,
+        "blocks_per_s": blocks / median if median else 0.0,
+        "us_per_call": median / calls * 1e6 if calls else 0.0,
+    }
+
+
+def load_baseline(path):
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return {(result["corpus"], result["case"]): result for result in data["results"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpora", default=",".join(CORPORA), help="逗号分隔的语料名")
+    parser.add_argument("--cases", default="", help="只运行名称包含这些字符串的测试（逗号分隔）")
+    parser.add_argument("--scale", type=float, default=1.0, help="按比例缩放各语料的文档数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--json", help="把结果写入 JSON 文件")
+    parser.add_argument("--compare", help="与之前保存的 JSON 结果比较")
+    parser.add_argument("--threshold", type=float, default=0.1, help="中位数变慢超过这个比例时视为回归")
+    args = parser.parse_args()
+
+    baseline = load_baseline(args.compare) if args.compare else {}
+    filters = [name for name in args.cases.split(",") if name]
+    print(f"python {platform.python_version()}  scale={args.scale} seed={args.seed} "
+          f"repeat={args.repeat} warmup={args.warmup}")
+    header = f"{'corpus':<14} {'case':<34} {'median ms':>10} {'min ms':>9} {'spread':>7} " \
+             f"{'MB/s':>8} {'blocks/s':>10} {'us/call':>9}"
+    if baseline:
+        header += f" {'vs base':>8}"
+    print(header)
+
+    results = []
+    regressions = []
+    for corpus in args.corpora.split(","):
+        docs = generate_corpus(corpus, args.scale, args.seed)
+        for case, (prepare, run) in build_cases(docs).items():
+            if filters and not any(name in case for name in filters):
+                continue
+            if not prepare()[0]:
+                # 语料中没有这类输入（例如没有表格）
+                continue
+            result = {"corpus": corpus, "case": case,
+                      **summarize(*measure(prepare, run, args.repeat, args.warmup))}
+            results.append(result)
+
+            line = f"{corpus:<14} {case:<34} {result['median_s'] * 1000:>10.2f} {result['min_s'] * 1000:>9.2f} " \
+                   f"{result['spread']:>6.1%} {result['mb_per_s']:>8.2f} {result['blocks_per_s']:>10.0f} " \
+                   f"{result['us_per_call']:>9.2f}"
+            base = baseline.get((corpus, case))
+            if base:
+                change = result["median_s"] / base["median_s"] - 1
+                line += f" {change:>+7.1%}"
+                if change > args.threshold:
+                    line += "  REGRESSION"
+                    regressions.append(f"{corpus}/{case}")
+            print(line)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"options": vars(args), "python": platform.python_version(), "results": results}, f, indent=2)
+    if regressions:
+        print(f"{len(regressions)} regression(s) over {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+"""本地的假 Notion API 服务，用于离线测试和基准测试
+
+实现上传用到的接口：pages.create / pages.update、blocks.children.append / list、
+blocks.update / delete、file_uploads.create / send。可以配置响应延迟、服务端限速，
+并按比例注入 429 和 5xx 错误。内容保存在内存中，按 Notion 的限制校验请求。
+
+用法：python benchmarks/fake_notion.py [--port 8765] [--latency 0.05] [--rps 3] [--error-rate 0.01]
+然后把 NOTION_BASE_URL 设为 http://127.0.0.1:8765
+
+另外提供两个调试接口：GET /__stats 返回各接口的请求数和状态码统计，POST /__reset 清空数据和统计。
+"""
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from payload_limits import MAX_CHILDREN, MAX_NESTING_DEPTH, MAX_TEXT_LENGTH, MAX_RICH_TEXT_ITEMS, \
+    MAX_BLOCKS_PER_REQUEST, text_length  # noqa: E402
+
+# 请求体大小上限
+MAX_BODY_BYTES = 500 * 1000
+
+ROUTES = [
+    ("POST", re.compile(r"^/v1/pages$"), "pages.create"),
+    ("PATCH", re.compile(r"^/v1/pages/(?P<id>[^/]+)$"), "pages.update"),
+    ("PATCH", re.compile(r"^/v1/blocks/(?P<id>[^/]+)/children$"), "blocks.children.append"),
+    ("GET", re.compile(r"^/v1/blocks/(?P<id>[^/]+)/children$"), "blocks.children.list"),
+    ("PATCH", re.compile(r"^/v1/blocks/(?P<id>[^/]+)$"), "blocks.update"),
+    ("DELETE", re.compile(r"^/v1/blocks/(?P<id>[^/]+)$"), "blocks.delete"),
+    ("POST", re.compile(r"^/v1/file_uploads$"), "file_uploads.create"),
+    ("POST", re.compile(r"^/v1/file_uploads/(?P<id>[^/]+)/send$"), "file_uploads.send"),
+]
+
+
+class ValidationError(Exception):
+    pass
+
+
+class FakeNotion:
+    """假服务的状态：页面和块、上传的文件、限速和统计（线程安全）"""
+
+    def __init__(self, latency=0.0, jitter=0.5, rps=0.0, error_rate=0.0, rate_limit_rate=0.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.rps = rps
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            # 块ID -> 子块ID 列表（页面也是块）
+            self.children = {}
+            # 块ID -> 块内容（不含子块）
+            self.blocks = {}
+            self.uploads = {}
+            self.requests = Counter()
+            self.statuses = Counter()
+            self.tokens = max(1.0, self.rps)
+            self.updated_at = time.monotonic()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": dict(self.requests),
+                "statuses": {str(status): count for status, count in self.statuses.items()},
+                "pages": sum(1 for block_id in self.children if block_id not in self.blocks),
+                "blocks": len(self.blocks)
+            }
+
+    def record(self, endpoint, status):
+        with self._lock:
+            self.requests[endpoint] += 1
+            self.statuses[status] += 1
+
+    def delay(self):
+        if self.latency > 0:
+            with self._lock:
+                factor = self.random.uniform(1 - self.jitter, 1 + self.jitter)
+            time.sleep(self.latency * factor)
+
+    def inject_error(self):
+        """按限速和注入比例决定本次请求是否失败，返回 (状态码, 错误码) 或 None"""
+        with self._lock:
+            if self.rps > 0:
+                now = time.monotonic()
+                self.tokens = min(max(1.0, self.rps), self.tokens + (now - self.updated_at) * self.rps)
+                self.updated_at = now
+                if self.tokens < 1:
+                    return 429, "rate_limited"
+                self.tokens -= 1
+            roll = self.random.random()
+            server_error = self.random.choice([(500, "internal_server_error"), (503, "service_unavailable")])
+        if roll < self.rate_limit_rate:
+            return 429, "rate_limited"
+        if roll < self.rate_limit_rate + self.error_rate:
+            return server_error
+        return None
+
+    def validate_children(self, children, depth=0):
+        if len(children) > MAX_CHILDREN:
+            raise ValidationError(f"children should be ≤ {MAX_CHILDREN}, instead was {len(children)}")
+        for block in children:
+            content = block.get(block.get("type"))
+            if not isinstance(content, dict):
+                raise ValidationError("block content is missing")
+            rich_texts = content["cells"] if block["type"] == "table_row" else [content.get("rich_text") or []]
+            for rich_text in rich_texts:
+                if len(rich_text) > MAX_RICH_TEXT_ITEMS:
+                    raise ValidationError(f"rich_text should be ≤ {MAX_RICH_TEXT_ITEMS} items")
+                for item in rich_text:
+                    if item.get("type") == "text" and text_length(item["text"]["content"]) > MAX_TEXT_LENGTH:
+                        raise ValidationError(f"text.content.length should be ≤ {MAX_TEXT_LENGTH}")
+            if content.get("children"):
+                if depth >= MAX_NESTING_DEPTH:
+                    raise ValidationError("children nested too deeply")
+                self.validate_children(content["children"], depth + 1)
+
+    def count_blocks(self, children):
+        return sum(1 + self.count_blocks(block[block["type"]].get("children") or []) for block in children)
+
+    def add_children(self, parent_id, children, after=None, at_start=False):
+        # 调用方需持有锁
+        self.children.setdefault(parent_id, [])
+        block_ids = []
+        for block in children:
+            block_id = str(uuid.uuid4())
+            content = dict(block[block["type"]])
+            nested = content.pop("children", None) or []
+            self.blocks[block_id] = {**block, block["type"]: content}
+            self.children[block_id] = []
+            self.add_children(block_id, nested)
+            block_ids.append(block_id)
+        siblings = self.children[parent_id]
+        if at_start:
+            index = 0
+        elif after in siblings:
+            index = siblings.index(after) + 1
+        else:
+            index = len(siblings)
+        siblings[index:index] = block_ids
+        return block_ids
+
+    def block_object(self, block_id):
+        return {"object": "block", "id": block_id, **self.blocks[block_id],
+                "has_children": bool(self.children.get(block_id))}
+
+    def handle(self, endpoint, params, body, query):
+        """执行请求，返回响应内容；参数错误抛出 ValidationError，找不到对象抛出 KeyError"""
+        if endpoint in ("pages.create", "blocks.children.append"):
+            children = body.get("children") or []
+            self.validate_children(children)
+            if self.count_blocks(children) > MAX_BLOCKS_PER_REQUEST:
+                raise ValidationError(f"request should contain ≤ {MAX_BLOCKS_PER_REQUEST} blocks")
+
+        with self._lock:
+            if endpoint == "pages.create":
+                page_id = str(uuid.uuid4())
+                self.add_children(page_id, body.get("children") or [])
+                return {"object": "page", "id": page_id}
+            if endpoint == "pages.update":
+                if params["id"] not in self.children:
+                    raise KeyError(params["id"])
+                return {"object": "page", "id": params["id"]}
+            if endpoint == "blocks.children.append":
+                if params["id"] not in self.children:
+                    raise KeyError(params["id"])
+                at_start = (body.get("position") or {}).get("type") == "start"
+                block_ids = self.add_children(params["id"], body["children"], body.get("after"), at_start)
+                return {"object": "list", "results": [self.block_object(block_id) for block_id in block_ids]}
+            if endpoint == "blocks.children.list":
+                siblings = self.children[params["id"]]
+                page_size = int(query.get("page_size", 100))
+                start = int(query.get("start_cursor") or 0)
+                end = start + page_size
+                return {
+                    "object": "list",
+                    "results": [self.block_object(block_id) for block_id in siblings[start:end]],
+                    "has_more": end < len(siblings),
+                    "next_cursor": str(end) if end < len(siblings) else None
+                }
+            if endpoint == "blocks.update":
+                block = self.blocks[params["id"]]
+                block_type = block["type"]
+                if block_type in body:
+                    block[block_type] = {**block[block_type], **body[block_type]}
+                return self.block_object(params["id"])
+            if endpoint == "blocks.delete":
+                block_id = params["id"]
+                for siblings in self.children.values():
+                    if block_id in siblings:
+                        siblings.remove(block_id)
+                        break
+                return {"object": "block", "id": block_id, "archived": True}
+            if endpoint == "file_uploads.create":
+                upload_id = str(uuid.uuid4())
+                self.uploads[upload_id] = {"filename": body.get("filename"), "status": "pending"}
+                return {"object": "file_upload", "id": upload_id, "status": "pending"}
+            if endpoint == "file_uploads.send":
+                self.uploads[params["id"]]["status"] = "uploaded"
+                return {"object": "file_upload", "id": params["id"], "status": "uploaded"}
+        raise KeyError(endpoint)
+
+
+class FakeNotionHandler(BaseHTTPRequestHandler):
+    # 保持连接，和真实服务一样可以复用
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, data, headers=None):
+        payload = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def send_error_json(self, status, code, message, headers=None):
+        self.send_json(status, {"object": "error", "status": status, "code": code, "message": message}, headers)
+
+    def dispatch(self, method):
+        fake = self.server.fake
+        path, _, query_string = self.path.partition("?")
+        query = dict(part.split("=", 1) for part in query_string.split("&") if "=" in part)
+        raw_body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+        if path == "/__stats" and method == "GET":
+            self.send_json(200, fake.stats())
+            return
+        if path == "/__reset" and method == "POST":
+            fake.reset()
+            self.send_json(200, {})
+            return
+
+        for route_method, pattern, endpoint in ROUTES:
+            match = pattern.match(path)
+            if route_method == method and match:
+                break
+        else:
+            self.send_error_json(404, "invalid_request_url", f"{method} {path} is not supported")
+            return
+
+        fake.delay()
+        error = fake.inject_error()
+        if error is not None:
+            status, code = error
+            fake.record(endpoint, status)
+            headers = {"Retry-After": "1"} if status == 429 else None
+            self.send_error_json(status, code, "injected error", headers)
+            return
+        if len(raw_body) > MAX_BODY_BYTES:
+            fake.record(endpoint, 413)
+            self.send_error_json(413, "payload_too_large", "request body too large")
+            return
+
+        try:
+            is_json = self.headers.get("Content-Type", "").startswith("application/json")
+            body = json.loads(raw_body) if raw_body and is_json else {}
+            result = fake.handle(endpoint, match.groupdict(), body, query)
+        except ValidationError as e:
+            fake.record(endpoint, 400)
+            self.send_error_json(400, "validation_error", str(e))
+            return
+        except KeyError as e:
+            fake.record(endpoint, 404)
+            self.send_error_json(404, "object_not_found", f"Could not find {e}")
+            return
+        fake.record(endpoint, 200)
+        self.send_json(200, result)
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def do_PATCH(self):
+        self.dispatch("PATCH")
+
+    def do_DELETE(self):
+        self.dispatch("DELETE")
+
+
+def create_server(port=0, host="127.0.0.1", **options):
+    """创建假服务（未启动），port 为 0 时自动选择空闲端口，实际端口见 server.server_port"""
+    server = ThreadingHTTPServer((host, port), FakeNotionHandler)
+    server.daemon_threads = True
+    server.fake = FakeNotion(**options)
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="每个请求的平均延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.5, help="延迟的随机浮动比例")
+    parser.add_argument("--rps", type=float, default=0.0, help="服务端限速（次/秒），超出时返回 429，0 表示不限速")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="随机返回 500/503 的比例")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="随机返回 429 的比例")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = create_server(
+        args.port, args.host, latency=args.latency, jitter=args.jitter, rps=args.rps,
+        error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate, seed=args.seed
+    )
+    print(f"fake Notion API listening on http://{args.host}:{server.server_port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
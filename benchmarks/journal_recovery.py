@@ -0,0 +1,55 @@
+"""journal 中断恢复检查：模拟进程在写入一半时退出，确认重新打开后之前和之后的记录都不会丢失
+
+用法：
+    python benchmarks/journal_recovery.py    # 有记录丢失时退出码为 1
+"""
+import os
+import sys
+import json
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from log_store import JournalLogStore  # noqa: E402
+
+
+def entry(path):
+    return {"path": path, "parent_page_id": "root", "page_id": path, "title": path,
+            "timestamp": "2024-01-01 00:00:00", "status": "success"}
+
+
+def logged_paths(store):
+    return sorted(item_entry["path"] for _, item_entry in store.iter_latest())
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "upload_logs.json")
+
+        store = JournalLogStore(path)
+        store.add("a", entry("a"))
+        # 模拟进程退出：不压缩，journal 保留在磁盘上
+        store.journal.close()
+
+        # 写入 b 时中断，只留下半行
+        line = json.dumps({"hash": "b", "entry": entry("b")}, ensure_ascii=False)
+        with open(f"{path}.journal", 'a', encoding='utf-8') as f:
+            f.write(line[:len(line) // 2])
+
+        store = JournalLogStore(path)
+        store.add("c", entry("c"))
+        store.journal.close()
+
+        store = JournalLogStore(path)
+        paths = logged_paths(store)
+        store.close()
+
+    expected = ["a", "c"]
+    if paths != expected:
+        print(f"失败：重放得到 {paths}，期望 {expected}")
+        sys.exit(1)
+    print(f"通过：重放得到 {paths}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""列表转换回归检查：转换 corpus/lists 下的 Markdown，与保存的 JSON 逐字节比较
+
+用法：
+    python benchmarks/list_regression.py            # 检查，输出不一致的文件，有不一致时退出码为 1
+    python benchmarks/list_regression.py --update   # 用当前实现重新生成期望结果
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from transformer import markdown_element_to_notion_object  # noqa: E402
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus", "lists")
+
+
+def render(md_path):
+    with open(md_path, "r", encoding="utf-8") as f:
+        notion_objects = markdown_element_to_notion_object(f.read())
+    return json.dumps(notion_objects, ensure_ascii=False, indent=2) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--update", action="store_true", help="重新生成期望的 JSON")
+    args = parser.parse_args()
+
+    failed = []
+    for name in sorted(os.listdir(CORPUS_DIR)):
+        if not name.endswith(".md"):
+            continue
+        md_path = os.path.join(CORPUS_DIR, name)
+        json_path = md_path[:-3] + ".json"
+
+        start = time.perf_counter()
+        output = render(md_path)
+        elapsed = (time.perf_counter() - start) * 1000
+
+        if args.update:
+            with open(json_path, "w", encoding="utf-8") as f:
+                f.write(output)
+            status = "updated"
+        else:
+            with open(json_path, "r", encoding="utf-8") as f:
+                status = "ok" if f.read() == output else "MISMATCH"
+            if status != "ok":
+                failed.append(name)
+        print(f"{status:<9} {name:<36} {elapsed:8.2f} ms")
+
+    if failed:
+        print(f"{len(failed)} file(s) differ: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""比较旧实现（每个文件新建解析器，每次调用重建语言别名表和 URL 正则）与复用共用解析器和常量表的单文件转换耗时
+
+用法：python benchmarks/parser_setup.py [--notes 5000] [--repeat 5]
+"""
+import os
+import re
+import sys
+import time
+import random
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from urllib.parse import urlparse  # noqa: E402
+from contextlib import contextmanager  # noqa: E402
+
+import transformer  # noqa: E402
+from transformer import markdown_element_to_notion_object, create_markdown_parser  # noqa: E402
+
+
+def legacy_match_code_language(lang_name):
+    """旧实现的 match_code_language：每次调用都重建别名表和语言集合"""
+    if not lang_name:
+        return 'plain text'
+    lang_name = str(lang_name).lower().strip()
+    aliases = {
+        'js': 'javascript', 'ts': 'typescript', 'py': 'python', 'rb': 'ruby', 'sh': 'shell', 'bash': 'shell',
+        'zsh': 'shell', 'cpp': 'c++', 'csharp': 'c#', 'jsx': 'javascript', 'tsx': 'typescript', 'yml': 'yaml',
+        'htm': 'html', 'markdown': 'markdown', 'md': 'markdown', 'vb': 'visual basic', 'stylus': 'css',
+        'sass': 'scss', 'golang': 'go', 'plaintext': 'plain text', 'txt': 'plain text'
+    }
+    supported_languages = {
+        'abap', 'arduino', 'bash', 'basic', 'c', 'clojure', 'coffeescript',
+        'c++', 'c#', 'css', 'dart', 'diff', 'docker', 'elixir', 'elm',
+        'erlang', 'flow', 'fortran', 'f#', 'gherkin', 'glsl', 'go',
+        'graphql', 'groovy', 'haskell', 'html', 'java', 'javascript',
+        'json', 'julia', 'kotlin', 'latex', 'less', 'lisp', 'livescript',
+        'lua', 'makefile', 'markdown', 'markup', 'matlab', 'mermaid', 'nix',
+        'objective-c', 'ocaml', 'pascal', 'perl', 'php', 'plain text',
+        'powershell', 'prolog', 'protobuf', 'python', 'r', 'reason',
+        'ruby', 'rust', 'sass', 'scala', 'scheme', 'scss', 'shell', 'sql',
+        'swift', 'typescript', 'vb.net', 'verilog', 'vhdl', 'visual basic',
+        'webassembly', 'xml', 'yaml', 'java/c/c++/c#'
+    }
+    normalized_lang = aliases.get(lang_name, lang_name)
+    return normalized_lang if normalized_lang in supported_languages else 'plain text'
+
+
+def legacy_is_valid_url(link_url):
+    """旧实现的 is_valid_url：每次调用都调用 re.compile"""
+    regex = re.compile(
+        r'^(https?:\/\/)?'
+        r'(www\.)?'
+        r'([a-zA-Z0-9-_]+\.)+'
+        r'[a-zA-Z]{2,}'
+        r'(:\d+)?'
+        r'(\/.*)?$',
+        re.IGNORECASE
+    )
+    if not regex.match(link_url):
+        return False
+    parsed_url = urlparse(link_url if link_url.startswith(('http://', 'https://')) else f'http://{link_url}')
+    return bool(parsed_url.netloc) and bool(parsed_url.scheme)
+
+
+@contextmanager
+def legacy_tables():
+    """测量期间让 transformer 使用旧实现的 match_code_language 和 is_valid_url"""
+    saved = transformer.match_code_language, transformer.is_valid_url
+    transformer.match_code_language, transformer.is_valid_url = legacy_match_code_language, legacy_is_valid_url
+    try:
+        yield
+    finally:
+        transformer.match_code_language, transformer.is_valid_url = saved
+
+
+@contextmanager
+def current_tables():
+    yield
+
+
+def generate_notes(count, seed=0):
+    """生成大量短笔记：标题、一两段文字，偶尔带列表、链接和代码块"""
+    rng = random.Random(seed)
+    words = ["note", "idea", "todo", "**bold**", "*italic*", "`code`", "[link](https://example.com)", "meeting"]
+    notes = []
+    for i in range(count):
+        parts = [f"# Note {i}"]
+        for _ in range(rng.randint(1, 3)):
+            parts.append(" ".join(rng.choice(words) for _ in range(rng.randint(5, 20))))
+        if rng.random() < 0.3:
+            parts.append("- [ ] first\n- [x] second")
+        if rng.random() < 0.2:
+            parts.append("```py\nprint('hello')\n```")
+        notes.append("\n\n".join(parts))
+    return notes
+
+
+def time_per_file(notes, convert, repeat):
+    """每轮转换全部笔记，返回各轮的单文件平均耗时（微秒）"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for note in notes:
+            convert(note)
+        samples.append((time.perf_counter() - start) / len(notes) * 1e6)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--notes", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    notes = generate_notes(args.notes)
+    def new_parser(note):
+        return markdown_element_to_notion_object(note, md=create_markdown_parser())
+
+    cases = {
+        # 旧实现：每次调用都构建新的 MarkdownIt，并重建语言别名表和 URL 正则
+        "before (all per call)": (new_parser, legacy_tables),
+        # 只有解析器每个文件新建，常量表已共用，用来区分两部分的收益
+        "new parser per file": (new_parser, current_tables),
+        "after (shared)": (markdown_element_to_notion_object, current_tables),
+    }
+
+    print(f"{args.notes} notes, {args.repeat} rounds")
+    results = {}
+    for name, (convert, tables) in cases.items():
+        with tables():
+            samples = time_per_file(notes, convert, args.repeat)
+        results[name] = statistics.median(samples)
+        print(f"{name:<30} median {results[name]:8.1f} us/file   min {min(samples):8.1f}   max {max(samples):8.1f}")
+
+    before, _, after = results.values()
+    print(f"speedup: {before / after:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
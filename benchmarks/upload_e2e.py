@@ -0,0 +1,248 @@
+"""端到端基准测试：用 NotionUploader 把生成的目录上传到本地的假 Notion 服务
+
+场景：
+    flat        一个文件夹中的大量普通笔记
+    deep        多层嵌套的文件夹，每层几篇笔记
+    many-small  许多文件夹中的大量很短的笔记
+    few-huge    少量超过流式上传阈值的大文件
+
+每个场景在单独的进程中运行，输出 files/s、requests/s、请求延迟的 p50/p99（客户端测得，含假服务的延迟）、
+假服务返回的错误数、最终失败的项数、连接复用率以及上传进程的内存峰值（peak RSS）。
+
+用法：python benchmarks/upload_e2e.py [--scenarios flat,deep] [--scale 0.5] [--workers 4] [--latency 0.02]
+      [--server-rps 0] [--error-rate 0.01] [--rate-limit-rate 0.01] [--max-connections 20]
+      [--keepalive-expiry 60] [--json results.json]
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import statistics
+import contextlib
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import NotionUploader, UploadStatus  # noqa: E402
+from fake_notion import create_server  # noqa: E402
+
+SCENARIOS = ["flat", "deep", "many-small", "few-huge"]
+
+
+def generate_note(rng, paragraphs):
+    words = ["note", "idea", "**bold**", "*italic*", "`code`", "[link](https://example.com)", "meeting", "plan"]
+    parts = [f"# Note {rng.randint(0, 10 ** 6)}"]
+    for _ in range(paragraphs):
+        parts.append(" ".join(rng.choice(words) for _ in range(rng.randint(10, 40))))
+        if rng.random() < 0.2:
+            parts.append("- [ ] first\n- [x] second\n  - nested item")
+        if rng.random() < 0.1:
+            parts.append("```python\nprint('hello')\n```")
+    return "\n\n".join(parts) + "\n"
+
+
+def write_note(path, text):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def generate_tree(scenario, root, scale=1.0, seed=0):
+    """在 root 下生成场景对应的目录，返回 Markdown 文件数"""
+    rng = random.Random(seed)
+    count = 0
+    if scenario == "flat":
+        for i in range(max(1, int(300 * scale))):
+            write_note(os.path.join(root, f"note_{i}.md"), generate_note(rng, rng.randint(2, 8)))
+            count += 1
+    elif scenario == "deep":
+        folder = root
+        for depth in range(max(1, int(30 * scale))):
+            folder = os.path.join(folder, f"level_{depth}")
+            os.makedirs(folder)
+            for i in range(5):
+                write_note(os.path.join(folder, f"note_{i}.md"), generate_note(rng, rng.randint(2, 8)))
+                count += 1
+    elif scenario == "many-small":
+        for folder_index in range(max(1, int(40 * scale))):
+            folder = os.path.join(root, f"folder_{folder_index}")
+            os.makedirs(folder)
+            for i in range(25):
+                write_note(os.path.join(folder, f"note_{i}.md"), f"# Small {i}\n\ntiny note\n")
+                count += 1
+    elif scenario == "few-huge":
+        for i in range(max(1, int(3 * scale))):
+            write_note(os.path.join(root, f"huge_{i}.md"), "".join(generate_note(rng, 10) for _ in range(1500)))
+            count += 1
+    else:
+        raise ValueError(f"unknown scenario: {scenario}")
+    return count
+
+
+class LatencyRecorder:
+    """通过 httpx 的事件钩子记录每个 HTTP 请求的耗时"""
+
+    def __init__(self):
+        self.started = {}
+        self.samples = []
+        self._lock = threading.Lock()
+
+    def on_request(self, request):
+        with self._lock:
+            self.started[id(request)] = time.perf_counter()
+
+    def on_response(self, response):
+        response.read()
+        with self._lock:
+            started = self.started.pop(id(response.request), None)
+            if started is not None:
+                self.samples.append(time.perf_counter() - started)
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    # Linux 上 ru_maxrss 的单位是 KB，macOS 上是字节
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def run_scenario(scenario, base_url, args, queue):
+    """在子进程中生成目录并上传，结果放入 queue"""
+    recorder = LatencyRecorder()
+
+    class BenchmarkUploader(NotionUploader):
+        def http_event_hooks(self):
+            hooks = super().http_event_hooks()
+            return {
+                "request": [recorder.on_request, *hooks["request"]],
+                "response": [recorder.on_response, *hooks["response"]]
+            }
+
+    work_dir = tempfile.mkdtemp(prefix=f"notion_bench_{scenario}_")
+    try:
+        source = os.path.join(work_dir, "source")
+        os.makedirs(source)
+        files = generate_tree(scenario, source, args.scale, args.seed)
+        # 失败的文件会被复制到当前目录下的 error_folder
+        os.chdir(work_dir)
+        options = {
+            "stop_when_error": False,
+            "max_workers": args.workers,
+            "requests_per_second": args.rps,
+            "conversion_workers": args.conversion_workers,
+            "log_backend": "journal",
+            "base_url": base_url,
+            "http_max_connections": args.max_connections,
+            "http_max_keepalive_connections": args.max_connections,
+            "http_keepalive_expiry": args.keepalive_expiry
+        }
+        uploader = BenchmarkUploader(
+            "fake-token", options,
+            os.path.join(work_dir, "logs.json"), os.path.join(work_dir, "errors.json")
+        )
+        start = time.perf_counter()
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            try:
+                uploader.upload_folder_to_notion(source, "benchmark-root")
+            finally:
+                uploader.close()
+        elapsed = time.perf_counter() - start
+
+        failed = sum(1 for _ in uploader.log_store.iter_latest(UploadStatus.FAILED.value))
+        requests = len(recorder.samples)
+        queue.put({
+            "scenario": scenario,
+            "files": files,
+            "seconds": elapsed,
+            "files_per_second": files / elapsed,
+            "requests": requests,
+            "requests_per_second": requests / elapsed,
+            "p50_ms": percentile(recorder.samples, 0.5) * 1000,
+            "p99_ms": percentile(recorder.samples, 0.99) * 1000,
+            "mean_ms": statistics.fmean(recorder.samples) * 1000 if recorder.samples else 0.0,
+            "failed_items": failed,
+            "connections": uploader.metrics.total("http_connections"),
+            "connection_reuse_ratio": uploader.metrics.connection_reuse_ratio() or 0.0,
+            "peak_rss_mb": peak_rss_mb()
+        })
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--scale", type=float, default=1.0, help="按比例缩放各场景的文件数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=4, help="上传线程数（max_workers）")
+    parser.add_argument("--conversion-workers", type=int, default=0)
+    parser.add_argument("--rps", type=float, default=0, help="客户端限速（requests_per_second），0 表示不限速")
+    parser.add_argument("--latency", type=float, default=0.02, help="假服务每个请求的平均延迟（秒）")
+    parser.add_argument("--server-rps", type=float, default=0, help="假服务的限速，超出时返回 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="假服务随机返回 500/503 的比例")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="假服务随机返回 429 的比例")
+    parser.add_argument("--max-connections", type=int, default=20, help="HTTP 连接池大小（http_max_connections）")
+    parser.add_argument("--keepalive-expiry", type=float, default=60.0,
+                        help="空闲连接保留的秒数（http_keepalive_expiry），0 表示每个请求都新建连接")
+    parser.add_argument("--json", help="把结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    server = create_server(
+        latency=args.latency, rps=args.server_rps, error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate, seed=args.seed
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    print(f"workers={args.workers} rps={args.rps or 'unlimited'} latency={args.latency * 1000:.0f}ms "
+          f"server_rps={args.server_rps or 'unlimited'} error_rate={args.error_rate} "
+          f"rate_limit_rate={args.rate_limit_rate}")
+    header = f"{'scenario':<11} {'files':>6} {'seconds':>8} {'files/s':>8} {'requests':>9} {'req/s':>7} " \
+             f"{'p50 ms':>7} {'p99 ms':>7} {'errors':>7} {'failed':>6} {'reuse':>6} {'peak RSS':>9}"
+    print(header)
+
+    # 子进程单独测量内存峰值，不受假服务和其他场景的影响
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for scenario in args.scenarios.split(","):
+        server.fake.reset()
+        queue = context.Queue()
+        process = context.Process(target=run_scenario, args=(scenario, base_url, args, queue))
+        process.start()
+        result = queue.get()
+        process.join()
+
+        stats = server.fake.stats()
+        result["server_requests"] = stats["requests"]
+        result["server_statuses"] = stats["statuses"]
+        # 假服务返回的错误响应数（限流、5xx 和参数错误），限流和 5xx 会被重试
+        result["errors"] = sum(count for status, count in stats["statuses"].items() if status != "200")
+        results.append(result)
+        rss = f"{result['peak_rss_mb']:.0f} MB" if result["peak_rss_mb"] is not None else "n/a"
+        print(f"{scenario:<11} {result['files']:>6} {result['seconds']:>8.2f} {result['files_per_second']:>8.1f} "
+              f"{result['requests']:>9} {result['requests_per_second']:>7.1f} {result['p50_ms']:>7.1f} "
+              f"{result['p99_ms']:>7.1f} {result['errors']:>7} {result['failed_items']:>6} "
+              f"{result['connection_reuse_ratio']:>6.1%} {rss:>9}")
+
+    server.shutdown()
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"options": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import json
+import hashlib
+from difflib import SequenceMatcher
+
+# 这些类型的块不能通过 blocks.update 修改内容（如表格宽度），只能删除后重新添加
+NOT_UPDATABLE_TYPES = {"table"}
+
+
+def fingerprint_block(block):
+    """计算顶层块的指纹（包含子块内容）"""
+    payload = json.dumps(block, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def has_children(block):
+    return bool(block[block["type"]].get("children"))
+
+
+def index_blocks(notion_objects, block_ids=None):
+    """生成页面块索引 [指纹, 块ID, 类型, 是否有子块]，块ID未知时为 None"""
+    if block_ids is None:
+        block_ids = [None] * len(notion_objects)
+    return [
+        [fingerprint_block(block), block_id, block["type"], has_children(block)]
+        for block, block_id in zip(notion_objects, block_ids)
+    ]
+
+
+def can_update_in_place(old_block, new_block):
+    """类型相同且新旧块都没有子块时，可以直接用 blocks.update 修改"""
+    _, _, old_type, old_has_children = old_block
+    return (
+        old_type == new_block["type"]
+        and old_type not in NOT_UPDATABLE_TYPES
+        and not old_has_children
+        and not has_children(new_block)
+    )
+
+
+def block_update_payload(block):
+    """blocks.update 的参数：去掉 children，只保留块内容"""
+    block_type = block["type"]
+    content = {key: value for key, value in block[block_type].items() if key != "children"}
+    return {block_type: content}
+
+
+def diff_blocks(old_blocks, new_blocks):
+    """比较旧的块索引和新的块列表，返回按页面顺序排列的操作：
+
+    ("keep", old_block)、("update", old_block, new_block)、
+    ("delete", old_block)、("insert", [new_block, ...])
+    """
+    old_fingerprints = [block[0] for block in old_blocks]
+    new_fingerprints = [fingerprint_block(block) for block in new_blocks]
+    matcher = SequenceMatcher(None, old_fingerprints, new_fingerprints, autojunk=False)
+
+    operations = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        olds = old_blocks[i1:i2]
+        news = new_blocks[j1:j2]
+        if tag == "equal":
+            operations.extend(("keep", old_block) for old_block in olds)
+            continue
+
+        # 一一对应且可以原地修改的块用 update，其余的删除后重新插入
+        paired = min(len(olds), len(news)) if tag == "replace" else 0
+        updated = 0
+        while updated < paired and can_update_in_place(olds[updated], news[updated]):
+            operations.append(("update", olds[updated], news[updated]))
+            updated += 1
+        operations.extend(("delete", old_block) for old_block in olds[updated:])
+        if news[updated:]:
+            operations.append(("insert", news[updated:]))
+    return operations
@@ -0,0 +1,115 @@
+import os
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+from functools import lru_cache
+
+import markdown_it
+
+# 影响转换结果的模块，任何一个的源码变化都会使缓存失效
+CONVERTER_MODULES = ("transformer.py", "payload_limits.py", "link_resolver.py", "utils.py")
+
+
+@lru_cache(maxsize=None)
+def converter_version():
+    """转换器版本：转换相关模块的源码和 markdown-it-py 版本的哈希"""
+    version = hashlib.sha256(markdown_it.__version__.encode("utf-8"))
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    for name in CONVERTER_MODULES:
+        with open(os.path.join(base_dir, name), "rb") as f:
+            version.update(f.read())
+    return version.hexdigest()[:16]
+
+
+class ConversionCache:
+    """按 Markdown 内容哈希缓存转换结果，跨次运行复用（SQLite）
+
+    键为内容哈希加转换选项，每条记录带转换器版本，版本不同的记录视为不存在，打开时删除；
+    值为压缩后的块列表 JSON。总大小超过 max_bytes 时按最近使用时间淘汰（LRU）。
+    转换进程池中的每个进程各自打开一个连接，多个进程可以同时读写。
+    """
+
+    def __init__(self, path="conversion_cache.db", max_bytes=512 * 1024 * 1024, evict_every=100):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.evict_every = evict_every
+        self.version = converter_version()
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.create_tables()
+
+    def create_tables(self):
+        with self._lock, self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    version TEXT NOT NULL,
+                    blocks BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_used REAL NOT NULL
+                )""")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_last_used ON entries (last_used)")
+            # 转换逻辑变化后，旧版本的结果不会再被用到
+            self.conn.execute("DELETE FROM entries WHERE version != ?", (self.version,))
+
+    @staticmethod
+    def key(content_hash, local_images=False, local_links=False):
+        return f"{content_hash}:{int(local_images)}{int(local_links)}"
+
+    def get(self, key):
+        """返回缓存的块列表（每次都是新的副本，可以原地修改），没有时返回 None"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT blocks FROM entries WHERE key = ? AND version = ?", (key, self.version)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            with self.conn:
+                self.conn.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, key, notion_objects):
+        blocks = zlib.compress(json.dumps(notion_objects, ensure_ascii=False).encode("utf-8"), 1)
+        with self._lock:
+            with self.conn:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO entries (key, version, blocks, size, last_used) VALUES (?, ?, ?, ?, ?)",
+                    (key, self.version, blocks, len(blocks), time.time())
+                )
+            self._puts += 1
+            if self._puts % self.evict_every == 0:
+                self.evict()
+
+    def evict(self):
+        # 调用方需持有锁；超过上限时删除最久未使用的记录，直到总大小降到上限的 90%
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = self.max_bytes * 0.9
+        with self.conn:
+            while total > target:
+                rows = self.conn.execute("SELECT key, size FROM entries ORDER BY last_used LIMIT 1000").fetchall()
+                if not rows:
+                    return
+                removed = []
+                for key, size in rows:
+                    removed.append((key,))
+                    total -= size
+                    if total <= target:
+                        break
+                self.conn.executemany("DELETE FROM entries WHERE key = ?", removed)
+
+    def close(self):
+        with self._lock:
+            self.evict()
+            self.conn.close()
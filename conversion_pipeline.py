@@ -0,0 +1,110 @@
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from transformer import markdown_element_to_notion_object
+from conversion_cache import ConversionCache
+from utils import read_markdown_file
+
+# 转换进程中打开的转换缓存（由进程池的 initializer 创建）
+_worker_cache = None
+
+
+def convert_markdown_content(md_content, content_hash, local_images=False, local_links=False, cache=None):
+    """转换 Markdown 文本，cache 不为空时先按内容哈希查找缓存，未命中时转换并写入缓存"""
+    key = None
+    if cache is not None:
+        key = cache.key(content_hash, local_images, local_links)
+        notion_objects = cache.get(key)
+        if notion_objects is not None:
+            return notion_objects
+    notion_objects = markdown_element_to_notion_object(
+        md_content, local_images=local_images, local_links=local_links
+    )
+    if cache is not None:
+        cache.put(key, notion_objects)
+    return notion_objects
+
+
+def convert_markdown_file(item_path, local_images=False, local_links=False, cache=None):
+    """读取并转换 Markdown 文件，返回 (是否为空, 文件信息, Notion 块列表)
+
+    作为进程池的任务执行，只传递路径和可序列化的结果。
+    """
+    md_content, file_info = read_markdown_file(item_path)
+    notion_objects = convert_markdown_content(
+        md_content, file_info["content_hash"], local_images, local_links, cache
+    )
+    return md_content.strip() == "", file_info, notion_objects
+
+
+def init_worker(cache_file, cache_max_bytes):
+    global _worker_cache
+    if cache_file:
+        _worker_cache = ConversionCache(cache_file, cache_max_bytes)
+
+
+def convert_in_worker(item_path, local_images=False, local_links=False):
+    return convert_markdown_file(item_path, local_images, local_links, _worker_cache)
+
+
+class ConversionPipeline:
+    """用进程池提前转换 Markdown 文件，上传线程按需取结果
+
+    遍历目录时调用 prefetch 登记待转换的文件，同时进行的转换不超过 max_pending 个，
+    上传线程调用 get 取走一个结果（或调用 discard 放弃）后再补充新的转换任务，
+    已转换未上传的结果数量因此有上限。
+    cache_file 不为空时，每个转换进程打开同一个转换缓存。
+    """
+
+    def __init__(self, workers, max_pending=None, local_images=False, local_links=False,
+                 cache_file=None, cache_max_bytes=None):
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers, initializer=init_worker, initargs=(cache_file, cache_max_bytes)
+        )
+        self.max_pending = max_pending or workers * 4
+        self.local_images = local_images
+        self.local_links = local_links
+        # 已提交到进程池的任务 path -> future
+        self.futures = {}
+        # 等待提交的文件（dict 保持插入顺序，用作有序集合）
+        self.waiting = {}
+        self._lock = threading.Lock()
+
+    def prefetch(self, item_paths):
+        """登记即将上传的文件，按顺序提前转换"""
+        with self._lock:
+            for item_path in item_paths:
+                if item_path not in self.futures:
+                    self.waiting[item_path] = None
+            self.fill()
+
+    def fill(self):
+        # 调用方需持有锁
+        while self.waiting and len(self.futures) < self.max_pending:
+            item_path = next(iter(self.waiting))
+            del self.waiting[item_path]
+            self.futures[item_path] = self.executor.submit(convert_in_worker, item_path, self.local_images, self.local_links)
+
+    def get(self, item_path):
+        """取出文件的转换结果，未提前转换的文件立即提交到进程池"""
+        with self._lock:
+            future = self.futures.pop(item_path, None)
+            if future is None:
+                self.waiting.pop(item_path, None)
+                future = self.executor.submit(convert_in_worker, item_path, self.local_images, self.local_links)
+            self.fill()
+        return future.result()
+
+    def discard(self, item_path):
+        """丢弃不会再取走的转换结果（文件被重命名或上传出错），把名额留给后面的文件"""
+        with self._lock:
+            self.waiting.pop(item_path, None)
+            future = self.futures.pop(item_path, None)
+            if future is None:
+                return
+            # 已经在转换的任务无法取消，结果直接丢弃
+            future.cancel()
+            self.fill()
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,68 @@
+import os
+from collections import namedtuple
+
+# 目录清单中的一项：
+# is_dir 是否为文件夹；size、mtime 只对 .md 文件记录；
+# children 为文件夹的直接子项路径（文件为 None）；has_markdown 表示该项（或其子树）中是否有 .md 文件
+ManifestEntry = namedtuple("ManifestEntry", ["path", "is_dir", "size", "mtime", "children", "has_markdown"])
+
+
+def scan_tree(root_path):
+    """用 os.scandir 遍历一次目录树，返回清单 {路径: ManifestEntry}
+
+    每个文件夹只读取一次目录项，是否为文件夹来自目录项本身，只对 .md 文件额外读取大小和修改时间。
+    """
+    manifest = {}
+    if os.path.isdir(root_path):
+        scan_folder(root_path, manifest)
+    else:
+        manifest[root_path] = file_entry(root_path, os.stat(root_path))
+    return manifest
+
+
+def file_entry(path, stat=None):
+    if path.endswith(".md"):
+        return ManifestEntry(path, False, stat.st_size, stat.st_mtime, None, True)
+    return ManifestEntry(path, False, None, None, None, False)
+
+
+def scan_folder(folder_path, manifest):
+    """递归扫描文件夹，把自身和所有子项写入 manifest，返回该文件夹的清单项"""
+    children = []
+    subfolders = []
+    has_markdown = False
+    with os.scandir(folder_path) as entries:
+        for entry in entries:
+            children.append(entry.path)
+            if entry.is_dir():
+                # 子文件夹在关闭当前目录句柄后再扫描，避免深层目录同时打开过多句柄
+                subfolders.append(entry.path)
+                continue
+            is_markdown = entry.name.endswith(".md")
+            manifest[entry.path] = file_entry(entry.path, entry.stat() if is_markdown else None)
+            has_markdown = has_markdown or is_markdown
+
+    for subfolder_path in subfolders:
+        has_markdown = scan_folder(subfolder_path, manifest).has_markdown or has_markdown
+
+    folder_entry = ManifestEntry(folder_path, True, None, None, children, has_markdown)
+    manifest[folder_path] = folder_entry
+    return folder_entry
+
+
+def scan_folder_files(folder_path):
+    """只扫描文件夹中的文件，不进入子文件夹，返回清单 {路径: ManifestEntry}
+
+    文件夹清单项的 children 只包含文件，用于子文件夹由别处处理的场景（分片上传）。
+    """
+    manifest = {}
+    children = []
+    with os.scandir(folder_path) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                continue
+            children.append(entry.path)
+            manifest[entry.path] = file_entry(entry.path, entry.stat() if entry.name.endswith(".md") else None)
+    has_markdown = any(path.endswith(".md") for path in children)
+    manifest[folder_path] = ManifestEntry(folder_path, True, None, None, children, has_markdown)
+    return manifest
@@ -0,0 +1,113 @@
+import re
+
+import httpx
+
+# (方法, 路径) -> 请求名，与 metrics.endpoint_name 和 upload_plan 中的请求名一致
+ENDPOINT_ROUTES = [
+    ("POST", re.compile(r"^pages$"), "pages.create"),
+    ("PATCH", re.compile(r"^pages/[^/]+$"), "pages.update"),
+    ("GET", re.compile(r"^blocks/[^/]+/children$"), "blocks.children.list"),
+    ("PATCH", re.compile(r"^blocks/[^/]+/children$"), "blocks.children.append"),
+    ("PATCH", re.compile(r"^blocks/[^/]+$"), "blocks.update"),
+    ("DELETE", re.compile(r"^blocks/[^/]+$"), "blocks.delete"),
+    ("POST", re.compile(r"^file_uploads$"), "file_uploads.create"),
+    ("POST", re.compile(r"^file_uploads/[^/]+/send$"), "file_uploads.send"),
+]
+
+
+def request_endpoint(method, path):
+    """HTTP 请求对应的请求名，如 PATCH /v1/blocks/<id>/children -> blocks.children.append，未知的请求返回 "other" """
+    path = path.strip("/")
+    if path.startswith("v1/"):
+        path = path[3:]
+    for route_method, pattern, name in ENDPOINT_ROUTES:
+        if method == route_method and pattern.match(path):
+            return name
+    return "other"
+
+
+def parse_endpoint_timeouts(text):
+    """解析 "blocks.children.append=120,file_uploads.send=300" 形式的按端点超时（秒）"""
+    timeouts = {}
+    for part in (text or "").split(","):
+        if not part.strip():
+            continue
+        name, _, seconds = part.partition("=")
+        timeouts[name.strip()] = float(seconds)
+    return timeouts
+
+
+class HttpTransportConfig:
+    """Notion 客户端的 HTTP 连接设置：连接池大小、keep-alive、HTTP/2 和超时
+
+    所有上传线程（以及图片上传线程）共用一个 transport，也就是同一个连接池；
+    连接用完后保持 keepalive_expiry 秒，后续请求直接复用，不再重新建立 TCP 连接和 TLS 握手。
+    read_timeout 可以按端点覆盖，例如写入大量块的 blocks.children.append 或上传文件的 file_uploads.send。
+    """
+
+    def __init__(self, max_connections=20, max_keepalive_connections=20, keepalive_expiry=60.0, http2=False,
+                 connect_timeout=10.0, read_timeout=60.0, write_timeout=60.0, pool_timeout=60.0,
+                 endpoint_timeouts=None):
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.http2 = http2
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.write_timeout = write_timeout
+        self.pool_timeout = pool_timeout
+        self.endpoint_timeouts = endpoint_timeouts or {}
+
+    @classmethod
+    def from_options(cls, options):
+        return cls(
+            max_connections=options["http_max_connections"],
+            max_keepalive_connections=options["http_max_keepalive_connections"],
+            keepalive_expiry=options["http_keepalive_expiry"],
+            http2=options["http2"],
+            connect_timeout=options["http_connect_timeout"],
+            read_timeout=options["http_timeout"],
+            write_timeout=options["http_timeout"],
+            pool_timeout=options["http_timeout"],
+            endpoint_timeouts=options["http_endpoint_timeouts"]
+        )
+
+    def limits(self):
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry
+        )
+
+    def timeout(self, endpoint=None):
+        read_timeout = self.endpoint_timeouts.get(endpoint, self.read_timeout)
+        return httpx.Timeout(
+            connect=self.connect_timeout,
+            read=read_timeout,
+            write=max(self.write_timeout, read_timeout),
+            pool=self.pool_timeout
+        )
+
+    def create_transport(self, asynchronous=False):
+        """创建共用的连接池；开启 HTTP/2 需要安装 h2（pip install httpx[http2]）"""
+        if self.http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                raise ImportError("http2 选项需要安装 h2：pip install httpx[http2]") from None
+        transport_class = httpx.AsyncHTTPTransport if asynchronous else httpx.HTTPTransport
+        return transport_class(limits=self.limits(), http2=self.http2)
+
+    def apply_timeout(self, request):
+        """按请求的端点设置超时（Notion SDK 会把客户端的超时统一设为 timeout_ms，这里逐个请求覆盖）"""
+        endpoint = request_endpoint(request.method, request.url.path)
+        request.extensions["timeout"] = self.timeout(endpoint).as_dict()
+
+    def event_hooks(self, asynchronous=False):
+        if not asynchronous:
+            return {"request": [self.apply_timeout], "response": []}
+
+        async def apply_timeout_async(request):
+            self.apply_timeout(request)
+
+        return {"request": [apply_timeout_async], "response": []}
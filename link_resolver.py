@@ -0,0 +1,196 @@
+import os
+import re
+import copy
+import threading
+
+# Obsidian 风格的 [[页面]]、[[页面#标题]]、[[页面|显示文字]]
+WIKI_LINK_REGEX = re.compile(r'\[\[([^\[\]|#]+)(#[^\[\]|]*)?(?:\|([^\[\]]+))?\]\]')
+# 带协议的链接（http:、mailto: 等）
+SCHEME_REGEX = re.compile(r'^[a-zA-Z][a-zA-Z0-9+.-]*:')
+
+
+def is_local_link(href):
+    """是否为指向本地 Markdown 文件的相对链接（可以带 #锚点）"""
+    path = href.split('#', 1)[0]
+    return path.endswith('.md') and not SCHEME_REGEX.match(path)
+
+
+def text_part(item, content):
+    part = copy.deepcopy(item)
+    part["text"]["content"] = content
+    return part
+
+
+def split_wiki_links(rich_texts):
+    """把文本中的 [[页面]] 拆成单独的 rich text，标记为待解析的链接，内容保留原文"""
+    result = []
+    for item in rich_texts:
+        content = item["text"]["content"] if item.get("type") == "text" else ""
+        if ("[[" not in content or item["text"].get("link") or "local_link" in item
+                or item.get("annotations", {}).get("code")):
+            result.append(item)
+            continue
+        start = 0
+        for match in WIKI_LINK_REGEX.finditer(content):
+            if match.start() > start:
+                result.append(text_part(item, content[start:match.start()]))
+            part = text_part(item, match.group(0))
+            name = match.group(1).strip()
+            part["local_link"] = {"wiki": name, "label": (match.group(3) or name).strip()}
+            result.append(part)
+            start = match.end()
+        if start == 0:
+            result.append(item)
+        elif start < len(content):
+            result.append(text_part(item, content[start:]))
+    return result
+
+
+def collect_local_links(notion_objects, offset=0, path=()):
+    """找出含有待解析链接的块，并从块中移除标记（请求中不能带多余的字段）
+
+    返回 [[块路径, 块类型, 带标记的 rich_text]]，块路径是从页面顶层开始、逐层的下标，
+    offset 为 notion_objects 中第一个块在页面顶层的下标。
+    """
+    links = []
+    for index, block in enumerate(notion_objects, offset):
+        block_type = block["type"]
+        content = block.get(block_type)
+        if not isinstance(content, dict):
+            continue
+        block_path = [*path, index]
+        rich_text = content.get("rich_text") or []
+        if any("local_link" in item for item in rich_text):
+            links.append([block_path, block_type, copy.deepcopy(rich_text)])
+            for item in rich_text:
+                item.pop("local_link", None)
+        if content.get("children"):
+            links.extend(collect_local_links(content["children"], path=block_path))
+    return links
+
+
+def page_url(page_id):
+    return "https://www.notion.so/" + page_id.replace("-", "")
+
+
+def page_link_item(page_id, label, annotations, link_style):
+    if link_style == "mention":
+        item = {"type": "mention", "mention": {"type": "page", "page": {"id": page_id}}}
+    else:
+        item = {"type": "text", "text": {"content": label, "link": {"url": page_url(page_id)}}}
+    if annotations:
+        item["annotations"] = annotations
+    return item
+
+
+def required_child_ids(block_paths):
+    """按层级顺序返回 [(父块路径, 需要读取的子块数)]，父块路径为空表示页面本身"""
+    required = {}
+    for block_path in block_paths:
+        for depth in range(len(block_path)):
+            parent = tuple(block_path[:depth])
+            required[parent] = max(required.get(parent, 0), block_path[depth] + 1)
+    return sorted(required.items(), key=lambda item: len(item[0]))
+
+
+class PageIndex:
+    """源文件路径和标题到 Notion 页面ID 的索引，查询为 O(1)"""
+
+    def __init__(self):
+        self.by_path = {}
+        # 标题（不含 .md，忽略大小写）-> 页面ID，同名文件以先登记的为准
+        self.by_title = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize_path(path):
+        return os.path.normcase(os.path.abspath(path))
+
+    def register(self, path, page_id):
+        path = self.normalize_path(path)
+        title = os.path.splitext(os.path.basename(path))[0].casefold()
+        with self._lock:
+            self.by_path[path] = page_id
+            self.by_title.setdefault(title, page_id)
+
+    def lookup(self, link, source_path):
+        """查找链接指向的页面ID，找不到时返回 None；相对路径和 [[页面]] 都相对于 source_path 所在的文件夹"""
+        source_dir = os.path.dirname(os.path.abspath(source_path))
+        if "path" in link:
+            return self.by_path.get(self.normalize_path(os.path.join(source_dir, link["path"].split('#', 1)[0])))
+        name = link["wiki"]
+        if not name.endswith(".md"):
+            name += ".md"
+        # 优先使用同一文件夹中的同名文件
+        page_id = self.by_path.get(self.normalize_path(os.path.join(source_dir, name)))
+        if page_id is None:
+            page_id = self.by_title.get(os.path.splitext(os.path.basename(name))[0].casefold())
+        return page_id
+
+
+class LinkResolver:
+    """跨文件链接的第二遍解析
+
+    上传时登记每个页面（PageIndex），并记录含有跨文件链接的块；全部上传完成后，
+    把能找到目标页面的链接改写为 Notion 页面链接（或提及），只更新这些块。
+    """
+
+    def __init__(self, link_style="link"):
+        self.index = PageIndex()
+        self.link_style = link_style
+        # 页面ID -> (源文件路径, 日志键, 链接记录)
+        self.pending = {}
+        self._lock = threading.Lock()
+
+    def add_page(self, page_id, source_path, item_hash, links):
+        """登记页面写入后待解析的链接，links 为空时取消之前的登记"""
+        with self._lock:
+            if links:
+                self.pending[page_id] = (source_path, item_hash, links)
+            else:
+                self.pending.pop(page_id, None)
+
+    def pop_pending(self):
+        with self._lock:
+            pending, self.pending = self.pending, {}
+        return list(pending.items())
+
+    def resolve_rich_text(self, rich_text, source_path):
+        """返回 (改写后的 rich_text, 已解析的链接数, 仍带标记的 rich_text 或 None)
+
+        未解析的链接在改写后的 rich_text 中保留原文；全部解析时第三项为 None，
+        否则为已解析部分改写后、未解析部分仍带标记的 rich_text，供之后再次解析。
+        """
+        result = []
+        pending = []
+        resolved = unresolved = 0
+        for item in rich_text:
+            link = item.get("local_link")
+            if link is None:
+                result.append(item)
+                pending.append(item)
+                continue
+            page_id = self.index.lookup(link, source_path)
+            if page_id is None:
+                unresolved += 1
+                result.append({key: value for key, value in item.items() if key != "local_link"})
+                pending.append(item)
+                continue
+            resolved += 1
+            item = page_link_item(page_id, link["label"], item.get("annotations"), self.link_style)
+            result.append(item)
+            pending.append(item)
+        return result, resolved, pending if unresolved else None
+
+    def plan_page(self, source_path, links):
+        """返回 (需要更新的块 [(块路径, 块类型, 新 rich_text)], 仍有未解析链接的记录)"""
+        updates = []
+        remaining = []
+        for block_path, block_type, rich_text in links:
+            new_rich_text, resolved, pending = self.resolve_rich_text(rich_text, source_path)
+            if resolved:
+                updates.append((block_path, block_type, new_rich_text))
+            if pending is not None:
+                # 已解析的部分不会在下次重复更新
+                remaining.append([block_path, block_type, pending])
+        return updates, remaining
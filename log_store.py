@@ -0,0 +1,390 @@
+import os
+import json
+import sqlite3
+import threading
+from collections.abc import Mapping
+
+
+def merge_entry(data, item_hash, entry, kind):
+    """把一条记录合并到内存中的日志结构（与 upload_logs.json / upload_errors.json 格式相同）"""
+    record = data.get(item_hash)
+    if record is None:
+        if kind == "errors":
+            record = {"logs": [], "timestamp": entry["timestamp"]}
+        else:
+            record = {"logs": [], "latest_status": None}
+        data[item_hash] = record
+
+    record["logs"].append(entry)
+    if kind == "logs":
+        record["latest_status"] = entry["status"]
+
+
+def replay_journal(data, journal_path, kind):
+    """把 journal 中的记录依次合并到 data，返回重放的条数"""
+    count = 0
+    if os.path.exists(journal_path):
+        with open(journal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    # 进程中断时最后一行可能不完整，忽略
+                    continue
+                merge_entry(data, event["hash"], event["entry"], kind)
+                count += 1
+    return count
+
+
+def trim_partial_line(journal_path, chunk_size=64 * 1024):
+    """进程中断时最后一行可能只写了一半：截断到最后一个完整的换行，否则下一条记录会接在它后面，两条都无法解析"""
+    if not os.path.exists(journal_path):
+        return
+    with open(journal_path, 'rb+') as f:
+        size = f.seek(0, os.SEEK_END)
+        end = size
+        valid_size = 0
+        while end > 0:
+            start = max(0, end - chunk_size)
+            f.seek(start)
+            newline = f.read(end - start).rfind(b"\n")
+            if newline >= 0:
+                valid_size = start + newline + 1
+                break
+            end = start
+        if valid_size < size:
+            f.truncate(valid_size)
+
+
+class JsonLogStore:
+    """原有的存储方式：每次变更都重写整个 JSON 文件"""
+
+    def __init__(self, path, kind="logs"):
+        self.path = path
+        self.kind = kind
+        self.data = self.load()
+        # content_hash -> {item_hash}，第一次按内容哈希查找时才建立
+        self.content_index = None
+
+    def load(self):
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        return {}
+
+    def add(self, item_hash, entry):
+        merge_entry(self.data, item_hash, entry, self.kind)
+        self.index_entry(item_hash, entry)
+        self.save()
+
+    def index_entry(self, item_hash, entry):
+        if self.content_index is not None and entry.get("content_hash"):
+            self.content_index.setdefault(entry["content_hash"], set()).add(item_hash)
+
+    def latest(self, item_hash):
+        """返回某一项的最新记录，不存在时返回 None"""
+        record = self.data.get(item_hash)
+        return record["logs"][-1] if record else None
+
+    def entries(self, item_hash):
+        """返回某一项的全部记录"""
+        record = self.data.get(item_hash)
+        return list(record["logs"]) if record else []
+
+    def iter_latest(self, status=None):
+        """遍历每一项的最新记录，可按状态过滤"""
+        for item_hash, record in list(self.data.items()):
+            entry = record["logs"][-1]
+            if status is None or entry.get("status") == status:
+                yield item_hash, entry
+
+    def find_by_path(self, path):
+        """按路径查找，返回 [(item_hash, 最新记录)]"""
+        return [(item_hash, entry) for item_hash, entry in self.iter_latest() if entry["path"] == path]
+
+    def find_by_content_hash(self, content_hash):
+        """按文件内容哈希查找，返回最新记录仍是该内容的 [(item_hash, 最新记录)]"""
+        if self.content_index is None:
+            self.content_index = {}
+            for item_hash, entry in self.iter_latest():
+                self.index_entry(item_hash, entry)
+        results = []
+        for item_hash in self.content_index.get(content_hash, ()):
+            entry = self.latest(item_hash)
+            if entry.get("content_hash") == content_hash:
+                results.append((item_hash, entry))
+        return results
+
+    def save(self):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, ensure_ascii=False, indent=2)
+
+    def close(self):
+        pass
+
+    def abandon(self):
+        """放弃日志文件，不再写入（分片租约失效后，文件由接手的进程继续写）"""
+        pass
+
+
+class JournalLogStore(JsonLogStore):
+    """追加写日志：每条记录写一行 JSON 到 <path>.journal，定期压缩回 <path>
+
+    启动时先读取 <path> 快照（兼容旧版 upload_logs.json），再重放 journal。
+    fsync 按 fsync_every 条批量执行。journal 的条数达到快照条数的 compact_ratio 倍（且至少 compact_every 条）后
+    把完整状态写回快照并清空 journal，压缩的总开销与记录总数成正比，不随历史增长而变成平方级。
+    """
+
+    def __init__(self, path, kind="logs", fsync_every=50, compact_every=10000, compact_ratio=1.0):
+        self.journal_path = f"{path}.journal"
+        self.fsync_every = fsync_every
+        self.compact_every = compact_every
+        self.compact_ratio = compact_ratio
+        self.pending_fsync = 0
+        self.journal_size = 0
+        # 快照中的记录条数
+        self.snapshot_size = 0
+        super().__init__(path, kind)
+        self.journal = open(self.journal_path, 'a', encoding='utf-8')
+
+    def load(self):
+        data = super().load()
+        self.snapshot_size = sum(len(record["logs"]) for record in data.values())
+        # 之后以追加方式打开 journal，先去掉不完整的最后一行
+        trim_partial_line(self.journal_path)
+        self.journal_size = replay_journal(data, self.journal_path, self.kind)
+        return data
+
+    def add(self, item_hash, entry):
+        merge_entry(self.data, item_hash, entry, self.kind)
+        self.index_entry(item_hash, entry)
+        self.journal.write(json.dumps({"hash": item_hash, "entry": entry}, ensure_ascii=False) + "\n")
+        # 每条记录都写入操作系统缓冲区，只有 fsync 批量执行
+        self.journal.flush()
+        self.pending_fsync += 1
+        self.journal_size += 1
+        if self.pending_fsync >= self.fsync_every:
+            self.sync()
+        if self.journal_size >= max(self.compact_every, self.snapshot_size * self.compact_ratio):
+            self.compact()
+
+    def sync(self):
+        os.fsync(self.journal.fileno())
+        self.pending_fsync = 0
+
+    def compact(self):
+        """把完整状态写回快照文件，然后清空 journal"""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, ensure_ascii=False, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        # 快照已经包含 journal 中的全部记录
+        self.journal.truncate(0)
+        self.journal.seek(0)
+        self.pending_fsync = 0
+        self.snapshot_size += self.journal_size
+        self.journal_size = 0
+
+    def save(self):
+        self.compact()
+
+    def close(self):
+        if self.journal.closed:
+            return
+        self.compact()
+        self.journal.close()
+        os.remove(self.journal_path)
+
+    def abandon(self):
+        # 不压缩，journal 留给接手的进程重放
+        self.journal.close()
+
+
+class SqliteLogView(Mapping):
+    """以只读 dict 的形式访问 SQLite 中的日志，按需查询，不把历史记录读入内存"""
+
+    def __init__(self, store):
+        self.store = store
+
+    def __getitem__(self, item_hash):
+        entries = self.store.entries(item_hash)
+        if not entries:
+            raise KeyError(item_hash)
+        record = {"logs": entries}
+        if self.store.kind == "errors":
+            record["timestamp"] = entries[0]["timestamp"]
+        else:
+            record["latest_status"] = entries[-1]["status"]
+        return record
+
+    def __contains__(self, item_hash):
+        return self.store.latest(item_hash) is not None
+
+    def __iter__(self):
+        for item_hash, _ in self.store.iter_latest():
+            yield item_hash
+
+    def __len__(self):
+        return self.store.count()
+
+
+class SqliteLogStore:
+    """SQLite 存储：按 item_hash、状态和路径建索引，每次写入是一个事务
+
+    数据库文件为 <path 去掉扩展名>.db；首次使用时会导入已有的 JSON 日志（及 journal）。
+    """
+
+    def __init__(self, path, kind="logs"):
+        self.path = path
+        self.kind = kind
+        self.db_path = f"{os.path.splitext(path)[0]}.db"
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.create_tables()
+        self.data = SqliteLogView(self)
+        if not self.count():
+            self.import_json()
+
+    def create_tables(self):
+        with self.conn:
+            # entries 保存完整历史；items 只保存每一项的最新状态，用于索引查询
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    item_hash TEXT NOT NULL,
+                    entry TEXT NOT NULL
+                )""")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS items (
+                    item_hash TEXT PRIMARY KEY,
+                    path TEXT,
+                    status TEXT,
+                    page_id TEXT,
+                    content_hash TEXT,
+                    latest_entry_id INTEGER NOT NULL
+                )""")
+            columns = {row[1] for row in self.conn.execute("PRAGMA table_info(items)")}
+            if "content_hash" not in columns:
+                # 兼容没有 content_hash 列的旧数据库
+                self.conn.execute("ALTER TABLE items ADD COLUMN content_hash TEXT")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_hash ON entries (item_hash, id)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_items_status ON items (status)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_items_path ON items (path)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_items_content_hash ON items (content_hash)")
+
+    def import_json(self):
+        """从 JSON 日志（及 journal）迁移"""
+        journal_path = f"{self.path}.journal"
+        if not os.path.exists(self.path) and not os.path.exists(journal_path):
+            return
+        data = JsonLogStore(self.path, self.kind).data
+        replay_journal(data, journal_path, self.kind)
+        with self._lock, self.conn:
+            for item_hash, record in data.items():
+                for entry in record["logs"]:
+                    self.insert(item_hash, entry)
+
+    def insert(self, item_hash, entry):
+        cursor = self.conn.execute(
+            "INSERT INTO entries (item_hash, entry) VALUES (?, ?)",
+            (item_hash, json.dumps(entry, ensure_ascii=False))
+        )
+        self.conn.execute(
+            """INSERT INTO items (item_hash, path, status, page_id, content_hash, latest_entry_id)
+               VALUES (?, ?, ?, ?, ?, ?)
+               ON CONFLICT (item_hash) DO UPDATE SET
+                   path = excluded.path, status = excluded.status, page_id = excluded.page_id,
+                   content_hash = excluded.content_hash, latest_entry_id = excluded.latest_entry_id""",
+            (item_hash, entry.get("path"), entry.get("status"), entry.get("page_id"),
+             entry.get("content_hash"), cursor.lastrowid)
+        )
+
+    def add(self, item_hash, entry):
+        with self._lock, self.conn:
+            self.insert(item_hash, entry)
+
+    def latest(self, item_hash):
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT e.entry FROM items i JOIN entries e ON e.id = i.latest_entry_id WHERE i.item_hash = ?",
+                (item_hash,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def entries(self, item_hash):
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT entry FROM entries WHERE item_hash = ? ORDER BY id", (item_hash,)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def iter_latest(self, status=None):
+        # 按 item_hash 分页读取，内存占用与总条数无关
+        conditions = ["i.item_hash > ?"]
+        if status is not None:
+            conditions.append("i.status = ?")
+        query = (
+            "SELECT i.item_hash, e.entry FROM items i JOIN entries e ON e.id = i.latest_entry_id "
+            f"WHERE {' AND '.join(conditions)} ORDER BY i.item_hash LIMIT 1000"
+        )
+        last_hash = ""
+        while True:
+            params = (last_hash,) if status is None else (last_hash, status)
+            with self._lock:
+                rows = self.conn.execute(query, params).fetchall()
+            if not rows:
+                return
+            for item_hash, entry in rows:
+                yield item_hash, json.loads(entry)
+            last_hash = rows[-1][0]
+
+    def find_by_path(self, path):
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT i.item_hash, e.entry FROM items i JOIN entries e ON e.id = i.latest_entry_id WHERE i.path = ?",
+                (path,)
+            ).fetchall()
+        return [(item_hash, json.loads(entry)) for item_hash, entry in rows]
+
+    def find_by_content_hash(self, content_hash):
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT i.item_hash, e.entry FROM items i JOIN entries e ON e.id = i.latest_entry_id "
+                "WHERE i.content_hash = ?",
+                (content_hash,)
+            ).fetchall()
+        return [(item_hash, json.loads(entry)) for item_hash, entry in rows]
+
+    def count(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+
+    def save(self):
+        with self._lock:
+            self.conn.commit()
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    def abandon(self):
+        # 每次更新都是独立事务，没有未写出的数据
+        self.close()
+
+
+LOG_STORES = {
+    "json": JsonLogStore,
+    "journal": JournalLogStore,
+    "sqlite": SqliteLogStore,
+}
+
+
+def create_log_store(backend, path, kind="logs"):
+    """按名称创建日志存储"""
+    if backend not in LOG_STORES:
+        raise ValueError(f"未知的日志存储类型: {backend}")
+    return LOG_STORES[backend](path, kind)
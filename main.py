@@ -1,13 +1,33 @@
 import os
-import json
+import copy
+import time
 import hashlib
 import shutil
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 
+import httpx
 from dotenv import load_dotenv
 
 from notion_client import Client
 
-from transformer import markdown_element_to_notion_object
+from conversion_pipeline import ConversionPipeline, convert_markdown_content
+from conversion_cache import ConversionCache
+from rate_limiter import RequestScheduler
+from log_store import create_log_store
+from folder_scanner import scan_tree, scan_folder_files
+from upload_plan import UploadPlanner, print_plan, save_plan
+from block_diff import index_blocks, diff_blocks, block_update_payload
+from payload_limits import MAX_CHILDREN, batch_blocks, count_blocks
+from transformer import iter_notion_blocks
+from media_upload import MediaUploader, LocalFileBackend, NotionFileBackend
+from link_resolver import LinkResolver, collect_local_links, required_child_ids
+from metrics import RunMetrics, ProgressReporter
+from http_transport import HttpTransportConfig, parse_endpoint_timeouts
+from shard_coordinator import ShardCoordinator, LeaseKeeper, LeaseLostError, default_worker_id
+from page_checkpoint import PageCheckpoint
+from utils import read_markdown_file, hash_lines, hash_markdown_file, is_modified_after_upload
 from datetime import datetime
 from enum import Enum
 from rich.console import Console
@@ -19,23 +39,162 @@ class UploadStatus(Enum):
     SUCCESS = "success"
     FAILED = "failed"
     IN_PROGRESS = "in_progress"
+    # 文件被重命名，页面已经转移到新路径对应的记录
+    MOVED = "moved"
+
+
+DEFAULT_OPTIONS = {
+    "stop_when_error": False,
+    "if_add_empty_page": True,
+    "if_add_empty_folder": True,
+    # 并发上传的线程数，1 表示逐个上传
+    "max_workers": 1,
+    # 所有线程共用的请求速率上限（Notion 平均限制约 3 次/秒），0 表示不限速
+    "requests_per_second": 3,
+    # 遇到限流（429）或临时错误（5xx、超时）时的最大重试次数
+    "max_retries": 5,
+    # 日志存储方式："json" 每次变更重写整个文件，"journal" 追加写并定期压缩，
+    # "sqlite" 使用带索引的 SQLite 数据库（upload_logs.db），不把历史记录读入内存
+    "log_backend": "json",
+    # 增量同步：已上传的文件内容变化时原地更新页面，重命名的文件只修改标题
+    "incremental_sync": False,
+    # 增量同步更新页面时，按块比较新旧内容，只发送变化的部分
+    "block_diff": True,
+    # 转换 Markdown 的进程数，大于 0 时由进程池提前转换，与上传并行；0 表示在上传线程中转换
+    "conversion_workers": 0,
+    # 按 Markdown 内容哈希缓存转换结果（conversion_cache.db），内容没变的文件再次上传时不用重新转换；
+    # 转换相关的代码变化后缓存自动失效
+    "conversion_cache": False,
+    # 转换缓存的大小上限（MB），超过时淘汰最久未使用的结果
+    "conversion_cache_max_mb": 512,
+    # 超过该大小（字节）的新文件边转换边上传，不在内存中保留整篇文档；0 表示不使用流式上传
+    "stream_threshold": 1024 * 1024,
+    # 上传 Markdown 引用的本地图片（相同内容只上传一次），关闭时本地图片保留为文本
+    "upload_local_images": False,
+    # 图片上传方式："notion" 使用 Notion 的文件上传接口，"local" 复制到本地文件夹（用于测试）
+    "media_backend": "notion",
+    # 并行上传图片的线程数
+    "media_workers": 4,
+    # 把指向其他 Markdown 文件的链接（[x](other.md)、[[页面]]）改写为 Notion 页面链接，在全部上传后的第二遍中处理
+    "resolve_links": False,
+    # 改写后的链接形式："link" 保留链接文字，"mention" 使用页面提及（显示页面标题）
+    "link_style": "link",
+    # Notion API 的地址，为空时使用官方地址；可以指向本地的假服务（benchmarks/fake_notion.py）做离线测试
+    "base_url": None,
+    # 所有上传线程共用的 HTTP 连接池大小
+    "http_max_connections": 20,
+    # 连接池中保持空闲的连接数上限，空闲连接可以直接复用，不用重新握手
+    "http_max_keepalive_connections": 20,
+    # 空闲连接保留的秒数
+    "http_keepalive_expiry": 60.0,
+    # 使用 HTTP/2（一个连接上并发多个请求），需要安装 httpx[http2]
+    "http2": False,
+    # 请求的读写超时（秒）
+    "http_timeout": 60.0,
+    # 建立连接的超时（秒）
+    "http_connect_timeout": 10.0,
+    # 按端点覆盖读写超时（秒），如 {"blocks.children.append": 120, "file_uploads.send": 300}
+    "http_endpoint_timeouts": {},
+    # 重试失败的文件时，内容没变就直接发送错误日志中保存的块，不再重新转换
+    # （保存的块已替换过本地图片、移除了链接标记，开启 upload_local_images 或 resolve_links 时不复用）
+    "retry_reuse_payload": True,
+    # 分片上传时，.md 文件数不超过该值的子树作为一个分片，更大的文件夹继续按子文件夹切分
+    "shard_size": 1000,
+    # 分片租约的时长（秒），进程退出后超过这个时间，分片由其他进程接手
+    "shard_lease_seconds": 300,
+    # 运行结束时把各阶段耗时、请求数、重试次数等指标写入 JSON 文件，为空时不写
+    "metrics_file": None,
+    # 同上，使用 Prometheus 文本格式（可以交给 node_exporter 的 textfile collector 采集）
+    "prometheus_file": None,
+    # 每隔多少秒输出一行进度（已处理项数、请求速率、重试次数），0 表示不输出
+    "progress_interval": 0
+}
 
 
 class NotionUploader:
-    def __init__(self, auth_token, options=None, logs_file="upload_logs.json", error_file="upload_errors.json"):
-        self.notion = Client(auth=auth_token)
+    def __init__(self, auth_token, options=None, logs_file="upload_logs.json", error_file="upload_errors.json",
+                 media_cache_file="media_cache.jsonl", conversion_cache_file="conversion_cache.db"):
+        # 未指定的选项使用默认值
+        self.options = {**DEFAULT_OPTIONS, **(options or {})}
+        # 各阶段耗时和计数，客户端和请求调度器都会记录
+        self.metrics = RunMetrics()
+        self.http_config = HttpTransportConfig.from_options(self.options)
+        self.notion = self.create_client(auth_token)
         self.logs_file = logs_file
         self.error_file = error_file
+        self.log_store = create_log_store(self.options["log_backend"], logs_file, "logs")
+        self.error_store = create_log_store(self.options["log_backend"], error_file, "errors")
         self.logs = self.load_logs()
         self.errors = self.load_errors()
-        if options is None:
-            self.options = {
-                "stop_when_error": False,
-                "if_add_empty_page": True,
-                "if_add_empty_folder": True
-            }
-        else:
-            self.options = options
+        # 源目录清单 {路径: ManifestEntry}，上传前一次扫描得到
+        self.manifest = {}
+        self.conversion_cache = None
+        cache_max_bytes = self.options["conversion_cache_max_mb"] * 1024 * 1024
+        if self.options["conversion_cache"]:
+            self.conversion_cache = ConversionCache(conversion_cache_file, cache_max_bytes)
+        self.pipeline = None
+        if self.options["conversion_workers"] > 0:
+            self.pipeline = ConversionPipeline(
+                self.options["conversion_workers"],
+                local_images=self.options["upload_local_images"],
+                local_links=self.options["resolve_links"],
+                cache_file=conversion_cache_file if self.conversion_cache is not None else None,
+                cache_max_bytes=cache_max_bytes
+            )
+        self.scheduler = RequestScheduler(
+            requests_per_second=self.options["requests_per_second"],
+            max_retries=self.options["max_retries"],
+            metrics=self.metrics
+        )
+        self.media = None
+        if self.options["upload_local_images"]:
+            self.media = MediaUploader(
+                self.create_media_backend(), media_cache_file, workers=self.options["media_workers"]
+            )
+        self.link_resolver = None
+        if self.options["resolve_links"]:
+            self.link_resolver = LinkResolver(self.options["link_style"])
+
+        # 并发上传时，日志写入和错误提示需要加锁
+        self._log_lock = threading.RLock()
+        self._prompt_lock = threading.Lock()
+        self._futures_lock = threading.Lock()
+        self._futures = []
+        self._executor = None
+        self._stopping = False
+        self._progress = None
+        # 分片上传时当前分片的续租线程
+        self._lease_keeper = None
+        # 重试时可以复用错误日志中的块的文件 {路径: item_hash}
+        self._retry_payloads = {}
+
+    def client_options(self, auth_token):
+        """Notion 客户端的参数；关闭 SDK 自带的重试，只由 RequestScheduler 重试（限速和重试计数才准确）"""
+        options = {"auth": auth_token, "timeout_ms": int(self.options["http_timeout"] * 1000), "retry": False}
+        if self.options["base_url"]:
+            options["base_url"] = self.options["base_url"].rstrip("/")
+        return options
+
+    def http_event_hooks(self, asynchronous=False):
+        """HTTP 客户端的事件钩子：按端点设置超时，请求的字节数、状态码和新建连接数计入 metrics"""
+        hooks = self.http_config.event_hooks(asynchronous)
+        metrics_hooks = self.metrics.http_event_hooks(asynchronous)
+        return {name: hooks[name] + metrics_hooks[name] for name in ("request", "response")}
+
+    def create_client(self, auth_token):
+        """创建 Notion 客户端，所有线程（包括图片上传）共用同一个连接池"""
+        client = httpx.Client(
+            transport=self.http_config.create_transport(), event_hooks=self.http_event_hooks()
+        )
+        return Client(client=client, **self.client_options(auth_token))
+
+    def create_media_backend(self):
+        """创建图片上传后端"""
+        if self.options["media_backend"] == "local":
+            return LocalFileBackend()
+        if self.options["media_backend"] == "notion":
+            return NotionFileBackend(self.notion, self.scheduler)
+        raise ValueError(f"未知的图片上传方式：{self.options['media_backend']}")
 
     def generate_item_hash(self, path, parent_page_id):
         """生成目录或文件的跨平台唯一标识"""
@@ -45,53 +204,127 @@ class NotionUploader:
 
     def load_logs(self):
         """加载上传日志"""
-        if os.path.exists(self.logs_file):
-            with open(self.logs_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        return {}
+        return self.log_store.data
 
     def load_errors(self):
         """加载错误日志"""
-        if os.path.exists(self.error_file):
-            with open(self.error_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        return {}
+        return self.error_store.data
+
+    def open_log_files(self, logs_file, error_file):
+        """换用另一组日志文件（分片上传时每个分片使用自己的日志），先关闭当前的日志"""
+        with self.metrics.phase("log_write"), self._log_lock:
+            self.log_store.close()
+            self.error_store.close()
+            self.logs_file = logs_file
+            self.error_file = error_file
+            self.log_store = create_log_store(self.options["log_backend"], logs_file, "logs")
+            self.error_store = create_log_store(self.options["log_backend"], error_file, "errors")
+            self.logs = self.load_logs()
+            self.errors = self.load_errors()
 
     def save_logs(self):
         """保存上传日志"""
-        with open(self.logs_file, 'w', encoding='utf-8') as f:
-            json.dump(self.logs, f, ensure_ascii=False, indent=2)
+        with self.metrics.phase("log_write"), self._log_lock:
+            self.log_store.save()
 
     def save_errors(self):
         """保存错误日志"""
-        with open(self.error_file, 'w', encoding='utf-8') as f:
-            json.dump(self.errors, f, ensure_ascii=False, indent=2)
+        with self.metrics.phase("log_write"), self._log_lock:
+            self.error_store.save()
+
+    def close(self):
+        """写出尚未落盘的日志（journal 会被压缩回 JSON 文件），关闭转换进程池和图片上传线程，导出指标"""
+        if self.pipeline is not None:
+            self.pipeline.close()
+            self.pipeline = None
+        if self.media is not None:
+            self.media.close()
+        if self.conversion_cache is not None:
+            self.metrics.increment("conversion_cache", self.conversion_cache.hits, result="hit")
+            self.metrics.increment("conversion_cache", self.conversion_cache.misses, result="miss")
+            self.conversion_cache.close()
+            self.conversion_cache = None
+        with self.metrics.phase("log_write"), self._log_lock:
+            self.log_store.close()
+            self.error_store.close()
+        self.close_client()
+        self.export_metrics()
+
+    def close_client(self):
+        """关闭 HTTP 连接池"""
+        self.notion.close()
+
+    def metrics_enabled(self):
+        return bool(self.options["metrics_file"] or self.options["prometheus_file"] or self.options["progress_interval"])
+
+    def export_metrics(self):
+        """按配置写出指标文件，并输出各阶段耗时的摘要"""
+        if self.options["metrics_file"]:
+            self.metrics.save_json(self.options["metrics_file"])
+        if self.options["prometheus_file"]:
+            self.metrics.save_prometheus(self.options["prometheus_file"])
+        if self.metrics_enabled():
+            for line in self.metrics.summary_lines():
+                console.print(f"【统计】{line}", style="cyan", highlight=False, soft_wrap=True)
+
+    @contextmanager
+    def report_progress(self, folder_path):
+        """上传期间按 progress_interval 定时输出进度，嵌套调用时只有最外层输出"""
+        if not self.options["progress_interval"] or self._progress is not None:
+            yield
+            return
+        # 带上分隔符比较，避免把 notes-archive 之类同前缀的兄弟文件夹算进 notes
+        folder_prefix = os.path.join(folder_path, "")
+        total_items = sum(
+            1 for path, entry in self.manifest.items()
+            if path != folder_path and path.startswith(folder_prefix) and (entry.is_dir or path.endswith(".md"))
+        )
+        self._progress = ProgressReporter(
+            self.metrics, self.options["progress_interval"],
+            lambda line: console.print(f"【进度】{line}", style="cyan", highlight=False, soft_wrap=True), total_items
+        ).start()
+        try:
+            yield
+        finally:
+            self._progress.stop()
+            self._progress = None
+
+    def get_latest_log(self, item_hash):
+        """返回某一项最新的日志记录"""
+        return self.log_store.latest(item_hash)
+
+    def get_existing_page_id(self, item_hash):
+        """返回最近一次记录中的页面ID（更新页面失败时也会保留页面ID）"""
+        log_entry = self.get_latest_log(item_hash)
+        return log_entry["page_id"] if log_entry else None
+
+    def get_uploaded_page_id(self, item_hash):
+        """已上传成功时返回对应的 Notion 页面ID，否则返回 None"""
+        log_entry = self.get_latest_log(item_hash)
+        if log_entry and log_entry["status"] == UploadStatus.SUCCESS.value:
+            return log_entry["page_id"]
+        return None
 
     def add_log_entry(self, item_hash, log_entry):
         """添加日志记录"""
-        if item_hash not in self.logs:
-            self.logs[item_hash] = {
-                "logs": [],
-                "latest_status": None
-            }
-
-        self.logs[item_hash]["logs"].append(log_entry)
-        self.logs[item_hash]["latest_status"] = log_entry["status"]
-        self.save_logs()
+        with self.metrics.phase("log_write"), self._log_lock:
+            self.check_lease()
+            self.log_store.add(item_hash, log_entry)
 
     def add_error_entry(self, item_hash, error_entry):
         """添加错误记录"""
-        if item_hash not in self.errors:
-            self.errors[item_hash] = {
-                "logs": [],
-                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            }
-        self.errors[item_hash]["logs"].append(error_entry)
-        self.save_errors()
-
-    def create_log_entry(self, path, parent_page_id, page_id, title, status):
-        """创建日志记录"""
-        return {
+        with self.metrics.phase("log_write"), self._log_lock:
+            self.check_lease()
+            self.error_store.add(item_hash, error_entry)
+
+    def check_lease(self, start_work=False):
+        """分片上传时租约失效则中止当前分片，避免和接手的进程重复创建页面、同时写分片日志"""
+        if self._lease_keeper is not None:
+            self._lease_keeper.check(start_work)
+
+    def create_log_entry(self, path, parent_page_id, page_id, title, status, file_info=None):
+        """创建日志记录，file_info 为文件的内容哈希、大小和修改时间"""
+        log_entry = {
             "path": path,
             "parent_page_id": parent_page_id,
             "page_id": page_id,
@@ -99,196 +332,948 @@ class NotionUploader:
             "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
             "status": status.value
         }
+        if file_info:
+            log_entry.update(file_info)
+        return log_entry
+
+    def read_markdown_file(self, item_path):
+        """读取 Markdown 文件，返回内容和文件信息（内容哈希、大小、修改时间）"""
+        with self.metrics.phase("read"):
+            return read_markdown_file(item_path)
+
+    def convert_markdown_item(self, item_path):
+        """读取并转换 Markdown 文件，返回 (是否为空, 文件信息, Notion 块列表)"""
+        if item_path in self._retry_payloads:
+            md_content, file_info = self.read_markdown_file(item_path)
+            notion_objects = self.load_retry_payload(item_path, file_info["content_hash"])
+            if notion_objects is not None:
+                return md_content.strip() == "", file_info, notion_objects
+        if self.pipeline is not None:
+            # 读取和转换在进程池中进行，这里只能测量等待结果的时间
+            with self.metrics.phase("conversion_wait"):
+                return self.pipeline.get(item_path)
+        # 与 convert_markdown_file 相同，分开计时读取和转换
+        md_content, file_info = self.read_markdown_file(item_path)
+        notion_objects = self.convert_markdown_content(md_content, file_info["content_hash"])
+        return md_content.strip() == "", file_info, notion_objects
+
+    def load_retry_payload(self, item_path, content_hash):
+        """取出上次失败时保存的块，文件内容已变化或没有保存时返回 None"""
+        item_hash = self._retry_payloads.pop(item_path, None)
+        if item_hash is None:
+            return None
+        with self._log_lock:
+            error_entry = self.error_store.latest(item_hash)
+        if not error_entry or not error_entry.get("notion_objects") or error_entry.get("content_hash") != content_hash:
+            return None
+        self.metrics.increment("retry_payloads_reused")
+        # JSON 日志中的记录就是内存中的对象，上传时会修改块，需要复制
+        return copy.deepcopy(error_entry["notion_objects"])
+
+    def convert_markdown_content(self, md_content, content_hash):
+        """转换 Markdown 文本，开启 conversion_cache 时先查缓存，耗时计入 convert 阶段"""
+        with self.metrics.phase("convert"):
+            return convert_markdown_content(
+                md_content, content_hash, self.options["upload_local_images"], self.options["resolve_links"],
+                self.conversion_cache
+            )
+
+    def resolve_media(self, notion_objects, item_path):
+        """上传块中引用的本地图片并替换为 file_upload 图片块，返回用到的 file_upload ID"""
+        if self.media is None:
+            return []
+        with self.metrics.phase("media"):
+            return self.media.resolve(notion_objects, os.path.dirname(item_path))
+
+    def collect_links(self, notion_objects, offset=0):
+        """收集并移除块中跨文件链接的标记，返回待第二遍解析的链接记录"""
+        if self.link_resolver is None:
+            return []
+        return collect_local_links(notion_objects, offset)
+
+    def register_page(self, item_path, page_id, item_hash, links=None):
+        """登记 Markdown 文件对应的页面，供跨文件链接查找；links 为该页面待解析的链接"""
+        if self.link_resolver is None:
+            return
+        self.link_resolver.index.register(item_path, page_id)
+        self.link_resolver.add_page(page_id, item_path, item_hash, links)
+
+    def is_file_changed(self, item_path, item_hash):
+        """判断已上传的文件是否有变化：先比较大小和修改时间，不同时再比较内容哈希
+
+        旧版本的日志没有这些字段，上传后没有修改过的文件视为没变，并补记文件信息。
+        """
+        log_entry = self.get_latest_log(item_hash)
+        entry = self.get_manifest_entry(item_path)
+        if log_entry.get("size") == entry.size and log_entry.get("mtime") == entry.mtime:
+            return False
+
+        legacy = "content_hash" not in log_entry
+        if legacy and is_modified_after_upload(log_entry, entry.mtime):
+            return True
+        _, file_info = self.read_markdown_file(item_path)
+        if not legacy and file_info["content_hash"] != log_entry["content_hash"]:
+            return True
+
+        # 内容没变，只是修改时间变了（或旧日志缺少文件信息）：记录新的文件信息，下次不用再计算哈希
+        self.add_log_entry(item_hash, self.create_log_entry(
+            item_path, log_entry["parent_page_id"], log_entry["page_id"], log_entry["title"],
+            UploadStatus.SUCCESS, {**file_info, **self.page_content_fields(log_entry)}
+        ))
+        return False
 
-    def create_error_entry(self, path, parent_page_id, title, error_msg, notion_objects=None):
-        """创建错误记录"""
+    def page_content_fields(self, log_entry):
+        """沿用日志中与页面内容有关的字段：块索引和待解析的链接"""
+        fields = {"blocks": log_entry.get("blocks")}
+        if log_entry.get("links"):
+            fields["links"] = log_entry["links"]
+        return fields
+
+    def find_renamed_page(self, item_path, parent_page_id):
+        """查找内容相同、位于同一父页面、但原路径已不存在的页面，用于识别重命名"""
+        _, file_info = self.read_markdown_file(item_path)
+        for old_hash, log_entry in self.log_store.find_by_content_hash(file_info["content_hash"]):
+            if (log_entry["status"] == UploadStatus.SUCCESS.value
+                    and log_entry["parent_page_id"] == parent_page_id
+                    and log_entry["path"] != item_path
+                    and not os.path.exists(log_entry["path"])):
+                return old_hash, log_entry
+        return None
+
+    def rename_markdown_item(self, item_path, item, item_hash, parent_page_id, old_hash, old_entry):
+        """文件被重命名时只修改页面标题，不重新上传"""
+        try:
+            page_id = old_entry["page_id"]
+            self.scheduler.call(
+                self.notion.pages.update,
+                page_id=page_id,
+                properties={"title": [{"text": {"content": item}}]}
+            )
+            _, file_info = self.read_markdown_file(item_path)
+            self.add_log_entry(item_hash, self.create_log_entry(
+                item_path, parent_page_id, page_id, item, UploadStatus.SUCCESS,
+                {**file_info, **self.page_content_fields(old_entry)}
+            ))
+            self.register_page(item_path, page_id, item_hash, old_entry.get("links"))
+            self.add_log_entry(old_hash, self.create_log_entry(
+                old_entry["path"], parent_page_id, page_id, old_entry["title"], UploadStatus.MOVED
+            ))
+            console.print(f"【重命名】【文件】{old_entry['path']} -> {item_path}", style="green")
+            self.metrics.increment("items", type="file", result="renamed")
+        except Exception as e:
+            self.handle_upload_error(item_path, item, item_hash, parent_page_id, e, "文件")
+
+    def create_error_entry(self, path, parent_page_id, title, error_msg, notion_objects=None, content_hash=None):
+        """创建错误记录，content_hash 为 notion_objects 对应的文件内容，重试时据此判断能否复用"""
         return {
             "path": path,
             "parent_page_id": parent_page_id,
             "title": title,
             "error": str(error_msg),
             "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "notion_objects": notion_objects
+            "notion_objects": notion_objects,
+            "content_hash": content_hash
         }
 
     def if_continue_when_error(self, stop_when_error):
         if stop_when_error:
-            # 等待用户输入，是否继续 y/n
-            user_input = input("是否继续上传其他文件?(y/n)")
-            if user_input == "y":
-                return True
-            else:
+            # 并发模式下同一时间只提示一次
+            with self._prompt_lock:
+                if self._stopping:
+                    exit("上传中止")
+                # 等待用户输入，是否继续 y/n
+                user_input = input("是否继续上传其他文件?(y/n)")
+                if user_input == "y":
+                    return True
+                self._stopping = True
                 exit("上传中止")
         else:
             return True
 
+    def scan_source_tree(self, folder_path):
+        """扫描一次源目录树，更新目录清单"""
+        with self.metrics.phase("scan"):
+            self.manifest.update(scan_tree(folder_path))
+
+    def get_manifest_entry(self, path):
+        """返回路径对应的清单项，不在清单中时（如上传过程中新建的文件）现场扫描"""
+        entry = self.manifest.get(path)
+        if entry is None:
+            self.scan_source_tree(path)
+            entry = self.manifest[path]
+        return entry
+
     def is_empty_folder(self, folder_path):
-        # 如果里面没有文件夹,也没有 .md 文件，返回 True
-        if not os.listdir(folder_path):
-            return True
-        for item in os.listdir(folder_path):
-            item_path = os.path.join(folder_path, item)
-            if os.path.isdir(item_path):
-                # 递归处理子文件夹
-                if not self.is_empty_folder(item_path):
-                    return False
-            if item.endswith(".md"):
-                return False
-        return True
+        # 如果里面（包括子文件夹）没有 .md 文件，返回 True
+        return not self.get_manifest_entry(folder_path).has_markdown
 
     def copy_to_error_folder(self, item_path):
         # 把出错的文件或者文件夹，拷贝到指定的文件夹中
         error_folder = "error_folder"
-        if not os.path.exists(error_folder):
-            os.makedirs(error_folder)
+        os.makedirs(error_folder, exist_ok=True)
         shutil.copy(item_path, error_folder)
 
 
     def upload_folder_to_notion(self, folder_path, parent_page_id):
+        """上传文件夹到Notion，max_workers > 1 时使用线程池并发上传"""
+        self.scan_source_tree(folder_path)
+        with self.report_progress(folder_path):
+            self.upload_folder_tree(folder_path, parent_page_id)
+
+    def upload_folder_tree(self, folder_path, parent_page_id):
+        """上传已扫描的文件夹，之后处理跨文件链接的第二遍"""
+        self.run_uploads(self.upload_folder_items, folder_path, parent_page_id)
+
+    def run_uploads(self, func, *args):
+        """执行上传任务（子项通过 dispatch 提交），之后处理跨文件链接的第二遍；max_workers > 1 时使用线程池"""
+        if self.options["max_workers"] <= 1 or self._executor is not None:
+            func(*args)
+            self.resolve_pending_links()
+            return
+
+        # 顶层调用：创建线程池，同级文件和互不依赖的子目录并发上传
+        with ThreadPoolExecutor(max_workers=self.options["max_workers"]) as executor:
+            self._executor = executor
+            try:
+                func(*args)
+                self.wait_for_pending_uploads()
+                self.resolve_pending_links()
+            except BaseException:
+                # 出错或用户中止时，取消尚未开始的任务
+                self._stopping = True
+                executor.shutdown(wait=True, cancel_futures=True)
+                raise
+            finally:
+                self._executor = None
+                self._stopping = False
+
+    def upload_shards(self, coordinator_file, folder_path, parent_page_id, logs_dir="shard_logs", worker_id=None,
+                      poll_interval=5):
+        """分片上传：与其他进程（可以在不同机器上）通过协调库分担同一个目录树，直到所有分片结束
+
+        每个分片使用 logs_dir 中自己的日志文件，接手其他进程的分片时从该分片的日志继续。
+        """
+        worker_id = worker_id or default_worker_id()
+        os.makedirs(logs_dir, exist_ok=True)
+        coordinator = ShardCoordinator(coordinator_file, self.options["shard_lease_seconds"])
+        try:
+            with self.metrics.phase("scan"):
+                coordinator.ensure_plan(
+                    folder_path, parent_page_id, self.options["shard_size"], self.options["if_add_empty_folder"]
+                )
+            while True:
+                lease = coordinator.claim(worker_id)
+                if lease is None:
+                    if coordinator.is_finished():
+                        break
+                    # 剩下的分片在等待父页面或其他进程的租约
+                    time.sleep(poll_interval)
+                    continue
+                self.upload_shard(coordinator, lease, logs_dir)
+
+            for status, (shards, files) in sorted(coordinator.status_counts().items()):
+                console.print(f"【分片】{status}：{shards} 个分片，{files} 个文件", style="cyan")
+            for path, error in coordinator.failed_shards():
+                console.print(f"【分片】【失败】{path}：{error}", style="red")
+        finally:
+            coordinator.close()
+
+    def upload_shard(self, coordinator, lease, logs_dir):
+        """上传领取到的分片，期间后台续租"""
+        action = "接手" if lease.reclaimed else "开始"
+        console.print(f"【分片】【{action}】{lease.path}（{lease.files} 个文件）", style="cyan")
+        keeper = LeaseKeeper(coordinator, lease).start()
+        self._lease_keeper = keeper
+        try:
+            log_name = os.path.join(logs_dir, f"shard_{lease.seq:06d}")
+            self.open_log_files(f"{log_name}_logs.json", f"{log_name}_errors.json")
+            # 清单只保留当前分片，进程的内存占用不随已处理的分片增长
+            self.manifest = {}
+            page_id = lease.page_id
+            if page_id is None:
+                page_id = self.upload_shard_folder_page(lease)
+                coordinator.set_page(lease, page_id)
+            if lease.recursive:
+                self.scan_source_tree(lease.path)
+            else:
+                # 子文件夹是单独的分片
+                with self.metrics.phase("scan"):
+                    self.manifest.update(scan_folder_files(lease.path))
+            with self.report_progress(lease.path):
+                self.upload_folder_tree(lease.path, page_id)
+            failed_items = sum(1 for _ in self.log_store.iter_latest(UploadStatus.FAILED.value))
+            keeper.check()
+        except LeaseLostError:
+            self.abandon_shard(lease)
+            return
+        except Exception as e:
+            coordinator.fail(lease, e)
+            console.print(f"【分片】【错误】{lease.path}：{e}", style="red")
+            self.metrics.increment("shards", result="failed")
+            return
+        finally:
+            keeper.stop()
+            self._lease_keeper = None
+
+        if not coordinator.complete(lease, failed_items):
+            self.abandon_shard(lease)
+            return
+        console.print(f"【分片】【完成】{lease.path}（失败 {failed_items} 项）", style="cyan")
+        self.metrics.increment("shards", result="done")
+
+    def abandon_shard(self, lease):
+        """租约过期后被其他进程接手：放弃分片日志（不再写入），由对方记录分片的结果"""
+        with self._log_lock:
+            self.log_store.abandon()
+            self.error_store.abandon()
+        console.print(f"【分片】【租约失效】{lease.path}", style="yellow")
+        self.metrics.increment("shards", result="lost")
+
+    def upload_shard_folder_page(self, lease):
+        """创建分片文件夹对应的页面（已创建过时从分片日志中读取），返回页面ID"""
+        item = os.path.basename(lease.path)
+        item_hash = self.generate_item_hash(lease.path, lease.parent_page_id)
+        page_id = self.get_uploaded_page_id(item_hash)
+        if page_id is None:
+            page_id = self.create_folder_page(lease.path, item, item_hash, lease.parent_page_id)
+        if page_id is None:
+            raise RuntimeError(f"文件夹页面创建失败：{lease.path}")
+        return page_id
+
+    def plan_upload(self, folder_path, parent_page_id):
+        """预演上传：返回需要新建、更新和跳过的项以及请求数、耗时估算，不发送任何请求"""
+        return UploadPlanner(self).plan(folder_path, parent_page_id)
+
+    def dispatch(self, func, *args):
+        """在线程池中执行任务，未开启并发时直接执行"""
+        self.check_lease(start_work=True)
+        if self._executor is None:
+            func(*args)
+            return
+        if self._stopping:
+            return
+        future = self._executor.submit(func, *args)
+        with self._futures_lock:
+            self._futures.append(future)
+
+    def wait_for_pending_uploads(self):
+        """等待所有已提交的任务完成（任务执行中可能继续提交子任务）"""
+        while True:
+            with self._futures_lock:
+                futures, self._futures = self._futures, []
+            if not futures:
+                return
+            for future in futures:
+                # 子任务中的异常（包括用户中止）在这里抛出
+                future.result()
+
+    def upload_folder_items(self, folder_path, parent_page_id):
+        """遍历文件夹的直接子项，逐个（或并发）上传"""
 
         # 如果 if_add_empty_folder = False 且 当前文件夹为空，跳过
         if not self.options["if_add_empty_folder"] and self.is_empty_folder(folder_path):
             console.print(f"【跳过】【空文件夹】{folder_path}", style="blue")
+            self.metrics.increment("items", type="folder", result="skipped")
             return
 
-        """上传文件夹到Notion，包含增强的日志功能"""
-        for item in os.listdir(folder_path):
-            item_path = os.path.join(folder_path, item)
-            item_hash = self.generate_item_hash(item_path, parent_page_id)
-
-            # 如果 已经上传过 则跳过
-            if item_hash in self.logs and self.logs[item_hash]["latest_status"] == UploadStatus.SUCCESS.value:
-                if os.path.isdir(item_path):
-                    console.print(f"【跳过】【文件夹】{item_path}", style="yellow")
-                    # 递归处理子文件夹
-                    page_id = self.logs[item_hash]["logs"][-1]["page_id"]
-                    self.upload_folder_to_notion(item_path, page_id)
-                else:
-                    console.print(f"【跳过】【文件】{item_path}", style="yellow")
-                continue
+        item_paths = self.get_manifest_entry(folder_path).children
+        if self.pipeline is not None:
+            self.prefetch_conversions(item_paths, parent_page_id)
+
+        for item_path in item_paths:
+            self.dispatch(self.upload_item, item_path, parent_page_id)
+
+    def prefetch_conversions(self, item_paths, parent_page_id):
+        """提前转换文件夹中尚未上传的 Markdown 文件"""
+        self.pipeline.prefetch([
+            item_path for item_path in item_paths
+            if item_path.endswith(".md") and not self.get_manifest_entry(item_path).is_dir
+            and not self.is_large_markdown_file(item_path)
+            and self.get_uploaded_page_id(self.generate_item_hash(item_path, parent_page_id)) is None
+        ])
+
+    def upload_item(self, item_path, parent_page_id):
+        """上传单个文件或文件夹，包含增强的日志功能"""
+        self.check_lease(start_work=True)
+        item = os.path.basename(item_path)
+        item_hash = self.generate_item_hash(item_path, parent_page_id)
+        is_dir = self.get_manifest_entry(item_path).is_dir
 
-            if os.path.isdir(item_path):
-                # 如果 if_add_empty_folder = False 且 当前文件夹为空，跳过
-                if not self.options["if_add_empty_folder"] and self.is_empty_folder(item_path):
-                    console.print(f"【跳过】【空文件夹】{item_path}", style="blue")
+        # 如果 已经上传过 则跳过
+        page_id = self.get_uploaded_page_id(item_hash)
+        if page_id is not None:
+            if is_dir:
+                console.print(f"【跳过】【文件夹】{item_path}", style="yellow")
+                self.metrics.increment("items", type="folder", result="skipped")
+                # 递归处理子文件夹
+                self.upload_folder_items(item_path, page_id)
+            elif self.options["incremental_sync"] and item.endswith(".md") and self.is_file_changed(item_path, item_hash):
+                # 内容有变化，原地更新页面
+                self.upload_markdown_item(item_path, item, item_hash, parent_page_id, page_id)
+            else:
+                if item.endswith(".md"):
+                    # 上次没能解析的链接在这次的第二遍中重试
+                    self.register_page(item_path, page_id, item_hash, self.get_latest_log(item_hash).get("links"))
+                console.print(f"【跳过】【文件】{item_path}", style="yellow")
+                self.metrics.increment("items", type="file", result="skipped")
+            return
+
+        if is_dir:
+            self.upload_directory_item(item_path, item, item_hash, parent_page_id)
+        elif item.endswith(".md"):
+            try:
+                page_id = None
+                latest_log = self.get_latest_log(item_hash)
+                if latest_log and PageCheckpoint.from_log(latest_log, item_hash) is not None:
+                    # 上次分块上传到一半中断：继续写入已创建的页面，不重新创建
+                    page_id = latest_log["page_id"]
+                elif self.options["incremental_sync"]:
+                    # 上次更新页面失败时，继续更新原页面，避免重复创建
+                    page_id = self.get_existing_page_id(item_hash)
+                    if page_id is None:
+                        renamed = self.find_renamed_page(item_path, parent_page_id)
+                        if renamed:
+                            self.rename_markdown_item(item_path, item, item_hash, parent_page_id, *renamed)
+                            return
+                self.upload_markdown_item(item_path, item, item_hash, parent_page_id, page_id)
+            finally:
+                if self.pipeline is not None:
+                    # 重命名、出错等没有取走预取结果的情况，释放占用的名额
+                    self.pipeline.discard(item_path)
+
+    def upload_directory_item(self, item_path, item, item_hash, parent_page_id):
+        """在Notion中创建页面表示文件夹，然后上传其子项"""
+        # 如果 if_add_empty_folder = False 且 当前文件夹为空，跳过
+        if not self.options["if_add_empty_folder"] and self.is_empty_folder(item_path):
+            console.print(f"【跳过】【空文件夹】{item_path}", style="blue")
+            self.metrics.increment("items", type="folder", result="skipped")
+            return
+
+        page_id = self.create_folder_page(item_path, item, item_hash, parent_page_id)
+        # 文件夹页面创建成功后才处理子项（并发模式下子项会提交到线程池）
+        if page_id is not None:
+            self.upload_folder_items(item_path, page_id)
+
+    def create_folder_page(self, item_path, item, item_hash, parent_page_id):
+        """创建文件夹对应的页面，返回页面ID，失败时记录错误并返回 None"""
+        try:
+            # 创建进行中状态的日志
+            log_entry = self.create_log_entry(
+                item_path, parent_page_id, None, item, UploadStatus.IN_PROGRESS
+            )
+            self.add_log_entry(item_hash, log_entry)
+
+            # 在Notion中创建新页面作为文件夹的表示
+            new_page = self.scheduler.call(
+                self.notion.pages.create,
+                parent={"page_id": parent_page_id},
+                properties={"title": [{"text": {"content": item}}]}
+            )
+
+            # 更新成功状态的日志
+            log_entry = self.create_log_entry(
+                item_path, parent_page_id, new_page["id"], item, UploadStatus.SUCCESS
+            )
+            self.add_log_entry(item_hash, log_entry)
+            console.print(f"【成功】【文件夹】{item_path}", style="green")
+            self.metrics.increment("items", type="folder", result="success")
+            return new_page["id"]
+
+        except Exception as e:
+            self.handle_upload_error(item_path, item, item_hash, parent_page_id, e, "文件夹")
+            return None
+
+    def upload_markdown_item(self, item_path, item, item_hash, parent_page_id, page_id=None):
+        """把单个 Markdown 文件上传为 Notion 页面，page_id 不为空时原地更新该页面（或从检查点继续上传）"""
+        notion_objects = None
+        file_info = None
+        # 上次成功上传时记录的块索引，用于按块更新页面
+        old_blocks = None
+        # 上次分块上传中断时的进度
+        checkpoint = None
+        previous_log = self.get_latest_log(item_hash) if page_id else None
+        if previous_log and previous_log["status"] == UploadStatus.SUCCESS.value:
+            old_blocks = previous_log.get("blocks")
+        elif previous_log:
+            checkpoint = PageCheckpoint.from_log(previous_log, item_hash)
+        try:
+            # 记录进行中状态（保留检查点，在这之后中断也能继续）
+            log_entry = self.create_log_entry(
+                item_path, parent_page_id, page_id, item, UploadStatus.IN_PROGRESS,
+                {"checkpoint": checkpoint.to_dict()} if checkpoint else None
+            )
+            self.add_log_entry(item_hash, log_entry)
+
+            if (page_id is None or checkpoint is not None) and self.is_large_markdown_file(item_path):
+                # 大文件按段转换，边转换边上传
+                if checkpoint is None:
+                    checkpoint = PageCheckpoint(item_path, item, item_hash, parent_page_id)
+                resumed = checkpoint.page_id is not None
+                self.restart_checkpoint(checkpoint, hash_markdown_file(item_path))
+                page_id, file_info, blocks, media_ids, links = self.stream_markdown_page(item_path, checkpoint)
+                if page_id is None:
+                    console.print(f"【跳过】【空文件】{item_path}", style="blue")
+                    self.metrics.increment("items", type="file", result="skipped")
+                    return
+                if self.media is not None:
+                    self.media.mark_attached(media_ids)
+                log_entry = self.create_log_entry(
+                    item_path, parent_page_id, page_id, item, UploadStatus.SUCCESS,
+                    {**file_info, "blocks": blocks, **({"links": links} if links else {})}
+                )
+                self.add_log_entry(item_hash, log_entry)
+                self.register_page(item_path, page_id, item_hash, links)
+                console.print(f"【{'续传' if resumed else '成功'}】【文件】{item_path}", style="green")
+                self.metrics.increment("items", type="file", result="success")
+                return
+
+            # 读取并转换Markdown文件内容
+            is_empty, file_info, notion_objects = self.convert_markdown_item(item_path)
+
+            # 如果 if_add_empty_page = False 且 当前文件为空，跳过
+            if not self.options["if_add_empty_page"] and is_empty:
+                console.print(f"【跳过】【空文件】{item_path}", style="blue")
+                self.metrics.increment("items", type="file", result="skipped")
+                return
+
+            media_ids = self.resolve_media(notion_objects, item_path)
+            links = self.collect_links(notion_objects)
+            sent_objects = notion_objects
+            if page_id is None:
+                checkpoint = PageCheckpoint(item_path, item, item_hash, parent_page_id, file_info["content_hash"])
+                page_id = self.create_markdown_page(parent_page_id, item, notion_objects, checkpoint)["id"]
+                blocks = index_blocks(notion_objects)
+                action, result = "成功", "success"
+            elif checkpoint is not None:
+                self.restart_checkpoint(checkpoint, file_info["content_hash"])
+                sent_objects = notion_objects[checkpoint.blocks:]
+                self.resume_page_content(checkpoint, notion_objects)
+                blocks = index_blocks(notion_objects)
+                action, result = "续传", "success"
+            else:
+                blocks = self.update_page_content(page_id, notion_objects, old_blocks)
+                action, result = "更新", "updated"
+            if self.media is not None:
+                self.media.mark_attached(media_ids)
+
+            # 更新成功状态
+            log_entry = self.create_log_entry(
+                item_path, parent_page_id, page_id, item, UploadStatus.SUCCESS,
+                {**file_info, "blocks": blocks, **({"links": links} if links else {})}
+            )
+            self.add_log_entry(item_hash, log_entry)
+            self.register_page(item_path, page_id, item_hash, links)
+            console.print(f"【{action}】【文件】{item_path}", style="green")
+            self.metrics.increment("items", type="file", result=result)
+            self.metrics.increment("blocks", count_blocks(sent_objects))
+
+        except Exception as e:
+            if checkpoint is not None and checkpoint.page_id is not None:
+                # 页面已创建：保留页面ID和已发送的进度，下次从这里继续
+                page_id, checkpoint = checkpoint.page_id, checkpoint.to_dict()
+            else:
+                checkpoint = None
+            self.handle_upload_error(
+                item_path, item, item_hash, parent_page_id, e, "文件", notion_objects, page_id, checkpoint,
+                file_info["content_hash"] if file_info and notion_objects is not None else None
+            )
+
+    def save_checkpoint(self, checkpoint):
+        """把分块上传的进度写入日志（进行中状态）"""
+        log_entry = self.create_log_entry(
+            checkpoint.path, checkpoint.parent_page_id, checkpoint.page_id, checkpoint.title,
+            UploadStatus.IN_PROGRESS, {"checkpoint": checkpoint.to_dict()}
+        )
+        self.add_log_entry(checkpoint.item_hash, log_entry)
+
+    def restart_checkpoint(self, checkpoint, content_hash):
+        """文件内容与检查点记录的不一致时，清空已创建的页面，之后从第一块重新发送"""
+        if checkpoint.content_hash == content_hash:
+            return
+        if checkpoint.page_id is not None:
+            self.clear_page(checkpoint.page_id)
+        checkpoint.restart(content_hash)
+        if checkpoint.page_id is not None:
+            self.save_checkpoint(checkpoint)
+
+    def finish_deferred_batch(self, checkpoint, batch_objects):
+        """补写中断时还没写完的子块，batch_objects 为检查点中 deferred_ids 对应的块"""
+        _, deferred = batch_blocks(batch_objects)[0]
+        self.append_deferred_children(checkpoint.deferred_ids, deferred, checkpoint)
+        checkpoint.batch_sent(len(batch_objects))
+        self.save_checkpoint(checkpoint)
+
+    def resume_page_content(self, checkpoint, notion_objects):
+        """从检查点继续写入页面：先补写未完成的子块，再把剩余的块追加到页面末尾"""
+        if checkpoint.deferred_ids:
+            self.finish_deferred_batch(
+                checkpoint, notion_objects[checkpoint.blocks:checkpoint.blocks + len(checkpoint.deferred_ids)]
+            )
+        self.append_batches(checkpoint.page_id, batch_blocks(notion_objects[checkpoint.blocks:]), checkpoint=checkpoint)
+        self.metrics.increment("checkpoint_resumes")
+
+    def create_markdown_page(self, parent_page_id, title, notion_objects, checkpoint=None):
+        """创建页面并写入转换后的 Notion 块"""
+        return self.create_page_with_batches(parent_page_id, title, batch_blocks(notion_objects), checkpoint)
+
+    def create_page_with_batches(self, parent_page_id, title, batches, checkpoint=None):
+        """用 batch_blocks 打包好的第一批块创建页面，其余批次依次追加
+
+        checkpoint 不为空时，页面创建后以及每发送完一批块都记录进度。
+        """
+        payload, deferred = batches[0] if batches else ([], [])
+        new_page = self.scheduler.call(
+            self.notion.pages.create,
+            parent={"page_id": parent_page_id},
+            properties={"title": [{"text": {"content": title}}]},
+            children=payload
+        )
+        if checkpoint is not None:
+            checkpoint.page_id = new_page["id"]
+        if deferred:
+            # 嵌套过深或放不下的子块在页面创建后补写，创建页面的响应中没有块ID，需要读取一次
+            block_ids = self.list_child_block_ids(new_page["id"])
+            if checkpoint is not None:
+                checkpoint.start_deferred(block_ids)
+                self.save_checkpoint(checkpoint)
+            self.append_deferred_children(block_ids, deferred, checkpoint)
+        if checkpoint is not None:
+            checkpoint.batch_sent(len(payload))
+            self.save_checkpoint(checkpoint)
+        self.append_batches(new_page["id"], batches[1:], checkpoint=checkpoint)
+        return new_page
+
+    def is_large_markdown_file(self, item_path):
+        """文件大小超过 stream_threshold 时使用流式上传"""
+        threshold = self.options["stream_threshold"]
+        return threshold > 0 and self.get_manifest_entry(item_path).size > threshold
+
+    def stream_markdown_page(self, item_path, checkpoint):
+        """边读取边转换大文件：第一批块随页面一起创建，之后每装满一批追加一次
+
+        每发送完一批块更新检查点；从检查点继续时，已发送的块只转换不发送，之后的块追加到原页面。
+        返回 (页面ID, 文件信息, 块索引, 用到的 file_upload ID, 待解析的链接)；文件为空且不添加空页面时页面ID为 None。
+        """
+        stat = os.stat(item_path)
+        content_hash = hashlib.sha256()
+        blocks = []
+        pending = []
+        media_ids = []
+        links = []
+        block_count = 0
+        emitted = 0
+        # 检查点之前已经发送的块，以及已追加但子块没补写完的块
+        skipped = []
+        unfinished = []
+        sent_blocks = checkpoint.blocks
+        deferred_count = len(checkpoint.deferred_ids or [])
+        with open(item_path, "r", encoding="utf-8") as md_file:
+            # 读取和转换交替进行，一起计入 stream_convert 阶段
+            for block in self.metrics.time_iterator(iter_notion_blocks(
+                    hash_lines(md_file, content_hash),
+                    local_images=self.options["upload_local_images"],
+                    local_links=self.options["resolve_links"]), "stream_convert"):
+                links.extend(self.collect_links([block], block_count))
+                block_count += 1
+                if block_count <= sent_blocks:
+                    skipped.append(block)
+                    if block_count == sent_blocks:
+                        # 本地图片换成上传后的块，块索引与页面中的内容一致（已上传的图片不会重复上传）
+                        media_ids.extend(self.resolve_media(skipped, item_path))
+                        blocks.extend(index_blocks(skipped))
+                        skipped = []
+                    continue
+                if len(unfinished) < deferred_count:
+                    unfinished.append(block)
+                    if len(unfinished) == deferred_count:
+                        media_ids.extend(self.resolve_media(unfinished, item_path))
+                        blocks.extend(index_blocks(unfinished, checkpoint.deferred_ids))
+                        self.finish_deferred_batch(checkpoint, unfinished)
                     continue
+                emitted += count_blocks([block])
+                pending.append(block)
+                if len(pending) < 2 * MAX_CHILDREN:
+                    continue
+                # 已替换过的块不含本地图片，重复调用不会再次上传
+                media_ids.extend(self.resolve_media(pending, item_path))
+                # 最后一批可能还没装满，留到和后面的块一起打包
+                sent = self.send_stream_batches(checkpoint, pending, batch_blocks(pending)[:-1], blocks)
+                pending = pending[sent:]
+
+        media_ids.extend(self.resolve_media(pending, item_path))
+        batches = batch_blocks(pending)
+        if checkpoint.page_id is None and not batches:
+            if not self.options["if_add_empty_page"]:
+                return None, None, None, [], []
+            batches = [([], [])]
+        self.send_stream_batches(checkpoint, pending, batches, blocks)
+        if sent_blocks:
+            self.metrics.increment("checkpoint_resumes")
+        self.metrics.increment("blocks", emitted)
 
-                try:
-                    # 创建进行中状态的日志
-                    log_entry = self.create_log_entry(
-                        item_path, parent_page_id, None, item, UploadStatus.IN_PROGRESS
-                    )
-                    self.add_log_entry(item_hash, log_entry)
-
-                    # 在Notion中创建新页面作为文件夹的表示
-                    new_page = self.notion.pages.create(
-                        parent={"page_id": parent_page_id},
-                        properties={"title": [{"text": {"content": item}}]}
-                    )
-
-                    # 更新成功状态的日志
-                    log_entry = self.create_log_entry(
-                        item_path, parent_page_id, new_page["id"], item, UploadStatus.SUCCESS
-                    )
-                    self.add_log_entry(item_hash, log_entry)
-                    console.print(f"【成功】【文件夹】{item_path}", style="green")
-
-                    # 递归处理子文件夹
-                    self.upload_folder_to_notion(item_path, new_page["id"])
-
-                except Exception as e:
-                    # 记录失败状态
-                    log_entry = self.create_log_entry(
-                        item_path, parent_page_id, None, item, UploadStatus.FAILED
-                    )
-                    self.add_log_entry(item_hash, log_entry)
-
-                    # 记录错误详情
-                    error_entry = self.create_error_entry(
-                        item_path, parent_page_id, item, str(e)
-                    )
-                    self.add_error_entry(item_hash, error_entry)
-                    console.print(f"【错误】【文件夹】{item_path}", style="red")
-                    self.copy_to_error_folder(item_path)
-                    self.if_continue_when_error(self.options["stop_when_error"])
-
-            elif item.endswith(".md"):
-                try:
-                    # 记录进行中状态
-                    log_entry = self.create_log_entry(
-                        item_path, parent_page_id, None, item, UploadStatus.IN_PROGRESS
-                    )
-                    self.add_log_entry(item_hash, log_entry)
-
-                    # 读取Markdown文件内容
-                    with open(item_path, "r", encoding="utf-8") as md_file:
-                        md_content = md_file.read()
-
-                    # 如果 if_add_empty_page = False 且 当前文件为空，跳过
-                    if not self.options["if_add_empty_page"] and md_content.strip() == "":
-                        console.print(f"【跳过】【空文件】{item_path}", style="blue")
-                        continue
-
-                    notion_objects = markdown_element_to_notion_object(md_content)
-
-                    if len(notion_objects) <= 100:
-                        new_page = self.notion.pages.create(
-                            parent={"page_id": parent_page_id},
-                            properties={"title": [{"text": {"content": item}}]},
-                            children=notion_objects
-                        )
-                    else:
-                        # body.children.length should be ≤ `100`，一次上传不超过100个对象，超过100分批次上传
-                        # 将 notion_objects 分为多个列表，每个列表长度不超过 100
-                        notion_objects_list = [notion_objects[i:i + 100] for i in range(0, len(notion_objects), 100)]
-
-                        new_page = self.notion.pages.create(
-                            parent={"page_id": parent_page_id},
-                            properties={"title": [{"text": {"content": item}}]}
-                        )
-                        for index, notion_objects_item in enumerate(notion_objects_list):
-                            self.notion.blocks.children.append(
-                                block_id=new_page["id"],
-                                children=notion_objects_item
-                            )
-
-                    # 更新成功状态
-                    log_entry = self.create_log_entry(
-                        item_path, parent_page_id, new_page["id"], item, UploadStatus.SUCCESS
-                    )
-                    self.add_log_entry(item_hash, log_entry)
-                    console.print(f"【成功】【文件】{item_path}", style="green")
-
-                except Exception as e:
-                    # 记录失败状态
-                    log_entry = self.create_log_entry(
-                        item_path, parent_page_id, None, item, UploadStatus.FAILED
-                    )
-                    self.add_log_entry(item_hash, log_entry)
-
-                    # 记录错误详情
-                    error_entry = self.create_error_entry(
-                        item_path, parent_page_id, item, str(e), notion_objects
-                    )
-                    self.add_error_entry(item_hash, error_entry)
-                    console.print(f"【错误】【文件】{item_path}", style="red")
-                    self.copy_to_error_folder(item_path)
-                    self.if_continue_when_error(self.options["stop_when_error"])
+        file_info = {
+            "content_hash": content_hash.hexdigest(),
+            "size": stat.st_size,
+            "mtime": stat.st_mtime
+        }
+        return checkpoint.page_id, file_info, blocks, media_ids, links
+
+    def send_stream_batches(self, checkpoint, notion_objects, batches, blocks):
+        """发送流式上传中打包好的若干批块，页面还不存在时用第一批创建页面
+
+        新块的索引追加到 blocks，返回已发送的块数。
+        """
+        sent = 0
+        for batch in batches:
+            batch_objects = notion_objects[sent:sent + len(batch[0])]
+            sent += len(batch_objects)
+            if checkpoint.page_id is None:
+                self.create_page_with_batches(checkpoint.parent_page_id, checkpoint.title, [batch], checkpoint)
+                blocks.extend(index_blocks(batch_objects))
+            else:
+                block_ids = self.append_batches(checkpoint.page_id, [batch], checkpoint=checkpoint)
+                blocks.extend(index_blocks(batch_objects, block_ids))
+        return sent
+
+    def list_child_block_ids(self, block_id, limit=None):
+        """分页读取块的直接子块ID，limit 不为空时读到至少 limit 个就停止"""
+        block_ids = []
+        start_cursor = None
+        while True:
+            kwargs = {"block_id": block_id, "page_size": 100}
+            if start_cursor:
+                kwargs["start_cursor"] = start_cursor
+            response = self.scheduler.call(self.notion.blocks.children.list, **kwargs)
+            block_ids.extend(block["id"] for block in response["results"])
+            if not response.get("has_more") or (limit is not None and len(block_ids) >= limit):
+                return block_ids
+            start_cursor = response["next_cursor"]
+
+    def append_blocks(self, page_id, notion_objects, after=None):
+        """分批追加块，after 为空时追加到页面末尾，返回新块的ID"""
+        return self.append_batches(page_id, batch_blocks(notion_objects), after)
+
+    def append_batches(self, page_id, batches, after=None, checkpoint=None):
+        """依次发送 batch_blocks 打包好的追加请求，返回新块的ID；checkpoint 不为空时每批发送完记录进度"""
+        block_ids = []
+        for payload, deferred in batches:
+            kwargs = {"block_id": page_id, "children": payload}
+            if after is not None:
+                kwargs["after"] = after
+            response = self.scheduler.call(self.notion.blocks.children.append, **kwargs)
+            batch_ids = [block["id"] for block in response["results"]]
+            if checkpoint is not None and deferred:
+                checkpoint.start_deferred(batch_ids)
+                self.save_checkpoint(checkpoint)
+            self.append_deferred_children(batch_ids, deferred, checkpoint)
+            if checkpoint is not None:
+                checkpoint.batch_sent(len(payload))
+                self.save_checkpoint(checkpoint)
+            block_ids.extend(batch_ids)
+            after = block_ids[-1] if block_ids else after
+        return block_ids
+
+    def append_deferred_children(self, block_ids, deferred, checkpoint=None):
+        """补写一次请求中放不下的子块
+
+        block_ids 为该请求创建的顶层块ID，deferred 为 split_children 返回的 [(块路径, 子块列表)]，
+        逐层读取子块ID找到目标块，再把子块追加到它下面（追加时会继续拆分）。
+        checkpoint 不为空时跳过已补写的项，每补写完一项记录进度。
+        """
+        child_ids = {}
+        for path, children in deferred[checkpoint.deferred_sent if checkpoint else 0:]:
+            block_id = block_ids[path[0]]
+            for index in path[1:]:
+                if block_id not in child_ids:
+                    child_ids[block_id] = self.list_child_block_ids(block_id)
+                block_id = child_ids[block_id][index]
+            self.append_blocks(block_id, children)
+            if checkpoint is not None:
+                checkpoint.deferred_item_sent()
+                self.save_checkpoint(checkpoint)
+
+    def resolve_pending_links(self):
+        """第二遍：把本次写入（或上次没能解析）的跨文件链接改写为页面链接，各页面可以并发处理"""
+        if self.link_resolver is None:
+            return
+        for page_id, (item_path, item_hash, links) in self.link_resolver.pop_pending():
+            self.dispatch(self.resolve_page_links, page_id, item_path, item_hash, links)
+        self.wait_for_pending_uploads()
+
+    def resolve_page_links(self, page_id, item_path, item_hash, links):
+        """只更新含有可解析链接的块；按块路径逐层读取所需的子块ID"""
+        updates, remaining = self.link_resolver.plan_page(item_path, links)
+        if not updates:
+            return
+        try:
+            child_ids = {}
+            for parent, count in required_child_ids(block_path for block_path, _, _ in updates):
+                block_id = page_id if not parent else child_ids[parent[:-1]][parent[-1]]
+                child_ids[parent] = self.list_child_block_ids(block_id, count)
+            for block_path, block_type, rich_text in updates:
+                self.scheduler.call(
+                    self.notion.blocks.update,
+                    block_id=child_ids[tuple(block_path[:-1])][block_path[-1]],
+                    **{block_type: {"rich_text": rich_text}}
+                )
+        except Exception as e:
+            # 页面内容已经上传成功，链接保留原文，下次运行时重试
+            console.print(f"【错误】【链接】{item_path}：{e}", style="red")
+            return
+
+        # 已解析的链接不再记录，只保留仍未解析的部分
+        log_entry = self.get_latest_log(item_hash)
+        if log_entry and log_entry["page_id"] == page_id and log_entry["status"] == UploadStatus.SUCCESS.value:
+            log_entry = {key: value for key, value in log_entry.items() if key != "links"}
+            if remaining:
+                log_entry["links"] = remaining
+            self.add_log_entry(item_hash, log_entry)
+        console.print(f"【链接】【文件】{item_path}", style="green")
+        self.metrics.increment("link_blocks_updated", len(updates))
+
+    def clear_page(self, page_id):
+        """删除页面的所有块"""
+        for block_id in self.list_child_block_ids(page_id):
+            self.scheduler.call(self.notion.blocks.delete, block_id=block_id)
+
+    def replace_page_content(self, page_id, notion_objects):
+        """删除页面原有的块，再写入新的块，返回新的块索引"""
+        self.clear_page(page_id)
+        return index_blocks(notion_objects, self.append_blocks(page_id, notion_objects))
+
+    def update_page_content(self, page_id, notion_objects, old_blocks):
+        """更新页面内容：有上次的块索引时只修改变化的块，否则整页替换"""
+        if not old_blocks or not self.options["block_diff"]:
+            return self.replace_page_content(page_id, notion_objects)
+
+        if any(block[1] is None for block in old_blocks):
+            # 创建页面时不知道块ID，按顺序读取一次
+            block_ids = self.list_child_block_ids(page_id)
+            if len(block_ids) != len(old_blocks):
+                # 页面在 Notion 中被修改过，无法对应，整页替换
+                return self.replace_page_content(page_id, notion_objects)
+            old_blocks = [[block[0], block_id, *block[2:]] for block, block_id in zip(old_blocks, block_ids)]
+
+        return self.patch_page_content(page_id, diff_blocks(old_blocks, notion_objects))
+
+    def patch_page_content(self, page_id, operations):
+        """执行 diff_blocks 生成的操作，返回新的块索引"""
+        blocks = []
+        # 上一个保留下来的块，新块插入在它后面
+        previous_id = None
+        for operation in operations:
+            action, *args = operation
+            if action == "keep":
+                blocks.append(args[0])
+                previous_id = args[0][1]
+            elif action == "update":
+                old_block, new_block = args
+                self.scheduler.call(
+                    self.notion.blocks.update, block_id=old_block[1], **block_update_payload(new_block)
+                )
+                blocks.extend(index_blocks([new_block], [old_block[1]]))
+                previous_id = old_block[1]
+            elif action == "delete":
+                self.scheduler.call(self.notion.blocks.delete, block_id=args[0][1])
+            elif action == "insert":
+                new_blocks = args[0]
+                if previous_id is None:
+                    block_ids = self.insert_blocks_at_start(page_id, new_blocks)
+                else:
+                    block_ids = self.append_blocks(page_id, new_blocks, after=previous_id)
+                blocks.extend(index_blocks(new_blocks, block_ids))
+                previous_id = block_ids[-1]
+        return blocks
+
+    def insert_blocks_at_start(self, page_id, notion_objects):
+        """在页面开头插入块（第一批用 position=start，后续批次接在其后）"""
+        batches = batch_blocks(notion_objects)
+        payload, deferred = batches[0]
+        response = self.scheduler.call(
+            self.notion.blocks.children.append,
+            block_id=page_id,
+            children=payload,
+            position={"type": "start"}
+        )
+        block_ids = [block["id"] for block in response["results"]]
+        self.append_deferred_children(block_ids, deferred)
+        block_ids.extend(self.append_batches(page_id, batches[1:], after=block_ids[-1]))
+        return block_ids
+
+    def handle_upload_error(self, item_path, item, item_hash, parent_page_id, error, item_type,
+                            notion_objects=None, page_id=None, checkpoint=None, content_hash=None):
+        """记录失败状态和错误详情，并按配置决定是否继续"""
+        # 记录失败状态（更新已有页面失败时保留页面ID，下次继续更新而不是重复创建；
+        # 分块上传中断时同时保留检查点，下次从下一批块继续）
+        log_entry = self.create_log_entry(
+            item_path, parent_page_id, page_id, item, UploadStatus.FAILED,
+            {"checkpoint": checkpoint} if checkpoint else None
+        )
+        self.add_log_entry(item_hash, log_entry)
+
+        # 记录错误详情
+        error_entry = self.create_error_entry(
+            item_path, parent_page_id, item, str(error), notion_objects, content_hash
+        )
+        self.add_error_entry(item_hash, error_entry)
+        console.print(f"【错误】【{item_type}】{item_path}", style="red")
+        self.metrics.increment("items", type="folder" if item_type == "文件夹" else "file", result="failed")
+        self.copy_to_error_folder(item_path)
+        self.if_continue_when_error(self.options["stop_when_error"])
 
     def retry_failed_uploads(self):
-        """重试失败的上传"""
-        failed_items = [
-            item_hash for item_hash, data in self.logs.items()
-            if data["latest_status"] == UploadStatus.FAILED.value
-        ]
+        """重试失败的上传：只重新上传失败的项，不重新遍历它们所在的文件夹
 
-        for item_hash in failed_items:
-            path = self.logs[item_hash]["logs"][-1]["path"]
-            parent_page_id = self.logs[item_hash]["logs"][-1]["parent_page_id"]
+        失败项按父页面分组提交，max_workers > 1 时并发重试；文件内容没变时复用错误日志中保存的块。
+        """
+        groups = self.collect_failed_items()
+        if not groups:
+            return
+        self.prepare_retry_payloads(groups)
+        try:
+            self.run_uploads(self.retry_item_groups, groups)
+        finally:
+            self._retry_payloads = {}
 
-            console.print(f"重试上传: {path}", style="yellow")
-            if os.path.exists(path):
-                self.upload_folder_to_notion(os.path.dirname(path), parent_page_id)
+    def collect_failed_items(self):
+        """最新状态为失败、且本地仍然存在的项，按父页面分组 {父页面ID: [(item_hash, 路径)]}"""
+        groups = {}
+        for item_hash, log_entry in list(self.log_store.iter_latest(UploadStatus.FAILED.value)):
+            path = log_entry["path"]
+            if not os.path.exists(path):
+                console.print(f"【跳过】【已删除】{path}", style="blue")
+                continue
+            groups.setdefault(log_entry["parent_page_id"], []).append((item_hash, path))
+        return groups
+
+    def prepare_retry_payloads(self, groups):
+        """登记可以复用错误日志中保存的块的文件"""
+        self._retry_payloads = {}
+        if not self.options["retry_reuse_payload"] or self.options["upload_local_images"] \
+                or self.options["resolve_links"]:
+            return
+        for items in groups.values():
+            for item_hash, path in items:
+                if path.endswith(".md"):
+                    self._retry_payloads[path] = item_hash
+
+    def retry_item_groups(self, groups):
+        """逐组提交重试；每一项单独扫描（文件夹扫描其子树），不重新读取所在的整个文件夹"""
+        for parent_page_id, items in groups.items():
+            paths = [path for _, path in items]
+            for path in paths:
+                # 文件可能在上次运行后改动过，重新读取大小和修改时间
+                self.scan_source_tree(path)
+            if self.pipeline is not None:
+                # 提前转换本组中不能复用已保存的块的文件
+                self.pipeline.prefetch([
+                    path for path in paths
+                    if path.endswith(".md") and not self.get_manifest_entry(path).is_dir
+                    and not self.is_large_markdown_file(path) and path not in self._retry_payloads
+                ])
+            for path in paths:
+                console.print(f"【重试】{path}", style="yellow")
+                self.dispatch(self.upload_item, path, parent_page_id)
 
 
 def main():
@@ -302,14 +1287,61 @@ def main():
     options = {
         "stop_when_error": True,
         "if_add_empty_page": False,
-        "if_add_empty_folder": False
+        "if_add_empty_folder": False,
+        "max_workers": int(os.getenv("MAX_WORKERS", "1")),
+        "requests_per_second": float(os.getenv("REQUESTS_PER_SECOND", "3")),
+        "log_backend": os.getenv("LOG_BACKEND", "json"),
+        "incremental_sync": os.getenv("INCREMENTAL_SYNC", "false").lower() == "true",
+        "conversion_workers": int(os.getenv("CONVERSION_WORKERS", "0")),
+        "conversion_cache": os.getenv("CONVERSION_CACHE", "false").lower() == "true",
+        "conversion_cache_max_mb": float(os.getenv("CONVERSION_CACHE_MAX_MB", "512")),
+        "upload_local_images": os.getenv("UPLOAD_LOCAL_IMAGES", "false").lower() == "true",
+        "media_workers": int(os.getenv("MEDIA_WORKERS", "4")),
+        "resolve_links": os.getenv("RESOLVE_LINKS", "false").lower() == "true",
+        "base_url": os.getenv("NOTION_BASE_URL") or None,
+        "http_max_connections": int(os.getenv("HTTP_MAX_CONNECTIONS", "20")),
+        "http_max_keepalive_connections": int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20")),
+        "http_keepalive_expiry": float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60")),
+        "http2": os.getenv("HTTP2", "false").lower() == "true",
+        "http_timeout": float(os.getenv("HTTP_TIMEOUT", "60")),
+        "http_connect_timeout": float(os.getenv("HTTP_CONNECT_TIMEOUT", "10")),
+        "http_endpoint_timeouts": parse_endpoint_timeouts(os.getenv("HTTP_ENDPOINT_TIMEOUTS")),
+        "shard_size": int(os.getenv("SHARD_SIZE", "1000")),
+        "shard_lease_seconds": float(os.getenv("SHARD_LEASE_SECONDS", "300")),
+        "metrics_file": os.getenv("METRICS_FILE") or None,
+        "prometheus_file": os.getenv("PROMETHEUS_FILE") or None,
+        "progress_interval": float(os.getenv("PROGRESS_INTERVAL", "0"))
     }
 
+    shard_coordinator = os.getenv("SHARD_COORDINATOR")
+    if shard_coordinator:
+        # 多个进程同时运行，不能等待用户输入
+        options["stop_when_error"] = False
+
     uploader = NotionUploader(auth_token, options)
-    uploader.upload_folder_to_notion(markdown_root_folder, notion_root_page_id)
+    try:
+        if shard_coordinator:
+            # 分片上传：每个进程（或机器）运行同样的命令，可以使用各自的 NOTION_AUTH_TOKEN
+            uploader.upload_shards(
+                shard_coordinator, markdown_root_folder, notion_root_page_id,
+                logs_dir=os.getenv("SHARD_LOGS_DIR", "shard_logs"), worker_id=os.getenv("SHARD_WORKER_ID") or None
+            )
+            return
+
+        if os.getenv("DRY_RUN", "false").lower() == "true":
+            # 只输出上传计划，不上传
+            plan = uploader.plan_upload(markdown_root_folder, notion_root_page_id)
+            print_plan(plan)
+            if os.getenv("PLAN_FILE"):
+                save_plan(plan, os.getenv("PLAN_FILE"))
+            return
+
+        uploader.upload_folder_to_notion(markdown_root_folder, notion_root_page_id)
 
-    # 如果需要重试失败的上传，取消下面的注释
-    # uploader.retry_failed_uploads()
+        # 如果需要重试失败的上传，取消下面的注释
+        # uploader.retry_failed_uploads()
+    finally:
+        uploader.close()
 
 
 if __name__ == "__main__":
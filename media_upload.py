@@ -0,0 +1,248 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import mimetypes
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# 单次上传（single_part）允许的最大文件大小
+MAX_SINGLE_PART_BYTES = 20 * 1024 * 1024
+# 上传后未被任何块引用的文件会在 1 小时后过期，留出余量
+UNATTACHED_TTL_SECONDS = 50 * 60
+
+
+def iter_local_images(notion_objects):
+    """遍历块（含子块）中待上传的本地图片，产出 (所在列表, 下标, 块)"""
+    for index, block in enumerate(notion_objects):
+        content = block.get(block["type"])
+        if block["type"] == "image" and content.get("type") == "local_file":
+            yield notion_objects, index, block
+        elif isinstance(content, dict) and content.get("children"):
+            yield from iter_local_images(content["children"])
+
+
+# Notion 单个 rich_text 的最大长度
+MAX_CAPTION_LENGTH = 2000
+
+
+def image_caption(local_file):
+    """图片的说明文字：优先使用 Markdown 中的 title，其次是 alt 文本"""
+    return local_file.get("title") or local_file["caption"]
+
+
+def image_block(file_upload_id, caption=""):
+    block = {
+        "type": "image",
+        "image": {
+            "type": "file_upload",
+            "file_upload": {"id": file_upload_id}
+        }
+    }
+    if caption:
+        block["image"]["caption"] = [{"type": "text", "text": {"content": caption[:MAX_CAPTION_LENGTH]}}]
+    return block
+
+
+def fallback_block(local_file):
+    """无法上传的图片保留为文本"""
+    return {
+        "type": "paragraph",
+        "paragraph": {
+            "rich_text": [{
+                "type": "text",
+                "text": {"content": f"![{local_file['caption']}]({local_file['path']})"}
+            }]
+        }
+    }
+
+
+def hash_file(path):
+    content_hash = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            content_hash.update(chunk)
+    return content_hash.hexdigest()
+
+
+class NotionFileBackend:
+    """通过 Notion 的 file_uploads 接口上传文件"""
+
+    def __init__(self, notion, scheduler):
+        self.notion = notion
+        self.scheduler = scheduler
+
+    def upload(self, path, filename, content_type):
+        """上传文件，返回 file_upload ID"""
+        with open(path, "rb") as f:
+            # 读入内存，请求重试时可以重新发送
+            data = f.read()
+        file_upload = self.scheduler.call(
+            self.notion.file_uploads.create,
+            mode="single_part",
+            filename=filename,
+            content_type=content_type
+        )
+        self.scheduler.call(
+            self.notion.file_uploads.send,
+            file_upload_id=file_upload["id"],
+            file=(filename, data, content_type)
+        )
+        return file_upload["id"]
+
+
+class LocalFileBackend:
+    """本地替身：把文件复制到本地文件夹，返回基于内容哈希的 ID，用于测试和离线演练"""
+
+    def __init__(self, folder="local_uploads"):
+        self.folder = folder
+        self.uploads = 0
+        self._lock = threading.Lock()
+
+    def upload(self, path, filename, content_type):
+        content_hash = hash_file(path)
+        os.makedirs(self.folder, exist_ok=True)
+        shutil.copyfile(path, os.path.join(self.folder, content_hash + os.path.splitext(filename)[1]))
+        with self._lock:
+            self.uploads += 1
+        return f"local-{content_hash[:32]}"
+
+
+class MediaUploader:
+    """上传 Markdown 引用的本地图片
+
+    相同内容的文件（按 SHA-256）只上传一次，上传在线程池中并行执行；
+    内容哈希到 file_upload ID 的对应关系追加写入 cache_file（JSON Lines），跨次运行复用。
+    Notion 会删除 1 小时内没有被引用的上传文件，因此只有已经写入页面的 ID 会长期复用。
+    """
+
+    def __init__(self, backend, cache_file="media_cache.jsonl", workers=4):
+        self.backend = backend
+        self.cache_file = cache_file
+        # 内容哈希 -> {"id", "filename", "size", "uploaded_at", "attached"}
+        self.cache = self.load_cache()
+        self._hash_by_id = {entry["id"]: content_hash for content_hash, entry in self.cache.items()}
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        # 正在上传的文件：内容哈希 -> Future，并发的页面引用同一文件时共用一次上传
+        self._uploads = {}
+        # 路径 -> (大小, 修改时间, 内容哈希)，同一文件被多个页面引用时不重复计算哈希
+        self._hashes = {}
+        self._lock = threading.Lock()
+
+    def load_cache(self):
+        cache = {}
+        if not os.path.exists(self.cache_file):
+            return cache
+        with open(self.cache_file, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                cache.setdefault(record.pop("hash"), {}).update(record)
+        return cache
+
+    def append_cache(self, record):
+        # 调用方需持有锁
+        with open(self.cache_file, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def get_content_hash(self, path):
+        stat = os.stat(path)
+        with self._lock:
+            cached = self._hashes.get(path)
+        if cached and cached[:2] == (stat.st_size, stat.st_mtime):
+            return cached[2], stat.st_size
+        content_hash = hash_file(path)
+        with self._lock:
+            self._hashes[path] = (stat.st_size, stat.st_mtime, content_hash)
+        return content_hash, stat.st_size
+
+    def get_cached_id(self, content_hash):
+        # 调用方需持有锁；未被引用且快要过期的上传不再复用
+        entry = self.cache.get(content_hash)
+        if entry is None:
+            return None
+        if not entry.get("attached") and time.time() - entry["uploaded_at"] > UNATTACHED_TTL_SECONDS:
+            return None
+        return entry["id"]
+
+    def lookup(self, path):
+        """返回文件已上传、可以直接复用的 file_upload ID，没有时返回 None"""
+        content_hash, _ = self.get_content_hash(path)
+        with self._lock:
+            return self.get_cached_id(content_hash)
+
+    def request_upload(self, path):
+        """返回结果为 file_upload ID 的 Future；文件不存在或超过大小限制时结果为 None"""
+        future = Future()
+        try:
+            content_hash, size = self.get_content_hash(path)
+        except OSError:
+            future.set_result(None)
+            return future
+        if size > MAX_SINGLE_PART_BYTES:
+            future.set_result(None)
+            return future
+
+        with self._lock:
+            file_upload_id = self.get_cached_id(content_hash)
+            if file_upload_id is not None:
+                future.set_result(file_upload_id)
+                return future
+            future = self._uploads.get(content_hash)
+            if future is None:
+                future = self.executor.submit(self.upload_file, path, content_hash, size)
+                self._uploads[content_hash] = future
+        return future
+
+    def upload_file(self, path, content_hash, size):
+        try:
+            filename = os.path.basename(path)
+            content_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+            file_upload_id = self.backend.upload(path, filename, content_type)
+            record = {"id": file_upload_id, "filename": filename, "size": size, "uploaded_at": time.time()}
+            with self._lock:
+                self.cache[content_hash] = dict(record)
+                self._hash_by_id[file_upload_id] = content_hash
+                self.append_cache({"hash": content_hash, **record})
+            return file_upload_id
+        finally:
+            with self._lock:
+                self._uploads.pop(content_hash, None)
+
+    def resolve(self, notion_objects, base_dir):
+        """把块中的本地图片上传并替换为 file_upload 图片块（原地修改），返回用到的 file_upload ID
+
+        图片路径相对于 base_dir（Markdown 文件所在的文件夹），无法上传的图片保留为文本。
+        """
+        images = list(iter_local_images(notion_objects))
+        futures = {}
+        for _, _, block in images:
+            path = os.path.normpath(os.path.join(base_dir, block["image"]["local_file"]["path"]))
+            if path not in futures:
+                futures[path] = self.request_upload(path)
+
+        file_upload_ids = []
+        for container, index, block in images:
+            local_file = block["image"]["local_file"]
+            file_upload_id = futures[os.path.normpath(os.path.join(base_dir, local_file["path"]))].result()
+            if file_upload_id is None:
+                container[index] = fallback_block(local_file)
+            else:
+                container[index] = image_block(file_upload_id, image_caption(local_file))
+                file_upload_ids.append(file_upload_id)
+        return file_upload_ids
+
+    def mark_attached(self, file_upload_ids):
+        """页面写入成功后调用：这些上传已被引用，不会过期，之后可以一直复用"""
+        with self._lock:
+            for file_upload_id in set(file_upload_ids):
+                content_hash = self._hash_by_id.get(file_upload_id)
+                entry = self.cache.get(content_hash)
+                if entry is not None and not entry.get("attached"):
+                    entry["attached"] = True
+                    self.append_cache({"hash": content_hash, "attached": True})
+
+    def close(self):
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,309 @@
+import os
+import re
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+from http_transport import request_endpoint
+
+# 各阶段归入的瓶颈类型，用于判断一次运行主要受 API、磁盘还是转换限制
+PHASE_GROUPS = {
+    "api": ("api_request", "rate_limit_wait", "retry_backoff"),
+    "disk": ("scan", "read", "log_write"),
+    "conversion": ("convert", "conversion_wait", "stream_convert"),
+}
+# 端点类名 -> 请求名（与 upload_plan 中的请求名一致），其余按类名转换，如 FileUploadsEndpoint -> file_uploads
+ENDPOINT_RESOURCES = {"BlocksChildren": "blocks.children"}
+
+
+def endpoint_name(func):
+    """SDK 方法对应的请求名，如 notion.blocks.children.append -> blocks.children.append"""
+    owner = getattr(func, "__self__", None)
+    name = getattr(func, "__name__", "call")
+    if owner is None:
+        return name
+    resource = type(owner).__name__.removesuffix("Endpoint")
+    resource = ENDPOINT_RESOURCES.get(resource) or re.sub(r'(?<!^)(?=[A-Z])', '_', resource).lower()
+    return f"{resource}.{name}"
+
+
+def retry_reason(error):
+    """重试原因：HTTP 状态码，或超时、连接错误等异常的类名"""
+    status = getattr(error, "status", None)
+    return str(status) if status is not None else type(error).__name__
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{escape_label(value)}"' for key, value in labels) + "}"
+
+
+class RunMetrics:
+    """一次上传运行的指标：按阶段计时和计数，线程安全
+
+    计时器和计数器都按 (名称, 标签) 分组，例如计时器 ("phase", {"phase": "convert"})、
+    ("api_request", {"endpoint": "pages.create"})，计数器 ("retries", {"endpoint", "reason"})。
+    多个线程同时计时时，各阶段的耗时之和可以超过运行时间。
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        # (名称, 标签) -> [次数, 总耗时, 最大耗时]
+        self.timers = {}
+        # (名称, 标签) -> 值
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def elapsed(self):
+        return time.perf_counter() - self._start
+
+    def observe(self, name, seconds, **labels):
+        key = self.key(name, labels)
+        with self._lock:
+            timer = self.timers.get(key)
+            if timer is None:
+                self.timers[key] = [1, seconds, seconds]
+            else:
+                timer[0] += 1
+                timer[1] += seconds
+                timer[2] = max(timer[2], seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def phase(self, phase):
+        """阶段计时，等同于 timer("phase", phase=phase)"""
+        return self.timer("phase", phase=phase)
+
+    def time_iterator(self, iterable, phase):
+        """逐项计时地遍历 iterable（用于边读取边转换的生成器），耗时计入 phase 阶段"""
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.observe("phase", time.perf_counter() - start, phase=phase)
+            yield item
+
+    def increment(self, name, value=1, **labels):
+        key = self.key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def total(self, name, **labels):
+        """名称为 name、标签包含 labels 的计数器之和"""
+        wanted = set(labels.items())
+        with self._lock:
+            return sum(value for (key_name, key_labels), value in self.counters.items()
+                       if key_name == name and wanted <= set(key_labels))
+
+    def timer_total(self, name, **labels):
+        """名称为 name、标签包含 labels 的计时器的 (次数, 总耗时)"""
+        wanted = set(labels.items())
+        count = seconds = 0
+        with self._lock:
+            for (key_name, key_labels), timer in self.timers.items():
+                if key_name == name and wanted <= set(key_labels):
+                    count += timer[0]
+                    seconds += timer[1]
+        return count, seconds
+
+    def group_seconds(self):
+        """各瓶颈类型（api、disk、conversion）的累计耗时"""
+        seconds = {}
+        for group, phases in PHASE_GROUPS.items():
+            total = 0.0
+            for phase in phases:
+                total += self.timer_total(phase)[1] if phase == "api_request" else self.timer_total("phase", phase=phase)[1]
+            seconds[group] = total
+        return seconds
+
+    def bottleneck(self):
+        """返回 (耗时最多的类型, 占三类总耗时的比例)，还没有计时数据时返回 (None, 0)"""
+        seconds = self.group_seconds()
+        total = sum(seconds.values())
+        if not total:
+            return None, 0.0
+        group = max(seconds, key=seconds.get)
+        return group, seconds[group] / total
+
+    def http_event_hooks(self, asynchronous=False):
+        """httpx 的事件钩子：统计实际发出的 HTTP 请求（含 SDK 内部的重试）、发送和接收的字节数、响应状态码，
+        以及新建的连接数和 TLS 握手次数（通过 httpcore 的 trace 扩展）"""
+        def on_trace(event_name, info):
+            if event_name == "connection.connect_tcp.complete":
+                self.increment("http_connections")
+            elif event_name == "connection.start_tls.complete":
+                self.increment("tls_handshakes")
+
+        async def on_trace_async(event_name, info):
+            on_trace(event_name, info)
+
+        def on_request(request):
+            self.increment("http_requests", endpoint=request_endpoint(request.method, request.url.path))
+            self.increment("bytes_sent", int(request.headers.get("content-length") or 0))
+            request.extensions["trace"] = on_trace_async if asynchronous else on_trace
+
+        def on_response(response):
+            self.increment("http_responses", status=response.status_code)
+            self.increment("bytes_received", int(response.headers.get("content-length") or 0))
+
+        if not asynchronous:
+            return {"request": [on_request], "response": [on_response]}
+
+        async def on_request_async(request):
+            on_request(request)
+
+        async def on_response_async(response):
+            on_response(response)
+
+        return {"request": [on_request_async], "response": [on_response_async]}
+
+    def connection_reuse_ratio(self):
+        """复用已有连接的 HTTP 请求比例（1 - 新建连接数 / 请求数），还没有请求时返回 None"""
+        requests = self.total("http_requests")
+        if not requests:
+            return None
+        return max(0.0, 1 - self.total("http_connections") / requests)
+
+    def snapshot(self):
+        """当前指标的 JSON 摘要"""
+        with self._lock:
+            timers = [
+                {"name": name, "labels": dict(labels), "count": count, "seconds": seconds, "max_seconds": max_seconds}
+                for (name, labels), (count, seconds, max_seconds) in sorted(self.timers.items())
+            ]
+            counters = [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(self.counters.items(), key=lambda item: (item[0][0], str(item[0][1])))
+            ]
+        group, share = self.bottleneck()
+        return {
+            "started_at": self.started_at,
+            "elapsed_seconds": self.elapsed(),
+            "timers": timers,
+            "counters": counters,
+            "group_seconds": self.group_seconds(),
+            "bottleneck": {"group": group, "share": share},
+            "connection_reuse_ratio": self.connection_reuse_ratio(),
+        }
+
+    def to_prometheus(self, prefix="notion_upload"):
+        """Prometheus 文本格式（可以交给 node_exporter 的 textfile collector）"""
+        lines = [
+            f"# TYPE {prefix}_run_seconds gauge",
+            f"{prefix}_run_seconds {self.elapsed():.6f}",
+            f"# TYPE {prefix}_run_start_timestamp_seconds gauge",
+            f"{prefix}_run_start_timestamp_seconds {self.started_at:.3f}",
+        ]
+        with self._lock:
+            timers = sorted(self.timers.items())
+            counters = sorted(self.counters.items(), key=lambda item: (item[0][0], str(item[0][1])))
+
+        # 同一指标的所有样本需要连续输出
+        names = sorted({name for (name, _), _ in timers})
+        for name in names:
+            metric = f"{prefix}_{name}"
+            for suffix, metric_type, index in (("seconds_total", "counter", 1), ("calls_total", "counter", 0),
+                                               ("seconds_max", "gauge", 2)):
+                lines.append(f"# TYPE {metric}_{suffix} {metric_type}")
+                for (timer_name, labels), timer in timers:
+                    if timer_name == name:
+                        value = timer[index] if index == 0 else f"{timer[index]:.6f}"
+                        lines.append(f"{metric}_{suffix}{format_labels(labels)} {value}")
+
+        declared = set()
+        for (name, labels), value in counters:
+            metric = f"{prefix}_{name}_total"
+            if metric not in declared:
+                declared.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def save_json(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+
+    def save_prometheus(self, path):
+        # 先写临时文件再替换，采集方不会读到写了一半的文件
+        temp_path = path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+        os.replace(temp_path, path)
+
+    def progress_line(self, total_items=None):
+        """一行进度摘要：已处理的项数、请求速率、重试次数、发送的数据量"""
+        done = self.total("items")
+        elapsed = self.elapsed()
+        requests, _ = self.timer_total("api_request")
+        progress = f"{done}/{total_items}" if total_items else f"{done}"
+        return (f"已处理 {progress} 项（成功 {self.total('items', result='success')}，"
+                f"更新 {self.total('items', result='updated')}，跳过 {self.total('items', result='skipped')}，"
+                f"失败 {self.total('items', result='failed')}），"
+                f"请求 {requests} 次（{requests / elapsed if elapsed else 0:.1f}/s），"
+                f"重试 {self.total('retries')} 次，发送 {self.total('bytes_sent') / 1024 / 1024:.1f} MB，"
+                f"用时 {elapsed:.0f}s")
+
+    def summary_lines(self):
+        """运行结束时输出的摘要：各阶段累计耗时和主要瓶颈"""
+        lines = [self.progress_line()]
+        with self._lock:
+            timers = sorted(self.timers.items(), key=lambda item: -item[1][1])
+        for (name, labels), (count, seconds, max_seconds) in timers:
+            label = ",".join(str(value) for _, value in labels) or name
+            if name == "api_request":
+                label = f"api {label}"
+            lines.append(f"  {label:<32} {count:>7} 次 {seconds:>9.2f}s  平均 {seconds / count * 1000:>8.1f}ms  "
+                         f"最长 {max_seconds * 1000:>8.1f}ms")
+        reuse_ratio = self.connection_reuse_ratio()
+        if reuse_ratio is not None:
+            lines.append(f"  HTTP 请求 {self.total('http_requests')} 次，新建连接 {self.total('http_connections')} 个，"
+                         f"TLS 握手 {self.total('tls_handshakes')} 次，连接复用率 {reuse_ratio:.1%}")
+        group, share = self.bottleneck()
+        if group is not None:
+            lines.append(f"  主要耗时：{group}（占 api/disk/conversion 累计耗时的 {share:.0%}）")
+        return lines
+
+
+class ProgressReporter:
+    """后台线程，每隔 interval 秒输出一行进度"""
+
+    def __init__(self, metrics, interval, print_line, total_items=None):
+        self.metrics = metrics
+        self.interval = interval
+        self.print_line = print_line
+        self.total_items = total_items
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self.print_line(self.metrics.progress_line(self.total_items))
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
@@ -0,0 +1,62 @@
+class PageCheckpoint:
+    """分块上传一个页面的进度，记录在进行中状态的日志里（"checkpoint" 字段）
+
+    page_id 为已创建的页面；blocks 为已完整发送（包括补写的子块）的顶层块数；
+    deferred_ids 为已追加、但子块还没补写完的一批顶层块的ID（紧接在前 blocks 个块之后），
+    deferred_sent 为这批块中已补写完的子块数（split_children 返回的 deferred 中的项数）。
+    上传中断后从检查点继续：补写未完成的子块，再把剩余的块追加到原页面，不重新创建页面。
+    content_hash 为上传的文件内容，文件变化后检查点作废，需要清空页面重新发送。
+    """
+
+    def __init__(self, path, title, item_hash, parent_page_id, content_hash=None, page_id=None, blocks=0,
+                 deferred_ids=None, deferred_sent=0):
+        self.path = path
+        self.title = title
+        self.item_hash = item_hash
+        self.parent_page_id = parent_page_id
+        self.content_hash = content_hash
+        self.page_id = page_id
+        self.blocks = blocks
+        self.deferred_ids = deferred_ids
+        self.deferred_sent = deferred_sent
+
+    @classmethod
+    def from_log(cls, log_entry, item_hash):
+        """从日志记录恢复检查点，记录中没有检查点时返回 None"""
+        data = log_entry.get("checkpoint")
+        if not data or not log_entry.get("page_id"):
+            return None
+        return cls(
+            log_entry["path"], log_entry["title"], item_hash, log_entry["parent_page_id"],
+            data.get("content_hash"), log_entry["page_id"], data.get("blocks", 0), data.get("deferred_ids"),
+            data.get("deferred_sent", 0)
+        )
+
+    def to_dict(self):
+        data = {"content_hash": self.content_hash, "blocks": self.blocks}
+        if self.deferred_ids:
+            data["deferred_ids"] = self.deferred_ids
+            data["deferred_sent"] = self.deferred_sent
+        return data
+
+    def start_deferred(self, block_ids):
+        """一批块已追加，接下来补写它们的子块"""
+        self.deferred_ids = list(block_ids)
+        self.deferred_sent = 0
+
+    def deferred_item_sent(self):
+        """补写完一项子块"""
+        self.deferred_sent += 1
+
+    def batch_sent(self, count):
+        """一批 count 个顶层块（连同子块）已全部发送"""
+        self.blocks += count
+        self.deferred_ids = None
+        self.deferred_sent = 0
+
+    def restart(self, content_hash):
+        """文件内容变化后从第一块重新发送（页面需要先清空）"""
+        self.content_hash = content_hash
+        self.blocks = 0
+        self.deferred_ids = None
+        self.deferred_sent = 0
@@ -0,0 +1,230 @@
+import copy
+import json
+
+# Notion API 对请求内容的限制
+# 单个 rich text 对象的 text.content 最多 2000 个字符（按 UTF-16 编码单元计算）
+MAX_TEXT_LENGTH = 2000
+# 单个 rich_text 数组最多 100 项
+MAX_RICH_TEXT_ITEMS = 100
+# 单个 children 数组最多 100 个块
+MAX_CHILDREN = 100
+# 一次请求最多两层嵌套：顶层块的子块可以再有子块，更深的子块需要之后单独追加
+MAX_NESTING_DEPTH = 2
+# 一次请求最多包含 1000 个块（含所有层级的子块）
+MAX_BLOCKS_PER_REQUEST = 1000
+# 请求体最大 500KB，children 之外留出页面属性等字段的余量
+MAX_CHILDREN_BYTES = 450 * 1000
+# 单个块的 rich_text 序列化后的字节上限，保证任何一个块都能单独放进一次请求
+MAX_RICH_TEXT_BYTES = 400 * 1000
+# 一个 rich text 对象序列化后的最大字节数的粗略上界（2000 个单元按 UTF-8 至多 6000 字节，加上样式和链接）
+MAX_RICH_TEXT_ITEM_BYTES = 3 * MAX_TEXT_LENGTH + 2000
+
+
+def text_length(content):
+    """按 UTF-16 编码单元计算长度（与 Notion 的计数方式一致）"""
+    return len(content.encode("utf-16-le")) // 2
+
+
+def split_text(content, limit=MAX_TEXT_LENGTH):
+    """把文本切成每段不超过 limit 的片段，不会拆开代理对"""
+    if len(content) <= limit // 2 or text_length(content) <= limit:
+        return [content]
+    parts = []
+    start = 0
+    while start < len(content):
+        end = start + limit
+        # 含有 BMP 之外的字符（如 emoji）时一个字符占两个单元，逐步缩短
+        while text_length(content[start:end]) > limit:
+            end -= (text_length(content[start:end]) - limit + 1) // 2
+        parts.append(content[start:end])
+        start = end
+    return parts
+
+
+def split_rich_text_items(rich_text):
+    """把过长的 text 对象拆成多个，保留原有的样式和链接"""
+    result = []
+    for item in rich_text:
+        if item.get("type") != "text":
+            result.append(item)
+            continue
+        parts = split_text(item["text"]["content"])
+        if len(parts) == 1:
+            result.append(item)
+            continue
+        for part in parts:
+            new_item = copy.deepcopy(item)
+            new_item["text"]["content"] = part
+            result.append(new_item)
+    return result
+
+
+def group_rich_text(rich_text):
+    """把 rich_text 按项数（不超过 100）和序列化后的字节数分组，每组可以放进一个块"""
+    if len(rich_text) * MAX_RICH_TEXT_ITEM_BYTES <= MAX_RICH_TEXT_BYTES:
+        return [rich_text]
+    groups = []
+    group = []
+    size = 0
+    for item in rich_text:
+        item_size = len(json.dumps(item, ensure_ascii=False).encode("utf-8")) + 1
+        if group and (len(group) >= MAX_RICH_TEXT_ITEMS or size + item_size > MAX_RICH_TEXT_BYTES):
+            groups.append(group)
+            group = []
+            size = 0
+        group.append(item)
+        size += item_size
+    groups.append(group)
+    return groups
+
+
+def normalize_block(block):
+    """修正单个块（及其子块）的文本长度，rich_text 超过 100 项或过大时拆成多个同类型的块，返回块列表"""
+    block_type = block["type"]
+    content = block.get(block_type)
+    if not isinstance(content, dict):
+        return [block]
+
+    if "children" in content:
+        content["children"] = normalize_blocks(content["children"])
+
+    if block_type == "table_row":
+        content["cells"] = [split_rich_text_items(cell) for cell in content["cells"]]
+        return [block]
+
+    if "rich_text" not in content:
+        return [block]
+    groups = group_rich_text(split_rich_text_items(content["rich_text"]))
+    if len(groups) == 1:
+        content["rich_text"] = groups[0]
+        return [block]
+
+    # 拆成多个同类型的块，子块放在最后一个块下，保持内容顺序
+    children = content.pop("children", None)
+    blocks = [{**block, block_type: {**content, "rich_text": group}} for group in groups]
+    if children:
+        blocks[-1][block_type]["children"] = children
+    return blocks
+
+
+def normalize_blocks(blocks):
+    """修正块列表中超出 Notion 文本限制的内容，原地修改并返回新的块列表"""
+    result = []
+    for block in blocks:
+        result.extend(normalize_block(block))
+    return result
+
+
+def split_children(blocks, depth=0):
+    """按嵌套深度和子块数量限制拆分请求内容
+
+    返回 (本次请求的块列表, 延后追加的子块)。延后追加的子块为 [(块路径, 子块列表)]，
+    块路径是从本次请求的顶层块开始、逐层的下标；原始块不会被修改。
+    """
+    payload = []
+    deferred = []
+    for index, block in enumerate(blocks):
+        block_type = block["type"]
+        content = block.get(block_type)
+        children = content.get("children") if isinstance(content, dict) else None
+        if not children:
+            payload.append(block)
+            continue
+
+        if depth >= MAX_NESTING_DEPTH:
+            # 超过嵌套深度：子块全部延后，块本身先不带子块创建
+            kept = []
+            deferred.append(((index,), children))
+        else:
+            kept, child_deferred = split_children(children[:MAX_CHILDREN], depth + 1)
+            deferred.extend(((index, *path), grandchildren) for path, grandchildren in child_deferred)
+            if len(children) > MAX_CHILDREN:
+                deferred.append(((index,), children[MAX_CHILDREN:]))
+        payload.append({**block, block_type: {**content, "children": kept}})
+    return payload, deferred
+
+
+def block_size(block):
+    """块序列化为 JSON 后的字节数"""
+    return len(json.dumps(block, ensure_ascii=False).encode("utf-8"))
+
+
+def count_blocks(blocks):
+    """统计块的数量（含所有层级的子块）"""
+    total = 0
+    for block in blocks:
+        content = block.get(block["type"])
+        children = content.get("children") if isinstance(content, dict) else None
+        total += 1 + (count_blocks(children) if children else 0)
+    return total
+
+
+def fit_oversized_block(block):
+    """单个块放不进一次请求时，只带上能放下的前若干个子块（表格至少一行），其余子块之后追加
+
+    返回 (本次请求中的块, 延后追加的子块)，格式同 split_children。
+    """
+    block_type = block["type"]
+    content = block[block_type]
+    children = content.get("children") if isinstance(content, dict) else None
+    if not children:
+        # 没有子块可拆（normalize_blocks 已限制了单个块的文本大小）
+        return block, []
+    size = block_size({**block, block_type: {**content, "children": []}})
+    block_count = 1
+    kept = 0
+    for child in children[:MAX_CHILDREN]:
+        child_payload = split_children([child], 1)[0][0]
+        size += block_size(child_payload) + 1
+        block_count += count_blocks([child_payload])
+        if size > MAX_CHILDREN_BYTES or block_count > MAX_BLOCKS_PER_REQUEST:
+            break
+        kept += 1
+    if block_type == "table":
+        kept = max(kept, 1)
+
+    payload, deferred = split_children([{**block, block_type: {**content, "children": children[:kept]}}])
+    if kept < len(children):
+        deferred.append(((0,), children[kept:]))
+    return payload[0], deferred
+
+
+def batch_blocks(notion_objects):
+    """把块按顺序打包成尽量少的请求，返回 [(本次请求的块列表, 延后追加的子块)]
+
+    每个请求不超过 100 个顶层块、1000 个块（含子块），children 序列化后不超过 MAX_CHILDREN_BYTES。
+    按顺序贪心装填，在保持块顺序的前提下请求数最少。
+    """
+    batches = []
+    payload = []
+    deferred = []
+    block_count = 0
+    size = 2
+    for block in notion_objects:
+        items, item_deferred = split_children([block])
+        item = items[0]
+        item_count = count_blocks(items)
+        item_size = block_size(item) + 1
+        if item_size + 2 > MAX_CHILDREN_BYTES or item_count > MAX_BLOCKS_PER_REQUEST:
+            item, item_deferred = fit_oversized_block(block)
+            item_count = count_blocks([item])
+            item_size = block_size(item) + 1
+
+        if payload and (len(payload) >= MAX_CHILDREN
+                        or block_count + item_count > MAX_BLOCKS_PER_REQUEST
+                        or size + item_size > MAX_CHILDREN_BYTES):
+            batches.append((payload, deferred))
+            payload = []
+            deferred = []
+            block_count = 0
+            size = 2
+
+        index = len(payload)
+        payload.append(item)
+        deferred.extend(((index, *path[1:]), children) for path, children in item_deferred)
+        block_count += item_count
+        size += item_size
+
+    if payload:
+        batches.append((payload, deferred))
+    return batches
@@ -0,0 +1,168 @@
+import time
+import random
+import asyncio
+import threading
+
+import httpx
+from notion_client import APIResponseError
+from notion_client.errors import HTTPResponseError, RequestTimeoutError
+
+from metrics import RunMetrics, endpoint_name, retry_reason
+
+# 可以重试的 HTTP 状态码：限流和服务端临时错误
+RETRYABLE_STATUS = {409, 429, 500, 502, 503, 504}
+# 非幂等的请求（创建页面、追加块、创建和发送文件）：超时或 5xx 时服务端可能已经执行成功，
+# 重发会产生重复的页面或块，只重试限流和连接没有建立起来的错误
+NON_IDEMPOTENT_ENDPOINTS = {"pages.create", "blocks.children.append", "file_uploads.create", "file_uploads.send"}
+
+
+class TokenBucket:
+    """令牌桶，按 rate 个/秒 发放令牌，允许 capacity 个突发请求（线程安全）"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        # 收到 429 后，所有请求都要等到这个时间点之后
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """预订一个令牌，返回需要等待的秒数"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            # 令牌可以为负数，表示已经被后续请求预订
+            self.tokens -= 1
+            wait = 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+            return max(wait, self.paused_until - now)
+
+    def pause(self, seconds):
+        """暂停发放令牌，用于遵守 Retry-After"""
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class RequestScheduler:
+    """所有 Notion 请求的统一入口：限速，并对限流和临时错误做指数退避重试
+
+    每次请求的耗时按端点计入 metrics，限速等待和重试前的等待分别计入 rate_limit_wait、retry_backoff 阶段。
+    """
+
+    def __init__(self, requests_per_second=3, max_retries=5, base_delay=1.0, max_delay=60.0, metrics=None):
+        self.bucket = TokenBucket(requests_per_second) if requests_per_second else None
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.metrics = metrics or RunMetrics()
+
+    def is_retryable(self, error, endpoint=None):
+        """限流、超时、连接错误和 5xx 可以重试，其他错误（如参数校验失败）直接抛出
+
+        非幂等的请求只重试限流和请求没有发出的连接错误。
+        """
+        if endpoint in NON_IDEMPOTENT_ENDPOINTS:
+            if isinstance(error, HTTPResponseError):
+                return error.status == 429
+            return self.is_connect_error(error)
+        if isinstance(error, (RequestTimeoutError, httpx.TransportError)):
+            return True
+        if isinstance(error, HTTPResponseError):
+            return error.status in RETRYABLE_STATUS
+        return False
+
+    def is_connect_error(self, error):
+        """连接没有建立（或没有拿到连接池中的连接），请求一定没有发到服务端"""
+        # SDK 把 httpx 的超时包装为 RequestTimeoutError，原始异常在 __context__ 中
+        if isinstance(error, RequestTimeoutError):
+            error = error.__context__
+        return isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout))
+
+    def get_retry_after(self, error):
+        """读取 Retry-After 响应头（秒）"""
+        headers = getattr(error, "headers", None)
+        if not headers:
+            return None
+        value = headers.get("retry-after")
+        try:
+            return max(0.0, float(value))
+        except (TypeError, ValueError):
+            return None
+
+    def get_retry_delay(self, error, attempt, endpoint=None):
+        """计算第 attempt 次重试前的等待时间，不可重试时返回 None"""
+        if attempt >= self.max_retries or not self.is_retryable(error, endpoint):
+            return None
+
+        # full jitter 指数退避，避免所有线程同时重试
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        retry_after = self.get_retry_after(error)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        if isinstance(error, APIResponseError) and error.status == 429 and self.bucket:
+            # 限流是全局的，暂停所有请求而不仅是当前线程
+            self.bucket.pause(delay)
+        return delay
+
+    def record_failure(self, endpoint, error, delay):
+        """记录一次失败的请求：会重试时计入 retries，否则计入 api_errors"""
+        if delay is None:
+            self.metrics.increment("api_errors", endpoint=endpoint, reason=retry_reason(error))
+        else:
+            self.metrics.increment("retries", endpoint=endpoint, reason=retry_reason(error))
+
+    def call(self, func, **kwargs):
+        """限速执行一次请求，可重试的错误按退避策略重试"""
+        endpoint = endpoint_name(func)
+        attempt = 0
+        while True:
+            if self.bucket:
+                with self.metrics.phase("rate_limit_wait"):
+                    self.bucket.acquire()
+            start = time.perf_counter()
+            try:
+                return func(**kwargs)
+            except Exception as e:
+                delay = self.get_retry_delay(e, attempt, endpoint)
+                self.record_failure(endpoint, e, delay)
+                if delay is None:
+                    raise
+            finally:
+                self.metrics.observe("api_request", time.perf_counter() - start, endpoint=endpoint)
+            attempt += 1
+            with self.metrics.phase("retry_backoff"):
+                time.sleep(delay)
+
+    async def acall(self, func, **kwargs):
+        """call 的异步版本，func 返回 awaitable"""
+        endpoint = endpoint_name(func)
+        attempt = 0
+        while True:
+            if self.bucket:
+                with self.metrics.phase("rate_limit_wait"):
+                    await self.bucket.acquire_async()
+            start = time.perf_counter()
+            try:
+                return await func(**kwargs)
+            except Exception as e:
+                delay = self.get_retry_delay(e, attempt, endpoint)
+                self.record_failure(endpoint, e, delay)
+                if delay is None:
+                    raise
+            finally:
+                self.metrics.observe("api_request", time.perf_counter() - start, endpoint=endpoint)
+            attempt += 1
+            with self.metrics.phase("retry_backoff"):
+                await asyncio.sleep(delay)
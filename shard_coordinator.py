@@ -0,0 +1,299 @@
+import os
+import time
+import socket
+import sqlite3
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+
+from folder_scanner import scan_tree
+
+# 分片：path 为文件夹路径；recursive 为真时包含整个子树，否则只包含文件夹中的文件，子文件夹是单独的分片；
+# parent_path 为上级分片的文件夹（其页面是本分片文件夹页面的父页面），根文件夹为 None；files 为 .md 文件数
+Shard = namedtuple("Shard", ["path", "parent_path", "recursive", "files"])
+# 领取到的分片：token 每次领取加一，续租和完成时用来确认租约仍属于自己；
+# page_id 为分片文件夹的页面（根文件夹为根页面），还没创建时为 None；reclaimed 表示接手了过期的租约
+ShardLease = namedtuple(
+    "ShardLease", ["seq", "path", "recursive", "files", "token", "page_id", "parent_page_id", "reclaimed"]
+)
+
+
+def count_markdown_files(manifest, folder_path, counts):
+    """统计文件夹（含子文件夹）中的 .md 文件数，结果写入 counts {文件夹: 文件数}"""
+    total = 0
+    for child_path in manifest[folder_path].children:
+        if manifest[child_path].is_dir:
+            total += count_markdown_files(manifest, child_path, counts)
+        elif child_path.endswith(".md"):
+            total += 1
+    counts[folder_path] = total
+    return total
+
+
+def plan_shards(manifest, root_path, shard_size, include_empty_folders=True):
+    """把目录树切分为分片，按先父后子的顺序返回
+
+    .md 文件数不超过 shard_size 的子树整体作为一个分片；更大的文件夹自身的文件作为一个分片，
+    子文件夹继续切分。根文件夹总是按后一种方式处理，它的页面就是 Notion 中的根页面。
+    """
+    counts = {}
+    count_markdown_files(manifest, root_path, counts)
+    shards = []
+
+    def split(folder_path, parent_path):
+        if parent_path is not None and counts[folder_path] <= shard_size:
+            shards.append(Shard(folder_path, parent_path, True, counts[folder_path]))
+            return
+        children = manifest[folder_path].children
+        files = sum(1 for path in children if path.endswith(".md") and not manifest[path].is_dir)
+        shards.append(Shard(folder_path, parent_path, False, files))
+        for child_path in children:
+            entry = manifest[child_path]
+            if entry.is_dir and (include_empty_folders or entry.has_markdown):
+                split(child_path, folder_path)
+
+    split(root_path, None)
+    return shards
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class ShardCoordinator:
+    """分片上传的协调库（SQLite），多个进程（可以在共享同一文件系统的不同机器上）通过租约领取分片
+
+    第一个进程扫描目录并写入分片计划，其他进程等待计划写完。领取分片时写入租约到期时间，
+    上传期间定时续租；进程退出后租约过期，分片由其他进程重新领取，并从该分片的日志继续。
+    文件夹页面创建后记录在分片上，子分片在父页面存在之后才能被领取。
+    协调库所在的文件系统需要支持文件锁。
+    """
+
+    def __init__(self, path, lease_seconds=300, max_attempts=3):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        # 手动控制事务：写入计划和领取分片使用 BEGIN IMMEDIATE，同一时间只有一个进程在写
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=60, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.create_tables()
+
+    def create_tables(self):
+        with self.transaction():
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS shards (
+                    seq INTEGER PRIMARY KEY,
+                    path TEXT NOT NULL UNIQUE,
+                    parent_path TEXT,
+                    recursive INTEGER NOT NULL,
+                    files INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    owner TEXT,
+                    token INTEGER NOT NULL DEFAULT 0,
+                    lease_expires REAL,
+                    page_id TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    failed_items INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    updated_at REAL
+                )""")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_shards_status ON shards (status)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    @contextmanager
+    def transaction(self):
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def get_meta(self, key):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def ensure_plan(self, root_path, root_page_id, shard_size, include_empty_folders=True):
+        """还没有分片计划时扫描目录并写入；已有计划时检查根目录一致，并让失败的分片重新排队
+
+        扫描在写事务中进行，其他进程在此期间等待；扫描的进程退出时锁自动释放，由下一个进程重新规划。
+        返回本进程是否写入了计划。
+        """
+        root_path = os.path.normpath(root_path)
+        while True:
+            try:
+                with self.transaction():
+                    if self.get_meta("root_path") is None:
+                        shards = plan_shards(scan_tree(root_path), root_path, shard_size, include_empty_folders)
+                        self.insert_plan(shards, root_path, root_page_id)
+                        return True
+                    if self.get_meta("root_path") != root_path or self.get_meta("root_page_id") != root_page_id:
+                        raise ValueError(
+                            f"协调库 {self.path} 属于另一次迁移（{self.get_meta('root_path')} -> "
+                            f"{self.get_meta('root_page_id')}）"
+                        )
+                    # 新的一次运行：重试失败的分片，以及上次有文件上传失败的分片
+                    self.conn.execute(
+                        "UPDATE shards SET status = 'pending', attempts = 0, error = NULL, updated_at = ? "
+                        "WHERE status = 'failed' OR (status = 'done' AND failed_items > 0)", (time.time(),)
+                    )
+                    return False
+            except sqlite3.OperationalError as e:
+                # 另一个进程正在扫描目录、写入计划
+                if "locked" not in str(e):
+                    raise
+
+    def insert_plan(self, shards, root_path, root_page_id):
+        # 调用方需在事务中；根文件夹的页面就是根页面
+        now = time.time()
+        self.conn.executemany(
+            "INSERT INTO shards (path, parent_path, recursive, files, status, page_id, updated_at) "
+            "VALUES (?, ?, ?, ?, 'pending', ?, ?)",
+            [(shard.path, shard.parent_path, int(shard.recursive), shard.files,
+              root_page_id if shard.parent_path is None else None, now) for shard in shards]
+        )
+        self.conn.executemany(
+            "INSERT INTO meta (key, value) VALUES (?, ?)",
+            [("root_path", root_path), ("root_page_id", root_page_id), ("planned_at", str(now))]
+        )
+
+    def claim(self, worker_id):
+        """领取一个可以开始的分片：等待中的，或租约已过期的；父页面还不存在的分片不能领取。没有时返回 None"""
+        now = time.time()
+        with self.transaction():
+            row = self.conn.execute("""
+                SELECT s.seq, s.path, s.recursive, s.files, s.token, s.page_id, p.page_id, s.status
+                FROM shards s LEFT JOIN shards p ON p.path = s.parent_path
+                WHERE (s.status = 'pending' OR (s.status = 'running' AND s.lease_expires < ?))
+                  AND (s.parent_path IS NULL OR p.page_id IS NOT NULL)
+                ORDER BY s.seq LIMIT 1
+            """, (now,)).fetchone()
+            if row is None:
+                return None
+            seq, path, recursive, files, token, page_id, parent_page_id, status = row
+            self.conn.execute(
+                "UPDATE shards SET status = 'running', owner = ?, token = ?, lease_expires = ?, updated_at = ? "
+                "WHERE seq = ?", (worker_id, token + 1, now + self.lease_seconds, now, seq)
+            )
+        return ShardLease(seq, path, bool(recursive), files, token + 1, page_id, parent_page_id, status == "running")
+
+    def update_lease(self, lease, sql, params):
+        # 只有租约仍属于自己（token 未变、仍在进行中）时才更新，返回是否更新成功
+        with self.transaction():
+            cursor = self.conn.execute(
+                f"UPDATE shards SET {sql}, updated_at = ? WHERE seq = ? AND token = ? AND status = 'running'",
+                (*params, time.time(), lease.seq, lease.token)
+            )
+            return cursor.rowcount == 1
+
+    def renew(self, lease):
+        return self.update_lease(lease, "lease_expires = ?", (time.time() + self.lease_seconds,))
+
+    def set_page(self, lease, page_id):
+        """记录分片文件夹的页面，子分片从此可以被领取"""
+        return self.update_lease(lease, "page_id = ?", (page_id,))
+
+    def complete(self, lease, failed_items=0):
+        return self.update_lease(
+            lease, "status = 'done', lease_expires = NULL, failed_items = ?, error = NULL", (failed_items,)
+        )
+
+    def fail(self, lease, error):
+        """分片出错：重试次数未用完时重新排队，否则标记失败，连同还在等待它的页面的子分片"""
+        with self.transaction():
+            cursor = self.conn.execute(
+                "UPDATE shards SET attempts = attempts + 1, lease_expires = NULL, error = ?, updated_at = ?, "
+                "status = CASE WHEN attempts + 1 >= ? THEN 'failed' ELSE 'pending' END "
+                "WHERE seq = ? AND token = ? AND status = 'running'",
+                (str(error), time.time(), self.max_attempts, lease.seq, lease.token)
+            )
+            if cursor.rowcount != 1:
+                return False
+            status, page_id = self.conn.execute(
+                "SELECT status, page_id FROM shards WHERE seq = ?", (lease.seq,)
+            ).fetchone()
+            if status == "failed" and page_id is None:
+                prefix = lease.path + os.sep
+                self.conn.execute(
+                    "UPDATE shards SET status = 'failed', error = ?, updated_at = ? "
+                    "WHERE status = 'pending' AND substr(path, 1, ?) = ?",
+                    (f"上级分片 {lease.path} 失败", time.time(), len(prefix), prefix)
+                )
+            return True
+
+    def is_finished(self):
+        """所有分片都已结束（完成或失败）"""
+        with self._lock:
+            row = self.conn.execute("SELECT COUNT(*) FROM shards WHERE status IN ('pending', 'running')").fetchone()
+        return row[0] == 0
+
+    def status_counts(self):
+        """各状态的分片数和 .md 文件数 {状态: (分片数, 文件数)}"""
+        with self._lock:
+            rows = self.conn.execute("SELECT status, COUNT(*), SUM(files) FROM shards GROUP BY status").fetchall()
+        return {status: (shards, files or 0) for status, shards, files in rows}
+
+    def failed_shards(self):
+        """失败的分片 [(文件夹, 错误)]"""
+        with self._lock:
+            return self.conn.execute(
+                "SELECT path, error FROM shards WHERE status = 'failed' ORDER BY seq"
+            ).fetchall()
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+class LeaseLostError(BaseException):
+    """分片的租约已失效。与用户中止（SystemExit）一样继承 BaseException，不会被单个文件的错误处理拦下"""
+
+
+class LeaseKeeper:
+    """后台线程，每隔租约时长的三分之一续租一次；续租失败（租约已被其他进程接手）时设置 lost"""
+
+    def __init__(self, coordinator, lease):
+        self.coordinator = coordinator
+        self.lease = lease
+        self.lost = threading.Event()
+        # 租约在本地的到期时间（monotonic），续租成功后延后；过了这个时间其他进程随时可能接手
+        self.deadline = time.monotonic() + coordinator.lease_seconds
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        while not self._stopped.wait(self.coordinator.lease_seconds / 3):
+            renew_started = time.monotonic()
+            try:
+                renewed = self.coordinator.renew(self.lease)
+            except sqlite3.Error:
+                # 协调库暂时不可用，下次再试；一直失败时租约会过期
+                continue
+            if not renewed:
+                self.lost.set()
+                return
+            self.deadline = renew_started + self.coordinator.lease_seconds
+
+    def is_lost(self, margin=0):
+        """租约已被接手，或者距离到期不足 margin 秒（续租被 GC 停顿、文件系统卡住等拖延时）"""
+        return self.lost.is_set() or time.monotonic() >= self.deadline - margin
+
+    def check(self, start_work=False):
+        """租约失效时抛出 LeaseLostError
+
+        start_work 为真（开始上传新的一项）时要求至少还剩三分之一租约时长，让已经开始的请求在到期前完成并写日志。
+        """
+        margin = self.coordinator.lease_seconds / 3 if start_work else 0
+        if self.is_lost(margin):
+            raise LeaseLostError(self.lease.path)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
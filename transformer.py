@@ -1,11 +1,13 @@
-import copy
+import re
 from urllib.parse import unquote
 
 from markdown_it import MarkdownIt
 from markdown_it.token import Token
 from notion_client import Client
 
-from utils import match_code_language, convert_to_nested_list, is_valid_url
+from utils import match_code_language, is_valid_url
+from payload_limits import normalize_blocks
+from link_resolver import is_local_link, split_wiki_links
 
 
 def create_notion_block(block_type, rich_text_list, chidren_list):
@@ -24,7 +26,7 @@ def transform_invalid_link_and_image(token):
     invalid_link_href = ''
     invalid_link_content = ''
     for child in token.children or []:
-        if child.type == 'link_open' and not is_valid_url(child.attrs['href']):
+        if child.type == 'link_open' and not is_valid_url(child.attrs['href']) and not child.meta.get('local_link'):
             # invalid link url
             invalid_link_flag = True
             invalid_link_href = unquote(child.attrs['href'])
@@ -47,7 +49,8 @@ def transform_invalid_link_and_image(token):
             ))
         elif invalid_link_flag == True and child.type == 'text':
             invalid_link_content += child.content
-        elif child.type == 'image' and not child.attrs['src'].startswith('http'):
+        elif child.type == 'image' and not child.attrs['src'].startswith('http') \
+                and not child.meta.get('local_image'):
             # invalid image url
             invalid_img_url = unquote(child.attrs['src'])
             invalid_img_alt = child.attrs['alt']
@@ -85,7 +88,22 @@ def process_inline_content(token):
         # print("child",child)
 
         # image 需要 放在 children 中，不能放在 rich_texts
-        if child.type == 'image':
+        if child.type == 'image' and child.meta.get('local_image'):
+            # 本地图片，上传时由 MediaUploader 替换为 file_upload 图片块
+            chidren_list.append({
+                "type": "image",
+                "image": {
+                    "type": "local_file",
+                    "local_file": {
+                        "path": unquote(child.attrs['src']),
+                        "caption": child.content,
+                        "title": child.attrs.get('title', '')
+                    }
+                },
+            })
+            continue
+
+        elif child.type == 'image':
             image_url = child.attrs['src']
             image_alt = child.attrs['alt']
             image_caption = child.content
@@ -140,6 +158,10 @@ def process_inline_content(token):
             text_content["text"]["content"] += child.content
             text_content["annotations"]["code"] = True
 
+        elif child.type == 'link_open' and child.meta.get('local_link'):
+            # 指向其他 Markdown 文件的链接，上传后由 LinkResolver 改写为页面链接
+            text_content["local_link"] = {"path": unquote(child.attrs['href'])}
+
         elif child.type == 'link_open':
             link_url = child.attrs['href']
             text_content["text"]["link"] = {
@@ -173,6 +195,15 @@ def process_inline_content(token):
         else:
             stack[-1] = text_content
 
+    if token.meta.get('local_links'):
+        # 解析前先保留原文，找不到目标页面时与未开启链接解析时相同
+        for text_content in rich_texts:
+            link = text_content.get("local_link")
+            if link is not None and "label" not in link:
+                link["label"] = text_content["text"]["content"]
+                text_content["text"]["content"] = f"[{link['label']}]({link['path']})"
+        rich_texts = split_wiki_links(rich_texts)
+
     return rich_texts, chidren_list
 
 
@@ -255,27 +286,13 @@ def handleBlockquote(block_data):
     return blocks
 
 
-# 删除 level 属性，删除 空的[type]['children']
-def handleNotionErrorKey(nested_list):
-    for li in nested_list:
-        li_type = li['type']
-        if li[li_type].get('children', None):
-            if not len(li[li_type]['children']):
-                li[li_type].pop('children')
-            else:
-                handleNotionErrorKey(li[li_type]['children'])
-
-        li.pop('level', None)
-
-    return nested_list
-
-
-def handleListItem(block_data, list_type):
-    # print(block_data)
-    blocks = []
+def handleListItem(block_data, list_type, convert_todo=False):
+    """一次遍历 token，直接构建嵌套的列表块，不复制 token 或块"""
+    nested_list = []
+    # 栈中保存 (层级, 块)，当前 li 挂到层级更小的最近一个块的 children 下
+    stack = []
     level = 0
     for token in block_data:
-        # print(token)
         if token.type == 'list_item_open':
             level = token.level
 
@@ -283,55 +300,48 @@ def handleListItem(block_data, list_type):
         if token.type == 'inline':
             rich_texts, chidren_list = process_inline_content(token)
             current_block = create_notion_block(list_type, rich_texts, chidren_list)
-            current_block['level'] = level  # 添加 level 作为层级标记
-            blocks.append(current_block)
+            if convert_todo:
+                convert_to_todo_item(current_block)
+
+            while stack and stack[-1][0] >= level:
+                stack.pop()
+            if stack:
+                # 父块可能已经转为 to_do，按父块自己的类型取 children
+                parent_block = stack[-1][1]
+                parent_block[parent_block['type']]['children'].append(current_block)
+            else:
+                nested_list.append(current_block)
+            stack.append((level, current_block))
 
-    # 将平铺的 li 转为嵌套的 li
-    nested_list = convert_to_nested_list(copy.deepcopy(blocks))
+    return nested_list
 
-    # 遍历 nested_list 及其 children, 删除元素的 level 属性，和空的 children 不然 notion API 会报错
-    return handleNotionErrorKey(nested_list)
 
+TODO_UNCHECKED_PREFIXES = ['[] ', '[ ] ']
+TODO_CHECKED_PREFIXES = ['[x] ', '[X] ', '[ x ] ', '[ X ] ']
 
-def convert2TodoList(block):
-    unchecked_prefix_list = ['[] ', '[ ] ']
-    checked_prefix_list = ['[x] ', '[X] ', '[ x ] ', '[ X ] ']
 
-    if block['type'] != 'bulleted_list_item':
-        return block
+def convert_to_todo_item(block):
+    """如果 bulleted_list_item 以[]/[ ]/[x]/[X]/[ x ]/[ X ]+空格开头，原地转为 to_do（不处理子块）"""
     current_content = block['bulleted_list_item']['rich_text'][0]['text']['content']
 
-    is_to_do = False
-    for prefix in unchecked_prefix_list + checked_prefix_list:
+    for prefix in TODO_UNCHECKED_PREFIXES + TODO_CHECKED_PREFIXES:
         if current_content.startswith(prefix):
-            is_to_do = True
             block['type'] = 'to_do'
             block['to_do'] = block['bulleted_list_item']
             del block['bulleted_list_item']
-            block['to_do']['checked'] = prefix in checked_prefix_list
+            block['to_do']['checked'] = prefix in TODO_CHECKED_PREFIXES
             block['to_do']['rich_text'][0]['text']['content'] = current_content.removeprefix(prefix)
 
-    current_item = block['to_do'] if is_to_do else block['bulleted_list_item']
-    if 'children' in current_item and len(current_item['children']):
-        for child in current_item['children']:
-            convert2TodoList(child)
-
     return block
 
 
 def handleBulletList(block_data):
-    bulletList = handleListItem(copy.deepcopy(block_data), 'bulleted_list_item')
-
-    new_list = []
-    for item in bulletList:
-        # 遍历 bulletList 及其 children，如果 item 以[]/[ ]/[x]/[X]/[ x ]/[ X ]+空格开头，则将 item 转为 to_do
-        new_list.append(convert2TodoList(item))
-
-    return new_list
+    # 构建时同时把 [ ]/[x] 开头的 item 转为 to_do
+    return handleListItem(block_data, 'bulleted_list_item', convert_todo=True)
 
 
 def handleOrderedList(block_data):
-    return handleListItem(copy.deepcopy(block_data), 'numbered_list_item')
+    return handleListItem(block_data, 'numbered_list_item')
 
 
 def handleDivider(block_data):
@@ -417,14 +427,46 @@ def handleHtmlBlock(block_data):
     return blocks
 
 
-def markdown_element_to_notion_object(md_text):
-    # [xx]::xxx 会被错误识别成 link,在 ]:: 添加一个空格即可
-    md_text = md_text.replace(']::', ']:: ')
-    md = MarkdownIt("commonmark").enable('table').enable('strikethrough')
+def create_markdown_parser():
+    """创建 Markdown 解析器（commonmark + 表格 + 删除线）"""
+    return MarkdownIt("commonmark").enable('table').enable('strikethrough')
 
-    tokens = md.parse(md_text)
 
-    # 遍历预处理 tokens, 通过 type 划分块数据
+# 模块级共用的解析器，避免每个文件都重新构建规则表
+_markdown_parser = None
+
+
+def get_markdown_parser():
+    global _markdown_parser
+    if _markdown_parser is None:
+        _markdown_parser = create_markdown_parser()
+    return _markdown_parser
+
+
+def mark_local_images(tokens):
+    """标记引用本地文件的图片，转换时保留为待上传的 local_file 图片块，而不是文本"""
+    for token in tokens:
+        if token.type != 'inline':
+            continue
+        for child in token.children or []:
+            if child.type == 'image' and not child.attrs['src'].startswith('http'):
+                child.meta['local_image'] = True
+
+
+def mark_local_links(tokens):
+    """标记指向其他 Markdown 文件的链接和含有 [[页面]] 的行内内容，转换时保留为待解析的链接"""
+    for token in tokens:
+        if token.type != 'inline':
+            continue
+        token.meta['local_links'] = True
+        for child in token.children or []:
+            # 没有协议的 xxx.md 也会被 is_valid_url 当作域名，这里按本地文件处理
+            if child.type == 'link_open' and is_local_link(child.attrs['href']):
+                child.meta['local_link'] = True
+
+
+def split_block_tokens(tokens):
+    """遍历预处理 tokens, 通过 type 划分块数据，每组为一个顶层块的全部 token"""
     block_data_list = []
     temp_list = []
     tag_count = 0
@@ -440,6 +482,27 @@ def markdown_element_to_notion_object(md_text):
             # 可以结束temp_list
             block_data_list.append(temp_list)
             temp_list = []
+    return block_data_list
+
+
+def markdown_element_to_notion_object(md_text, md=None, local_images=False, local_links=False):
+    """把 Markdown 文本转换为 Notion 块列表，md 为可选的自定义解析器，默认使用共用的解析器
+
+    local_images 为 True 时，本地图片转换为 local_file 图片块（路径相对于 Markdown 文件），由上传流程上传后替换。
+    local_links 为 True 时，跨文件链接的 rich text 带有 local_link 标记，由上传流程收集后在第二遍改写。
+    """
+    # [xx]::xxx 会被错误识别成 link,在 ]:: 添加一个空格即可
+    md_text = md_text.replace(']::', ']:: ')
+    if md is None:
+        md = get_markdown_parser()
+
+    tokens = md.parse(md_text)
+    if local_images:
+        mark_local_images(tokens)
+    if local_links:
+        mark_local_links(tokens)
+
+    block_data_list = split_block_tokens(tokens)
 
     # 空行
     empty_row = {
@@ -481,7 +544,64 @@ def markdown_element_to_notion_object(md_text):
             if token_type not in ('paragraph_open', 'heading_open'):
                 notion_blocks.append(empty_row)
 
-    return notion_blocks
+    # 拆分超过 Notion 长度限制的文本
+    return normalize_blocks(notion_blocks)
+
+
+# 以 ``` 或 ~~~ 开头的围栏代码块
+FENCE_REGEX = re.compile(r'^ {0,3}(`{3,}|~{3,})')
+# 列表项标记：- * + 或 1. 1)
+LIST_MARKER_REGEX = re.compile(r'^([-*+]|\d{1,9}[.)])(\s|$)')
+# 跨越空行的 HTML 块（注释、script/pre/style/textarea）的开始和结束
+HTML_BLOCK_OPEN_REGEX = re.compile(r'<!--|<(script|pre|style|textarea)[\s>]', re.IGNORECASE)
+HTML_BLOCK_CLOSE_REGEX = re.compile(r'-->|</(script|pre|style|textarea)>', re.IGNORECASE)
+
+
+def is_segment_start(line):
+    """空行之后的这一行能否作为新分段的开头：顶格、非列表项、非引用，不会延续前面的块"""
+    if not line.strip() or line[0].isspace():
+        return False
+    return not LIST_MARKER_REGEX.match(line) and not line.startswith('>')
+
+
+def iter_notion_blocks(lines, segment_chars=64 * 1024, md=None, local_images=False, local_links=False):
+    """逐段转换 Markdown，按顶层块顺序依次产出 Notion 块
+
+    lines 为逐行的可迭代对象（如打开的文件）。累计超过 segment_chars 个字符后，
+    在下一个安全的顶层块边界（空行之后、不在代码块或 HTML 块内）切分并转换，
+    因此内存占用只与分段大小有关。引用式链接的定义只在所在分段内生效。
+    """
+    buffer = []
+    size = 0
+    fence = None
+    in_html_block = False
+    previous_blank = False
+    for line in lines:
+        if (size >= segment_chars and previous_blank and fence is None and not in_html_block
+                and is_segment_start(line)):
+            yield from markdown_element_to_notion_object(''.join(buffer), md, local_images, local_links)
+            buffer = []
+            size = 0
+
+        buffer.append(line)
+        size += len(line)
+
+        fence_match = FENCE_REGEX.match(line)
+        if fence is None and fence_match:
+            fence = fence_match.group(1)
+        elif fence is not None and fence_match and line.strip() == fence_match.group(1) \
+                and fence_match.group(1)[0] == fence[0] and len(fence_match.group(1)) >= len(fence):
+            fence = None
+        elif fence is None:
+            if in_html_block:
+                in_html_block = not HTML_BLOCK_CLOSE_REGEX.search(line)
+            elif HTML_BLOCK_OPEN_REGEX.search(line):
+                open_match = HTML_BLOCK_OPEN_REGEX.search(line)
+                in_html_block = not HTML_BLOCK_CLOSE_REGEX.search(line, open_match.end())
+        previous_blank = not line.strip()
+
+    if buffer:
+        yield from markdown_element_to_notion_object(''.join(buffer), md, local_images, local_links)
 
 
 def test_markdown_transformation():
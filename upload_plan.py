@@ -0,0 +1,382 @@
+import os
+import math
+import json
+from collections import Counter
+from datetime import timedelta
+
+from rich.console import Console
+
+from block_diff import diff_blocks
+from payload_limits import MAX_CHILDREN, batch_blocks
+from media_upload import MAX_SINGLE_PART_BYTES, iter_local_images, image_block, image_caption, fallback_block
+from link_resolver import LinkResolver, collect_local_links, required_child_ids
+from conversion_pipeline import convert_markdown_file
+from transformer import iter_notion_blocks
+from page_checkpoint import PageCheckpoint
+from utils import read_markdown_file, is_modified_after_upload
+
+console = Console(force_terminal=True)
+
+# blocks.children.list 每次最多读取的块数
+LIST_PAGE_SIZE = 100
+
+
+def count_list_requests(block_count):
+    """分页读取 block_count 个子块需要的请求数"""
+    return math.ceil(block_count / LIST_PAGE_SIZE)
+
+
+def count_batch_requests(batches, requests):
+    """统计发送打包好的追加请求需要的请求数，包括补写深层子块"""
+    for _, deferred in batches:
+        requests["blocks.children.append"] += 1
+        count_deferred_requests(deferred, requests)
+
+
+def count_append_requests(notion_objects, requests):
+    """按 append_blocks 的逻辑统计追加块需要的请求"""
+    count_batch_requests(batch_blocks(notion_objects), requests)
+
+
+def count_deferred_requests(deferred, requests):
+    """按 append_deferred_children 的逻辑统计：每个中间块读取一次子块ID，再追加子块"""
+    listed = set()
+    for path, children in deferred:
+        listed.update(path[:depth] for depth in range(1, len(path)))
+        count_append_requests(children, requests)
+    requests["blocks.children.list"] += len(listed)
+
+
+def count_create_requests(batches, requests):
+    """按 create_page_with_batches 的逻辑统计：第一批随页面一起创建，其余批次追加"""
+    requests["pages.create"] += 1
+    if batches and batches[0][1]:
+        requests["blocks.children.list"] += 1
+        count_deferred_requests(batches[0][1], requests)
+    count_batch_requests(batches[1:], requests)
+
+
+def count_stream_requests(item_path, requests, local_images=False, local_links=False, visit=None):
+    """按 stream_markdown_page 的逻辑统计流式上传需要的请求，返回块数
+
+    visit 为可选的逐块回调，参数为块在页面顶层的下标和块。
+    """
+    block_count = 0
+    created = False
+    pending = []
+    with open(item_path, "r", encoding="utf-8") as md_file:
+        for block in iter_notion_blocks(md_file, local_images=local_images, local_links=local_links):
+            if visit is not None:
+                visit(block_count, block)
+            pending.append(block)
+            block_count += 1
+            if len(pending) < 2 * MAX_CHILDREN:
+                continue
+            # 最后一批留到和后面的块一起打包
+            batches = batch_blocks(pending)[:-1]
+            pending = pending[sum(len(payload) for payload, _ in batches):]
+            if not created:
+                count_create_requests(batches[:1], requests)
+                batches = batches[1:]
+                created = True
+            count_batch_requests(batches, requests)
+    batches = batch_blocks(pending)
+    if not created:
+        count_create_requests(batches[:1], requests)
+        batches = batches[1:]
+    count_batch_requests(batches, requests)
+    return block_count
+
+
+class UploadPlanner:
+    """预演上传：沿用上传时的遍历顺序、跳过规则和 Markdown 转换，统计需要的请求并估算耗时，不访问网络
+
+    计划中的每一项为 {"path", "type", "action", "blocks", "requests"}，
+    action 为 create（新建）、update（增量更新）、resume（从检查点继续上传）、rename（只改标题）、skip（已上传）或 skip_empty（空文件/文件夹）。
+    """
+
+    def __init__(self, uploader):
+        self.uploader = uploader
+        self.options = uploader.options
+        self.items = []
+        # 本次计划中已计入上传的图片内容哈希，相同内容只上传一次
+        self.media_hashes = set()
+        # 跨文件链接：页面索引（新页面用路径代替页面ID）和 [(计划项, 文件路径, 待解析的链接)]
+        self.link_resolver = LinkResolver()
+        self.link_pages = []
+
+    def plan(self, folder_path, parent_page_id):
+        """生成上传计划，返回 {"items": [...], "summary": {...}}"""
+        self.items = []
+        self.media_hashes = set()
+        self.link_resolver = LinkResolver()
+        self.link_pages = []
+        self.uploader.scan_source_tree(folder_path)
+        self.plan_folder_items(folder_path, parent_page_id)
+        self.plan_links()
+        return {"items": self.items, "summary": self.summarize()}
+
+    def add_item(self, path, item_type, action, blocks=0, requests=None):
+        self.items.append({
+            "path": path,
+            "type": item_type,
+            "action": action,
+            "blocks": blocks,
+            "requests": {name: count for name, count in (requests or {}).items() if count}
+        })
+
+    def add_page(self, item_path, links):
+        """登记最近加入计划的页面，供第二遍解析跨文件链接"""
+        if not self.options["resolve_links"]:
+            return
+        self.link_resolver.index.register(item_path, item_path)
+        if links:
+            self.link_pages.append((self.items[-1], item_path, links))
+
+    def plan_links(self):
+        """按 resolve_page_links 的逻辑统计第二遍改写链接需要的请求，计入对应页面"""
+        for item, item_path, links in self.link_pages:
+            updates, _ = self.link_resolver.plan_page(item_path, links)
+            if not updates:
+                continue
+            requests = Counter(item["requests"])
+            for _, count in required_child_ids(block_path for block_path, _, _ in updates):
+                requests["blocks.children.list"] += count_list_requests(count)
+            requests["blocks.update"] += len(updates)
+            item["requests"] = dict(requests)
+
+    def plan_folder_items(self, folder_path, parent_page_id):
+        """parent_page_id 为 None 表示父页面本次才会创建，其下的所有项都需要新建"""
+        if not self.options["if_add_empty_folder"] and self.uploader.is_empty_folder(folder_path):
+            self.add_item(folder_path, "folder", "skip_empty")
+            return
+
+        for item_path in self.uploader.get_manifest_entry(folder_path).children:
+            self.plan_item(item_path, parent_page_id)
+
+    def plan_item(self, item_path, parent_page_id):
+        entry = self.uploader.get_manifest_entry(item_path)
+        if not entry.is_dir and not item_path.endswith(".md"):
+            return
+
+        item_hash = None
+        page_id = None
+        if parent_page_id is not None:
+            item_hash = self.uploader.generate_item_hash(item_path, parent_page_id)
+            page_id = self.uploader.get_uploaded_page_id(item_hash)
+
+        if entry.is_dir:
+            if page_id is not None:
+                self.add_item(item_path, "folder", "skip")
+                self.plan_folder_items(item_path, page_id)
+            elif not self.options["if_add_empty_folder"] and self.uploader.is_empty_folder(item_path):
+                self.add_item(item_path, "folder", "skip_empty")
+            else:
+                self.add_item(item_path, "folder", "create", requests={"pages.create": 1})
+                self.plan_folder_items(item_path, None)
+            return
+
+        if page_id is not None:
+            if self.options["incremental_sync"] and self.is_file_changed(item_path, item_hash):
+                self.plan_markdown_update(item_path, item_hash)
+            else:
+                self.add_item(item_path, "file", "skip")
+                self.add_page(item_path, self.uploader.get_latest_log(item_hash).get("links"))
+            return
+
+        checkpoint = None
+        if item_hash is not None and self.uploader.get_latest_log(item_hash):
+            checkpoint = PageCheckpoint.from_log(self.uploader.get_latest_log(item_hash), item_hash)
+        if checkpoint is not None:
+            # 上次分块上传中断的页面从检查点继续
+            self.plan_markdown_resume(item_path, checkpoint)
+            return
+
+        if self.options["incremental_sync"] and item_hash is not None:
+            # 上次更新失败的页面会继续更新，重命名的文件只修改标题
+            if self.uploader.get_existing_page_id(item_hash) is not None:
+                self.plan_markdown_update(item_path, item_hash)
+                return
+            renamed = self.uploader.find_renamed_page(item_path, parent_page_id)
+            if renamed:
+                self.add_item(item_path, "file", "rename", requests={"pages.update": 1})
+                self.add_page(item_path, renamed[1].get("links"))
+                return
+        self.plan_markdown_create(item_path)
+
+    def is_file_changed(self, item_path, item_hash):
+        """与上传时的判断相同，但不写日志"""
+        log_entry = self.uploader.get_latest_log(item_hash)
+        entry = self.uploader.get_manifest_entry(item_path)
+        if log_entry.get("size") == entry.size and log_entry.get("mtime") == entry.mtime:
+            return False
+        if "content_hash" not in log_entry:
+            return is_modified_after_upload(log_entry, entry.mtime)
+        _, file_info = read_markdown_file(item_path)
+        return file_info["content_hash"] != log_entry["content_hash"]
+
+    def count_media_requests(self, notion_objects, item_path, requests):
+        """统计上传块中本地图片需要的请求：没有上传过的内容各需创建和发送一次
+
+        已上传过的图片和无法上传的图片原地替换为上传时会使用的块，按块比较时与上次上传的内容一致。
+        """
+        media = self.uploader.media
+        if media is None:
+            return
+        base_dir = os.path.dirname(item_path)
+        for container, index, block in iter_local_images(notion_objects):
+            path = os.path.normpath(os.path.join(base_dir, block["image"]["local_file"]["path"]))
+            try:
+                content_hash, size = media.get_content_hash(path)
+            except OSError:
+                container[index] = fallback_block(block["image"]["local_file"])
+                continue
+            if size > MAX_SINGLE_PART_BYTES:
+                container[index] = fallback_block(block["image"]["local_file"])
+                continue
+            file_upload_id = media.lookup(path)
+            if file_upload_id is not None:
+                container[index] = image_block(file_upload_id, image_caption(block["image"]["local_file"]))
+                continue
+            if content_hash in self.media_hashes:
+                continue
+            self.media_hashes.add(content_hash)
+            if self.options["media_backend"] == "notion":
+                requests["file_uploads.create"] += 1
+                requests["file_uploads.send"] += 1
+
+    def plan_markdown_create(self, item_path):
+        requests = Counter()
+        links = []
+        local_images = self.options["upload_local_images"]
+        local_links = self.options["resolve_links"]
+        if self.uploader.is_large_markdown_file(item_path):
+            def visit(index, block):
+                self.count_media_requests([block], item_path, requests)
+                links.extend(collect_local_links([block], index))
+
+            block_count = count_stream_requests(item_path, requests, local_images, local_links, visit)
+            is_empty = block_count == 0
+        else:
+            is_empty, _, notion_objects = convert_markdown_file(
+                item_path, local_images, local_links, self.uploader.conversion_cache
+            )
+            block_count = len(notion_objects)
+            self.count_media_requests(notion_objects, item_path, requests)
+            links = collect_local_links(notion_objects)
+            count_create_requests(batch_blocks(notion_objects), requests)
+
+        if not self.options["if_add_empty_page"] and is_empty:
+            self.add_item(item_path, "file", "skip_empty")
+            return
+        self.add_item(item_path, "file", "create", block_count, requests)
+        self.add_page(item_path, links)
+
+    def plan_markdown_resume(self, item_path, checkpoint):
+        """按 resume_page_content 的逻辑估算从检查点继续上传的请求数；文件变化后需要清空页面重新发送"""
+        _, file_info, notion_objects = convert_markdown_file(
+            item_path, self.options["upload_local_images"], self.options["resolve_links"],
+            self.uploader.conversion_cache
+        )
+        requests = Counter()
+        self.count_media_requests(notion_objects, item_path, requests)
+        sent = checkpoint.blocks
+        if file_info["content_hash"] != checkpoint.content_hash:
+            # 页面中的块数按检查点估算
+            requests["blocks.children.list"] += max(1, count_list_requests(sent))
+            requests["blocks.delete"] += sent
+            sent = 0
+        elif checkpoint.deferred_ids:
+            batch_objects = notion_objects[sent:sent + len(checkpoint.deferred_ids)]
+            count_deferred_requests(batch_blocks(batch_objects)[0][1][checkpoint.deferred_sent:], requests)
+            sent += len(batch_objects)
+        count_append_requests(notion_objects[sent:], requests)
+        self.add_item(item_path, "file", "resume", len(notion_objects) - sent, +requests)
+        self.add_page(item_path, collect_local_links(notion_objects))
+
+    def plan_markdown_update(self, item_path, item_hash):
+        """按 update_page_content 的逻辑估算更新页面的请求数"""
+        _, _, notion_objects = convert_markdown_file(
+            item_path, self.options["upload_local_images"], self.options["resolve_links"],
+            self.uploader.conversion_cache
+        )
+        links = collect_local_links(notion_objects)
+        old_blocks = None
+        if self.uploader.get_uploaded_page_id(item_hash) is not None:
+            old_blocks = self.uploader.get_latest_log(item_hash).get("blocks")
+
+        requests = Counter()
+        self.count_media_requests(notion_objects, item_path, requests)
+        if not old_blocks or not self.options["block_diff"]:
+            # 整页替换：读取并删除原有的块，再全部追加（原有块数未知时按 1 次读取估算）
+            old_count = len(old_blocks or [])
+            requests["blocks.children.list"] += max(1, count_list_requests(old_count))
+            requests["blocks.delete"] += old_count
+            count_append_requests(notion_objects, requests)
+        else:
+            if any(block[1] is None for block in old_blocks):
+                requests["blocks.children.list"] += count_list_requests(len(old_blocks))
+            for operation in diff_blocks(old_blocks, notion_objects):
+                action = operation[0]
+                if action == "update":
+                    requests["blocks.update"] += 1
+                elif action == "delete":
+                    requests["blocks.delete"] += 1
+                elif action == "insert":
+                    count_append_requests(operation[1], requests)
+        self.add_item(item_path, "file", "update", len(notion_objects), +requests)
+        self.add_page(item_path, links)
+
+    def summarize(self):
+        actions = Counter()
+        requests = Counter()
+        blocks = 0
+        for item in self.items:
+            actions[f'{item["type"]}.{item["action"]}'] += 1
+            requests.update(item["requests"])
+            blocks += item["blocks"]
+
+        total_requests = sum(requests.values())
+        requests_per_second = self.options["requests_per_second"]
+        eta_seconds = total_requests / requests_per_second if requests_per_second > 0 else None
+        return {
+            "actions": dict(actions),
+            "requests": dict(requests),
+            "total_requests": total_requests,
+            "blocks": blocks,
+            "requests_per_second": requests_per_second,
+            "eta_seconds": eta_seconds
+        }
+
+
+def print_plan(plan):
+    """在终端输出上传计划"""
+    styles = {"create": "green", "update": "cyan", "resume": "cyan", "rename": "cyan", "skip": "yellow",
+              "skip_empty": "blue"}
+    labels = {"create": "新建", "update": "更新", "resume": "续传", "rename": "重命名", "skip": "跳过",
+              "skip_empty": "跳过空项"}
+    for item in plan["items"]:
+        item_type = "文件夹" if item["type"] == "folder" else "文件"
+        detail = ""
+        if item["type"] == "file" and item["action"] in ("create", "update", "resume"):
+            detail += f"  {item['blocks']} 块"
+        if item["requests"]:
+            detail += "  " + ", ".join(f"{name} x{count}" for name, count in item["requests"].items())
+        console.print(f"【{labels[item['action']]}】【{item_type}】{item['path']}{detail}",
+                      style=styles[item["action"]], markup=False, highlight=False, soft_wrap=True)
+
+    summary = plan["summary"]
+    console.print("【计划】" + ", ".join(f"{name}: {count}" for name, count in sorted(summary["actions"].items())))
+    console.print(f"【计划】共 {summary['blocks']} 个块，{summary['total_requests']} 次请求："
+                  + ", ".join(f"{name} x{count}" for name, count in sorted(summary["requests"].items())))
+    if summary["eta_seconds"] is None:
+        console.print("【计划】未限速，无法估算耗时")
+    else:
+        eta = timedelta(seconds=round(summary["eta_seconds"]))
+        console.print(f"【计划】按 {summary['requests_per_second']} 次/秒估算，至少需要 {eta}（不含重试）")
+
+
+def save_plan(plan, path):
+    """把上传计划写入 JSON 文件"""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(plan, f, ensure_ascii=False, indent=2)
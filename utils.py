@@ -1,6 +1,49 @@
+import os
 import re
+import hashlib
+from datetime import datetime
 from urllib.parse import urlparse
-import copy
+
+
+# Common abbreviations/aliases mapping
+CODE_LANGUAGE_ALIASES = {
+    'js': 'javascript',
+    'ts': 'typescript',
+    'py': 'python',
+    'rb': 'ruby',
+    'sh': 'shell',
+    'bash': 'shell',
+    'zsh': 'shell',
+    'cpp': 'c++',
+    'csharp': 'c#',
+    'jsx': 'javascript',
+    'tsx': 'typescript',
+    'yml': 'yaml',
+    'htm': 'html',
+    'markdown': 'markdown',
+    'md': 'markdown',
+    'vb': 'visual basic',
+    'stylus': 'css',
+    'sass': 'scss',
+    'golang': 'go',
+    'plaintext': 'plain text',
+    'txt': 'plain text'
+}
+
+# Notion supported languages
+NOTION_CODE_LANGUAGES = frozenset({
+    'abap', 'arduino', 'bash', 'basic', 'c', 'clojure', 'coffeescript',
+    'c++', 'c#', 'css', 'dart', 'diff', 'docker', 'elixir', 'elm',
+    'erlang', 'flow', 'fortran', 'f#', 'gherkin', 'glsl', 'go',
+    'graphql', 'groovy', 'haskell', 'html', 'java', 'javascript',
+    'json', 'julia', 'kotlin', 'latex', 'less', 'lisp', 'livescript',
+    'lua', 'makefile', 'markdown', 'markup', 'matlab', 'mermaid', 'nix',
+    'objective-c', 'ocaml', 'pascal', 'perl', 'php', 'plain text',
+    'powershell', 'prolog', 'protobuf', 'python', 'r', 'reason',
+    'ruby', 'rust', 'sass', 'scala', 'scheme', 'scss', 'shell', 'sql',
+    'swift', 'typescript', 'vb.net', 'verilog', 'vhdl', 'visual basic',
+    'webassembly', 'xml', 'yaml', 'java/c/c++/c#'
+})
 
 
 def match_code_language(lang_name):
@@ -20,81 +63,23 @@ def match_code_language(lang_name):
 
     lang_name = str(lang_name).lower().strip()
 
-    # Common abbreviations/aliases mapping
-    aliases = {
-        'js': 'javascript',
-        'ts': 'typescript',
-        'py': 'python',
-        'rb': 'ruby',
-        'sh': 'shell',
-        'bash': 'shell',
-        'zsh': 'shell',
-        'cpp': 'c++',
-        'csharp': 'c#',
-        'jsx': 'javascript',
-        'tsx': 'typescript',
-        'yml': 'yaml',
-        'htm': 'html',
-        'markdown': 'markdown',
-        'md': 'markdown',
-        'vb': 'visual basic',
-        'stylus': 'css',
-        'sass': 'scss',
-        'golang': 'go',
-        'plaintext': 'plain text',
-        'txt': 'plain text'
-    }
-
-    # Notion supported languages
-    supported_languages = {
-        'abap', 'arduino', 'bash', 'basic', 'c', 'clojure', 'coffeescript',
-        'c++', 'c#', 'css', 'dart', 'diff', 'docker', 'elixir', 'elm',
-        'erlang', 'flow', 'fortran', 'f#', 'gherkin', 'glsl', 'go',
-        'graphql', 'groovy', 'haskell', 'html', 'java', 'javascript',
-        'json', 'julia', 'kotlin', 'latex', 'less', 'lisp', 'livescript',
-        'lua', 'makefile', 'markdown', 'markup', 'matlab', 'mermaid', 'nix',
-        'objective-c', 'ocaml', 'pascal', 'perl', 'php', 'plain text',
-        'powershell', 'prolog', 'protobuf', 'python', 'r', 'reason',
-        'ruby', 'rust', 'sass', 'scala', 'scheme', 'scss', 'shell', 'sql',
-        'swift', 'typescript', 'vb.net', 'verilog', 'vhdl', 'visual basic',
-        'webassembly', 'xml', 'yaml', 'java/c/c++/c#'
-    }
-
     # Try to match alias first
-    normalized_lang = aliases.get(lang_name, lang_name)
+    normalized_lang = CODE_LANGUAGE_ALIASES.get(lang_name, lang_name)
 
     # Return matched language or fallback to plain text
-    return normalized_lang if normalized_lang in supported_languages else 'plain text'
-
-
-def convert_to_nested_list(flat_list):
-    # 存储最终的嵌套结构
-    nested_list = []
-    # 用于追踪当前层级的节点
-    stack = []
+    return normalized_lang if normalized_lang in NOTION_CODE_LANGUAGES else 'plain text'
 
-    for li in flat_list:
-        # 创建一个新的节点
-        node = copy.deepcopy(li)
 
-        node_type = node['type']
-
-        # 如果栈不为空，且当前节点的level大于栈顶的节点的level
-        while stack and stack[-1]['level'] >= node['level']:
-            stack.pop()
-
-        # 如果栈为空，说明当前节点是一个根节点
-        if stack:
-            # 把当前节点添加为栈顶节点的子节点
-            stack[-1][node_type]['children'].append(node)
-        else:
-            # 当前节点是根节点，直接加入到nested_list
-            nested_list.append(node)
-
-        # 把当前节点压入栈中
-        stack.append(node)
-
-    return nested_list
+# 检查 URL 格式
+URL_REGEX = re.compile(
+    r'^(https?:\/\/)?'  # 可选的协议部分（http 或 https）
+    r'(www\.)?'  # 可选的 www 部分
+    r'([a-zA-Z0-9-_]+\.)+'  # 域名部分
+    r'[a-zA-Z]{2,}'  # 顶级域名
+    r'(:\d+)?'  # 可选的端口号
+    r'(\/.*)?$',  # 可选的路径部分
+    re.IGNORECASE
+)
 
 
 def is_valid_url(link_url):
@@ -103,19 +88,64 @@ def is_valid_url(link_url):
     :param link_url: str, 待验证的链接
     :return: bool, 链接是否有效
     """
-    # 检查 URL 格式
-    regex = re.compile(
-        r'^(https?:\/\/)?'  # 可选的协议部分（http 或 https）
-        r'(www\.)?'  # 可选的 www 部分
-        r'([a-zA-Z0-9-_]+\.)+'  # 域名部分
-        r'[a-zA-Z]{2,}'  # 顶级域名
-        r'(:\d+)?'  # 可选的端口号
-        r'(\/.*)?$',  # 可选的路径部分
-        re.IGNORECASE
-    )
-    if not regex.match(link_url):
+    if not URL_REGEX.match(link_url):
         return False
 
     # 尝试解析 URL，验证域名是否有效
     parsed_url = urlparse(link_url if link_url.startswith(('http://', 'https://')) else f'http://{link_url}')
     return bool(parsed_url.netloc) and bool(parsed_url.scheme)
+
+
+def read_markdown_file(file_path):
+    """
+    读取 Markdown 文件
+    :param file_path: str, 文件路径
+    :return: (str, dict), 文件内容和文件信息（内容哈希、大小、修改时间）
+    """
+    stat = os.stat(file_path)
+    with open(file_path, "r", encoding="utf-8") as md_file:
+        md_content = md_file.read()
+    file_info = {
+        "content_hash": hashlib.sha256(md_content.encode("utf-8")).hexdigest(),
+        "size": stat.st_size,
+        "mtime": stat.st_mtime
+    }
+    return md_content, file_info
+
+
+def hash_lines(lines, content_hash):
+    """
+    逐行产出内容，同时更新内容哈希，结果与 read_markdown_file 计算的哈希一致
+    :param lines: 可迭代的文本行（如打开的文件）
+    :param content_hash: hashlib 哈希对象
+    """
+    for line in lines:
+        content_hash.update(line.encode("utf-8"))
+        yield line
+
+
+def hash_markdown_file(file_path):
+    """
+    逐行计算 Markdown 文件的内容哈希，不把整个文件读入内存，结果与 read_markdown_file 一致
+    :param file_path: str, 文件路径
+    :return: str, 内容哈希
+    """
+    content_hash = hashlib.sha256()
+    with open(file_path, "r", encoding="utf-8") as md_file:
+        for _ in hash_lines(md_file, content_hash):
+            pass
+    return content_hash.hexdigest()
+
+
+def is_modified_after_upload(log_entry, mtime):
+    """
+    旧版本的日志没有记录内容哈希、大小和修改时间，按文件修改时间是否晚于上传时间判断文件是否有变化
+    :param log_entry: dict, 上传成功的日志记录
+    :param mtime: float, 文件当前的修改时间
+    :return: bool, 上传后是否修改过（没有上传时间时视为修改过）
+    """
+    timestamp = log_entry.get("timestamp")
+    if not timestamp:
+        return True
+    # 上传时间只精确到秒，同一秒内的修改也视为有变化
+    return mtime > datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S").timestamp()